@@ -1,8 +1,15 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, g, has_request_context, Response
 import os
 import sys
 import json
 import re
+import threading
+import atexit
+import time
+import functools
+import hashlib
+from contextlib import contextmanager, nullcontext
+from html import unescape as html_unescape
 
 def custom_json_dumps(data):
     """自定义JSON序列化，使 stations 列表不换行"""
@@ -36,6 +43,19 @@ def save_json_file(file_path, data):
 
 # 将tools目录加入路径以便导入RouteTools
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tools'))
+from network_index import NetworkIndex, canonical_line_code, line_code_from_key, line_key_from_code, service_route_name
+from data_watcher import DataWatcher
+from json_file_cache import CachedJsonFile
+from city_registry import CityNetwork, CityRegistry, CityPrefixMiddleware
+from state_persister import StatePersister
+from state_broadcaster import StateBroadcaster, format_sse
+from schedule_engine import ScheduleEngine
+from display_names import DisplayNameTable
+from request_timing import RequestTimer, TimingRecorder
+from metrics import MetricsRegistry
+from shared_state import SharedStateStore, SharedStatePoller
+from page_cache import PageCache
+from template_cache import TemplateBytecodeCache, precompile_templates, format_precompile_report
 try:
     from route_tools import RouteTools
     route_tools_available = True
@@ -49,45 +69,73 @@ app = Flask(__name__)
 # 配置项
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 
-# 加载应用配置
-def load_global_config():
-    """加载全局根目录配置文件"""
-    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'global_config.json')
-    default_config = {
+# 支持 /city/<城市>/... 前缀选择城市
+app.wsgi_app = CityPrefixMiddleware(app.wsgi_app)
+
+# 全局配置缓存：每次渲染只 stat 一次文件，内容变化后才重新读取
+_GLOBAL_CONFIG = CachedJsonFile(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'global_config.json'),
+    default={
         "watermark_enabled": False,
         "watermark_text": "水印文字",
         "hint_enabled": False,
         "hint_text": "提示文字"
     }
-    try:
-        if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return default_config
+)
+
+# 加载应用配置
+def load_global_config():
+    """加载全局根目录配置文件（带缓存，返回值不应修改）"""
+    return _GLOBAL_CONFIG.load()
+
+def get_global_config_stats():
+    """全局配置缓存统计：实际磁盘读取次数与节省的读取次数"""
+    return _GLOBAL_CONFIG.stats()
 
 @app.context_processor
 def inject_global_config():
     """将全局配置注入所有模板"""
     return dict(global_config=load_global_config())
 
+CITY_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'city_config.json')
+DEFAULT_CITY = 'chengdu'
+_CITY_CONFIG = CachedJsonFile(CITY_CONFIG_FILE, default={})
+
+# 默认城市只解析一次；city_config.json 变化或调用 switch_city 后更新，并递增城市版本
+_city_version = 0
+
+def _read_city_config():
+    data = _CITY_CONFIG.load()
+    city = data.get('current_city', DEFAULT_CITY) if isinstance(data, dict) else DEFAULT_CITY
+    return city or DEFAULT_CITY
+
 def get_current_city():
-    """获取当前配置的城市"""
-    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'city_config.json')
-    default_city = 'chengdu'
-    try:
-        if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('current_city', default_city)
-    except Exception:
-        pass
-    return default_city
+    """获取当前请求所用的城市（请求之外为默认城市）"""
+    return current_network().city
+
+def get_default_city():
+    """获取配置的默认城市"""
+    return city_registry.default_city
+
+def get_city_version():
+    """当前城市版本号，每次切换默认城市后递增"""
+    return _city_version
+
+def _city_data_dir(city):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', city)
 
 def get_data_dir():
     """获取当前城市的数据目录"""
-    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', get_current_city())
+    return current_network().data_dir
+
+def list_cities():
+    """data 目录下可用的城市（含 route.json 的子目录）"""
+    base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    try:
+        names = os.listdir(base_dir)
+    except OSError:
+        return []
+    return sorted(n for n in names if os.path.isfile(os.path.join(base_dir, n, 'route.json')))
 
 def _pick_initial_next_station_for_switch(line_name, route_name, direction, line_info):
     try:
@@ -103,17 +151,15 @@ def _pick_initial_next_station_for_switch(line_name, route_name, direction, line
         except Exception:
             dir_val = 0
 
-        route_data = _get_route_data()
-        line_cfg = route_data.get(line_name, {}) if isinstance(route_data, dict) else {}
-        is_loop = (line_cfg.get('type') == 'loop') if isinstance(line_cfg, dict) else False
+        index = _get_network_index()
+        line_cfg = index.line_config(line_name)
+        is_loop = line_cfg.get('type') == 'loop'
 
         terminal = ''
         if is_loop:
-            for svc in (line_cfg.get('services', []) or []):
-                name = svc.get('type') or svc.get('service_name')
-                if name == route_name:
-                    terminal = (svc.get('terminal_station') or '').strip()
-                    break
+            svc = index.service(line_name, route_name)
+            if svc is not None:
+                terminal = (svc.get('terminal_station') or '').strip()
 
         if not is_loop:
             return stations[-1] if dir_val == 1 else stations[0]
@@ -126,33 +172,18 @@ def _pick_initial_next_station_for_switch(line_name, route_name, direction, line
                     term_idx = stations_dir.index(terminal)
                     return stations_dir[(term_idx + 1) % n]
         else:
-            station_data = _get_station_data()
-            code = None
-            if tools is not None:
-                try:
-                    code = tools._line_code_from_key(line_name)
-                except Exception:
-                    code = None
-            if code is None:
-                code = _line_code_from_key(line_name)
-            if code:
+            if index.line_code(line_name):
                 for name in stations:
-                    codes = station_data.get(name) if isinstance(station_data, dict) else None
-                    if not isinstance(codes, list):
-                        continue
-                    for c in codes:
-                        if not (isinstance(c, list) and len(c) >= 2):
-                            continue
-                        if str(c[0]).strip() == str(code).strip() and str(c[1]).strip() == '01':
-                            return name
+                    if str(index.station_code_on_line(name, line_name) or '').strip() == '01':
+                        return name
 
         return stations[0]
     except Exception:
         return ''
 
-def load_app_config():
+def load_app_config(data_dir=None):
     """加载应用配置文件"""
-    config_path = os.path.join(get_data_dir(), 'config.json')
+    config_path = os.path.join(data_dir or get_data_dir(), 'config.json')
     default_config = {
         'app_name': 'PIS系统',
         'copyright_year': '2025',
@@ -176,31 +207,164 @@ def load_app_config():
         print(f"警告: 加载配置文件失败: {e}，使用默认配置")
         return default_config
 
-# 全局应用配置
-app_config = load_app_config()
-
-# 初始化RouteTools
-tools = None
-try:
-    if route_tools_available:
-        data_dir = get_data_dir()
-        tools = RouteTools(
+def _create_route_tools(data_dir):
+    """为指定数据目录创建RouteTools，不可用或初始化失败时返回None"""
+    if not route_tools_available:
+        return None
+    try:
+        route_tools = RouteTools(
             route_file_path=os.path.join(data_dir, 'route.json'),
             station_file_path=os.path.join(data_dir, 'station.json'),
             trans_file_path=os.path.join(data_dir, 'trans_name.json'),
             color_file_path=os.path.join(data_dir, 'color.json')
         )
         print(f"成功初始化RouteTools (数据目录: {data_dir})")
-except Exception as e:
-    print(f"初始化RouteTools失败: {e}")
+        return route_tools
+    except Exception as e:
+        print(f"初始化RouteTools失败: {e}")
+        return None
 
-# 模拟当前状态数据
+# 模拟当前状态数据：默认城市使用根目录的 current_state.json，其他城市使用 states/<城市>.json
 STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'current_state.json')
+STATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'states')
+
+def _state_flush_interval():
+    adv = load_global_config().get("advance_settings", {}) or {}
+    interval = adv.get("state_flush_interval", 0.5) if adv.get("enable_advance_settings", False) else 0.5
+    try:
+        return max(float(interval), 0.0)
+    except (TypeError, ValueError):
+        return 0.5
+
+def _stat_state_file(state_file):
+    try:
+        st = os.stat(state_file)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _on_state_file_written(state_file, session):
+    # 记录自身写入后的文件状态，避免被当作外部修改重新加载
+    if session is not None:
+        session.stat = _stat_state_file(state_file)
+
+# 状态修改只更新内存，由后台线程合并后原子写回；退出时写出剩余修改
+_state_persister = StatePersister(interval=_state_flush_interval(), on_write=_on_state_file_written)
+atexit.register(_state_persister.stop)
+
+def _request_timing_settings():
+    """(是否启用分阶段计时, 最近请求缓冲条数)"""
+    adv = load_global_config().get("advance_settings", {}) or {}
+    if not adv.get("enable_advance_settings", False) or not adv.get("request_timing", False):
+        return False, 0
+    try:
+        return True, max(int(adv.get("request_timing_buffer", 200)), 1)
+    except (TypeError, ValueError):
+        return True, 200
+
+# 请求分阶段计时：启用后每个响应带 Server-Timing 头，最近的请求记录在 /api/debug/timings；
+# 未启用时为 None，计时点只做一次判断
+_timing_enabled, _timing_buffer = _request_timing_settings()
+_request_timing = TimingRecorder(_timing_buffer) if _timing_enabled else None
+_NO_PHASE = nullcontext()
+
+def _phase(name):
+    """当前请求的计时阶段；未启用计时或不在请求中时为空操作"""
+    if _request_timing is None or not has_request_context():
+        return _NO_PHASE
+    timer = g.get('request_timer')
+    return timer.phase(name) if timer is not None else _NO_PHASE
+
+def _timed(name):
+    """装饰器：函数调用计入当前请求的 name 阶段"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _request_timing is None:
+                return func(*args, **kwargs)
+            with _phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class _TimedTools:
+    """RouteTools 计时代理：方法调用计入 tools 阶段"""
+
+    def __init__(self, tools):
+        self._tools = tools
+
+    def __getattr__(self, name):
+        attr = getattr(self._tools, name)
+        if not callable(attr):
+            return attr
+        def timed(*args, **kwargs):
+            with _phase('tools'):
+                return attr(*args, **kwargs)
+        return timed
+
+# 运行指标（/metrics，Prometheus 文本格式）：请求路径上只更新计数与直方图，其余统计在抓取时读取
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.counter('pis_http_requests_total', '按路由、方法与状态码统计的请求数', ('route', 'method', 'status'))
+HTTP_LATENCY = metrics.histogram('pis_http_request_duration_seconds', '按路由与方法统计的请求耗时（秒）', ('route', 'method'))
+KEYPRESS_LATENCY = metrics.histogram('pis_keypress_duration_seconds', '按城市与列车统计的状态操作（按键）耗时（秒）', ('city', 'train'))
+STATE_SAVES = metrics.counter('pis_state_saves_total', '状态修改次数（写回前合并）', ('city',))
+DATA_RELOADS = metrics.counter('pis_data_reloads_total', '数据缓存按文件重载次数', ('city', 'file'))
+ROUTE_TOOLS_RELOADS = metrics.counter('pis_route_tools_reloads_total', 'RouteTools 重载次数', ('city', 'result'))
+CACHE_LOOKUPS = metrics.counter('pis_cache_lookups_total', '派生数据缓存查询次数（miss 为重新构建）', ('cache', 'result'))
+
+# 状态变更推送（/api/state/stream），按 (城市, 列车编号) 分发增量
+_state_broadcaster = StateBroadcaster()
+STATE_STREAM_KEEPALIVE = 15
+SHARED_STATE_POLL = 0.2
+
+# 多进程共享状态（create_app(shared_state=True) 时启用），为 None 时状态只保存在本进程内存
+_shared_state = None
+# 多进程模式下每列车一个线程轮询共享记录，把其他工作进程的修改发布给本进程的订阅者
+_shared_state_poller = SharedStatePoller(SHARED_STATE_POLL, lambda key: _state_broadcaster.subscriber_count(key) > 0)
+
+def _publish_state(network, session):
+    """向订阅该列车的显示屏推送状态增量；事件带上发起修改的客户端编号，便于发起方忽略自身的修改"""
+    origin = request.headers.get('X-PIS-Client') if has_request_context() else None
+    _state_broadcaster.publish((network.city, session.session_id), session.version, session.state, origin=origin)
+
+# 列车（会话）编号：通过 ?train=<编号> 或请求头 X-PIS-Train 指定，未指定时使用默认会话
+TRAIN_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def current_session_id():
+    """当前请求的列车编号，未指定时为 None"""
+    override = getattr(_network_override, 'network', None)
+    if override is not None:
+        return getattr(_network_override, 'session_id', None)
+    if has_request_context():
+        return g.get('train_id')
+    return None
 
-def load_current_state():
-    """从JSON文件加载当前状态"""
-    default_state = {
-        'line_name': '',
+def _current_session(network=None):
+    network = network or current_network()
+    return network.session(current_session_id())
+
+def _state_file(network=None, session_id=None):
+    """
+    状态文件路径：默认城市的默认会话为根目录 current_state.json，
+    其他城市的默认会话为 states/<城市>.json，列车会话为 states/<城市>/<列车编号>.json
+    """
+    network = network or current_network()
+    if session_id is not None:
+        return os.path.join(STATES_DIR, network.city, f"{session_id}.json")
+    if network.city == city_registry.default_city:
+        return STATE_FILE
+    return os.path.join(STATES_DIR, f"{network.city}.json")
+
+def load_current_state(network=None, session=None):
+    """从JSON文件加载列车会话的状态，并作为其内存状态（递增状态版本）"""
+    network = network or current_network()
+    session = session or _current_session(network)
+    state_file = _state_file(network, session.session_id)
+    # 尚未写回的修改比磁盘上的文件新，直接使用内存状态
+    if session.state is not None and _state_persister.is_pending(state_file):
+        return session.state
+    stat = _stat_state_file(state_file)
+    default_state = {        'line_name': '',
         'route_name': 'route1',
         'next_station': '',
         'direction': 0,
@@ -208,38 +372,195 @@ def load_current_state():
         'current_carriage': 1,
         'schedule_index': 0
     }
+    state = default_state
     try:
-        if os.path.exists(STATE_FILE):
-            with open(STATE_FILE, 'r', encoding='utf-8') as f:
+        if os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 if isinstance(data, dict):
                     merged = default_state.copy()
                     merged.update(data)
-                    return merged
+                    state = merged
     except Exception as e:
         print(f"加载状态文件失败: {e}")
-    return default_state
-
-def save_current_state(state):
-    """将当前状态保存到JSON文件"""
-    try:
-        with open(STATE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(state, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"保存状态文件失败: {e}")
+    if session.state is not None and state == session.state:
+        # 内容与内存状态相同（如写回器刚写出、尚未记录文件状态时被检测到），不递增版本
+        session.stat = stat
+        return session.state
+    session.state = state
+    session.stat = stat
+    session.bump_version()
+    _publish_state(network, session)
+    return state
+
+def save_current_state(state, network=None, session=None):
+    """登记状态写回JSON文件（合并后异步原子写入，调用立即返回），并递增状态版本"""
+    network = network or current_network()
+    session = session or _current_session(network)
+    if _shared_state is not None:
+        with _shared_state.record(network.city, session.session_id).lock() as record:
+            version = record.write(state)
+        if state is session.state:
+            session.version = version
+    else:
+        session.bump_version()
+    STATE_SAVES.inc(network.city)
+    _state_persister.save(_state_file(network, session.session_id), state, session)
+    if state is session.state:
+        _publish_state(network, session)
+
+@_timed('state')
+def _current_state(network=None, session=None):
+    """
+    当前请求所属城市与列车的内存状态（以内存为准）
+
+    只 stat 状态文件：mtime 或大小变化（被外部修改）时才重新读取解析。
+    """
+    network = network or current_network()
+    session = session or _current_session(network)
+    if _shared_state is not None:
+        return _current_shared_state(network, session)
+    state_file = _state_file(network, session.session_id)
+    if session.state is None:
+        with session.lock:
+            if session.state is None:
+                _init_session_state(network, session)
+    elif session.stat != _stat_state_file(state_file) and not _state_persister.is_pending(state_file):
+        load_current_state(network, session)
+    return session.state
+
+def _init_session_state(network, session):
+    state_file = _state_file(network, session.session_id)
+    has_state_file = os.path.exists(state_file)
+    load_current_state(network, session)
+    # 首次使用的列车会话或非默认城市没有状态文件，从可用线路交路的起始站开始
+    if not has_state_file and state_file != STATE_FILE:
+        with _use_network(network, session.session_id):
+            _reset_state_for_network()
+
+def _current_shared_state(network, session):
+    """
+    多进程模式：以共享内存记录为准
+
+    记录版本与本进程已解析的版本相同时直接返回内存状态，只读取记录头部；
+    其他工作进程修改后才重新解析。记录尚未初始化时由第一个访问的进程从状态文件初始化。
+    状态文件仍由写回器保存，但不再检测外部修改。
+    """
+    record = _shared_state.record(network.city, session.session_id)
+    version = record.version()
+    if version and version == session.version and session.state is not None:
+        return session.state
+    if not version:
+        # 加锁顺序固定为先记录锁后会话锁，与状态写请求在 before_request 中的顺序一致
+        with record.lock(), session.lock:
+            if not record.version():
+                if session.state is None:
+                    _init_session_state(network, session)
+                if not record.version():
+                    record.write(session.state)
+    with session.lock:
+        version, state = record.read()
+        if version != session.version or session.state is None:
+            session.state = state
+            session.version = version
+            _publish_state(network, session)
+    return session.state
+
+def get_state_version(network=None, session=None):
+    """当前列车会话的状态版本号，每次修改或从文件重新加载后递增"""
+    network = network or current_network()
+    session = session or _current_session(network)
+    _current_state(network, session)
+    return session.version
+
+
+# 条件请求：ETag 由城市、列车、状态版本与数据文件指纹得出，If-None-Match 命中时不构建响应体。
+# 单进程模式下状态版本号在每次启动后从头计数，以本进程的随机前缀区分；共享状态时使用记录的纪元
+_STATE_VERSION_NAMESPACE = os.urandom(4).hex()
+
+def _state_etag(network=None, session=None):
+    network = network or current_network()
+    session = session or _current_session(network)
+    version = get_state_version(network, session)
+    if _shared_state is not None:
+        namespace = f"{_shared_state.record(network.city, session.session_id).epoch:x}"
+    else:
+        namespace = _STATE_VERSION_NAMESPACE
+    key = f"{network.city}|{session.session_id or ''}|{namespace}.{version}|{network.data_tag}"
+    return hashlib.blake2s(key.encode('utf-8'), digest_size=10).hexdigest()
 
-current_state = load_current_state()
+def _not_modified(etag):
+    """If-None-Match 与 etag 相同时返回 304 响应，否则返回 None"""
+    if etag not in request.if_none_match:
+        return None
+    return _with_etag(Response(status=304), etag)
 
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    # 浏览器每次使用缓存前都向服务器确认（带 If-None-Match），未变化时只返回 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/state', methods=['GET'])
 def get_state():
-    """获取当前状态"""
-    return jsonify(current_state)
+    """获取当前状态（支持 If-None-Match）"""
+    etag = _state_etag()
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    current_state = _current_state()
+    return _with_etag(jsonify(current_state), etag)
+
+@app.route('/api/state/stream', methods=['GET'])
+def state_stream():
+    """
+    SSE：推送当前列车的状态变更
+
+    连接后先发送完整状态（snapshot 事件），之后每次修改发送 state 事件：
+    {"version": 版本, "delta": {变化的字段}}。空闲时阻塞等待，每 15 秒发送一次保活注释。
+    """
+    network = current_network()
+    session = _current_session(network)
+    state = _current_state(network, session)
+    key = (network.city, session.session_id)
+    subscription = _state_broadcaster.subscribe(key, state, session.version)
+
+    # 多进程模式下其他工作进程的修改不会推送到本进程的队列，由该列车的轮询线程检查共享记录并发布，
+    # 连接线程只阻塞等待自己的队列
+    if _shared_state is not None:
+        _shared_state_poller.watch(key, lambda: _current_state(network, session))
+
+    def generate():
+        try:
+            yield format_sse({'version': session.version, 'state': dict(session.state)}, event='snapshot', event_id=session.version)
+            last_sent = time.monotonic()
+            while True:
+                event = subscription.get(timeout=STATE_STREAM_KEEPALIVE)
+                if subscription.resync:
+                    # 消费过慢丢失了增量，重新发送完整状态
+                    subscription.resync = False
+                    subscription.drain()
+                    yield format_sse({'version': session.version, 'state': dict(session.state)}, event='snapshot', event_id=session.version)
+                elif event is not None:
+                    yield format_sse(event, event='state', event_id=event['version'])
+                    last_sent = time.monotonic()
+                else:
+                    # 空闲时检查一次状态是否被外部修改（只做 stat 或读取共享记录头部），有变化会推送到本队列
+                    _current_state(network, session)
+                    if time.monotonic() - last_sent >= STATE_STREAM_KEEPALIVE:
+                        yield ': keepalive\n\n'
+                        last_sent = time.monotonic()
+        finally:
+            _state_broadcaster.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/state/next', methods=['POST'])
 def next_station():
     """切换到下一站"""
-    global current_state
+    tools = _tools()
+    current_state = _current_state()
     line_name = current_state['line_name']
     route_name = current_state['route_name']
     direction = current_state.get('direction', 0)
@@ -271,7 +592,8 @@ def next_station():
 @app.route('/api/state/prev', methods=['POST'])
 def prev_station():
     """切换到上一站"""
-    global current_state
+    tools = _tools()
+    current_state = _current_state()
     line_name = current_state['line_name']
     route_name = current_state['route_name']
     direction = current_state.get('direction', 0)
@@ -303,7 +625,8 @@ def prev_station():
 @app.route('/api/state/reverse', methods=['POST'])
 def reverse_direction():
     """切换运行方向 (R键)"""
-    global current_state
+    tools = _tools()
+    current_state = _current_state()
     direction = 1 if current_state.get('direction', 0) == 0 else 0
     current_state['direction'] = direction
     
@@ -323,287 +646,168 @@ def reverse_direction():
     save_current_state(current_state)
     return jsonify(current_state)
 
-@app.route('/api/state/route/next', methods=['POST'])
-def next_route():
-    """切换到下一个路由 (下方向键)"""
-    global current_state
+def _line_info_for_switch(tools, line_name, route_name):
+    line_info = None
+    if tools is not None:
+        line_info = tools.get_line_map_info(line_name, route_name)
+    if line_info is None:
+        line_info = fallback_get_line_map_info(line_name, route_name)
+    return line_info
+
+def _switch_route(delta):
+    """在当前线路未禁用的交路间切换，并回到新交路的起始站"""
+    tools = _tools()
+    current_state = _current_state()
     line_name = current_state['line_name']
     direction = current_state.get('direction', 0)
-    
-    # 获取该线路下所有的 route 列表 (过滤掉 disabled=true 的)
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
     try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-            services = route_data.get(line_name, {}).get('services', [])
-            # 过滤掉 disabled=true 的服务
-            active_services = [s for s in services if not s.get('disabled', False)]
-            route_names = [s.get('type') or s.get('service_name') for s in active_services]
-            
-            if not route_names:
-                return jsonify({'status': 'error', 'message': '无可用路由'}), 404
-                
-            current_route = current_state['route_name']
-            try:
-                curr_idx = route_names.index(current_route)
-            except ValueError:
-                # 如果当前路由被禁用了，则跳到第一个可用的
-                curr_idx = -1
-                
-            next_idx = (curr_idx + 1) % len(route_names)
-            new_route = route_names[next_idx]
-            current_state['route_name'] = new_route
-        
+        route_names = list(_get_network_index().active_routes(line_name))
+        if not route_names:
+            return jsonify({'status': 'error', 'message': '无可用路由'}), 404
+
+        current_route = current_state['route_name']
+        try:
+            curr_idx = route_names.index(current_route)
+        except ValueError:
+            # 如果当前路由被禁用了，则跳到第一个（上一个时为最后一个）可用的
+            curr_idx = -1 if delta > 0 else len(route_names)
+        new_route = route_names[(curr_idx + delta) % len(route_names)]
+        current_state['route_name'] = new_route
+
         # 切换路由后，重置到该交路的第一站
-        line_info = None
-        if tools is not None:
-            line_info = tools.get_line_map_info(line_name, new_route)
-        if line_info is None:
-            line_info = fallback_get_line_map_info(line_name, new_route)
-            
+        line_info = _line_info_for_switch(tools, line_name, new_route)
         if line_info:
             current_state['next_station'] = _pick_initial_next_station_for_switch(line_name, new_route, direction, line_info)
-                
+
         save_current_state(current_state)
         return jsonify(current_state)
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/api/state/line/next', methods=['POST'])
-def next_line():
-    """切换到下一条线路 (l 键)"""
-    global current_state
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
+def _switch_line(delta):
+    """切换线路，默认选择新线路的第一个未禁用交路及其起始站"""
+    tools = _tools()
+    current_state = _current_state()
     try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-            line_names = list(route_data.keys())
-            
-            if not line_names:
-                return jsonify({'status': 'error', 'message': '无可用线路'}), 404
-                
-            current_line = current_state['line_name']
-            try:
-                curr_idx = line_names.index(current_line)
-            except ValueError:
-                curr_idx = 0
-                
-            next_idx = (curr_idx + 1) % len(line_names)
-            new_line = line_names[next_idx]
-            
-            # 切换线路时，默认选择该线路的第一个路由和第一站 (过滤掉 disabled=true 的)
-            new_services = route_data.get(new_line, {}).get('services', [])
-            active_new_services = [s for s in new_services if not s.get('disabled', False)]
-            if not active_new_services:
-                # 如果没有启用的服务，则回退到第一个（虽然这不应该发生）
-                active_new_services = new_services[:1]
-                
-            new_route = active_new_services[0].get('type') or active_new_services[0].get('service_name') if active_new_services else 'route1'
-            
-            # 获取新线路的车站列表
-            line_info = None
-            if tools is not None:
-                line_info = tools.get_line_map_info(new_line, new_route)
-            if line_info is None:
-                line_info = fallback_get_line_map_info(new_line, new_route)
-            
-            direction = current_state.get('direction', 0)
-            if line_info:
-                new_station = _pick_initial_next_station_for_switch(new_line, new_route, direction, line_info)
-            else:
-                new_station = ''
-            
-            current_state['line_name'] = new_line
-            current_state['route_name'] = new_route
-            current_state['next_station'] = new_station
-            save_current_state(current_state)
-            return jsonify(current_state)
+        index = _get_network_index()
+        line_names = index.lines()
+        if not line_names:
+            return jsonify({'status': 'error', 'message': '无可用线路'}), 404
+
+        try:
+            curr_idx = line_names.index(current_state['line_name'])
+        except ValueError:
+            curr_idx = 0
+        new_line = line_names[(curr_idx + delta) % len(line_names)]
+
+        # 如果没有启用的服务，则回退到第一个（虽然这不应该发生）
+        candidates = index.active_routes(new_line) or index.routes(new_line)[:1]
+        new_route = candidates[0] if candidates else 'route1'
+
+        line_info = _line_info_for_switch(tools, new_line, new_route)
+        direction = current_state.get('direction', 0)
+        if line_info:
+            new_station = _pick_initial_next_station_for_switch(new_line, new_route, direction, line_info)
+        else:
+            new_station = ''
+
+        current_state['line_name'] = new_line
+        current_state['route_name'] = new_route
+        current_state['next_station'] = new_station
+        save_current_state(current_state)
+        return jsonify(current_state)
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/state/route/next', methods=['POST'])
+def next_route():
+    """切换到下一个路由 (下方向键)"""
+    return _switch_route(1)
+
+@app.route('/api/state/line/next', methods=['POST'])
+def next_line():
+    """切换到下一条线路 (l 键)"""
+    return _switch_line(1)
+
 @app.route('/api/state/line/prev', methods=['POST'])
 def prev_line():
     """切换到上一条线路 (k 键)"""
-    global current_state
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
-    try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-            line_names = list(route_data.keys())
-            
-            if not line_names:
-                return jsonify({'status': 'error', 'message': '无可用线路'}), 404
-                
-            current_line = current_state['line_name']
-            try:
-                curr_idx = line_names.index(current_line)
-            except ValueError:
-                curr_idx = 0
-                
-            prev_idx = (curr_idx - 1 + len(line_names)) % len(line_names)
-            new_line = line_names[prev_idx]
-            
-            # 切换线路时，默认选择该线路的第一个路由和第一站 (过滤掉 disabled=true 的)
-            new_services = route_data.get(new_line, {}).get('services', [])
-            active_new_services = [s for s in new_services if not s.get('disabled', False)]
-            if not active_new_services:
-                active_new_services = new_services[:1]
-                
-            new_route = active_new_services[0].get('type') or active_new_services[0].get('service_name') if active_new_services else 'route1'
-            
-            # 获取新线路的车站列表
-            line_info = None
-            if tools is not None:
-                line_info = tools.get_line_map_info(new_line, new_route)
-            if line_info is None:
-                line_info = fallback_get_line_map_info(new_line, new_route)
-            
-            direction = current_state.get('direction', 0)
-            if line_info:
-                new_station = _pick_initial_next_station_for_switch(new_line, new_route, direction, line_info)
-            else:
-                new_station = ''
-            
-            current_state['line_name'] = new_line
-            current_state['route_name'] = new_route
-            current_state['next_station'] = new_station
-            save_current_state(current_state)
-            return jsonify(current_state)
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return _switch_line(-1)
+
+def _save_route_setting(line_name, field, value, route_name=None):
+    """
+    把线路的显示设置写回 route.json 并立即重载；线路不存在时返回 False
+
+    是否存在该线路、当前交路是否有 config 覆盖按已加载的线路索引判断，与页面渲染读取的数据一致；
+    有覆盖时保存到该交路的 config 中。写回时读取磁盘上的原始文件，只修改该字段（不写入加载时补全的默认值）。
+    """
+    index = _get_network_index()
+    if not index.has_line(line_name):
+        return False
+    service = index.service(line_name, route_name) if route_name else None
+    to_service = isinstance((service or {}).get('config'), dict)
+
+    route_file = _data_path('route.json')
+    with open(route_file, 'r', encoding='utf-8') as f:
+        route_data = json.load(f)
+    line_cfg = route_data.get(line_name)
+    if not isinstance(line_cfg, dict):
+        line_cfg = route_data[line_name] = {}
+    raw_service = NetworkIndex(route_data, {}).service(line_name, route_name) if to_service else None
+    if raw_service is not None and isinstance(raw_service.get('config'), dict):
+        raw_service['config'][field] = value
+    else:
+        line_cfg[field] = value
+
+    save_json_file(route_file, route_data)
+    # 立即重载缓存，确保页面刷新后读取到最新数据
+    _reload_data_files(['route.json'])
+    return True
 
 @app.route('/api/state/layout', methods=['POST'])
 def update_layout():
     """更新当前线路的布局模式 (i, o, p 键)"""
-    global current_state
+    current_state = _current_state()
     mode = request.json.get('mode') # 'one_line', 'two_line', 'auto'
     if mode not in ['one_line', 'two_line', 'auto', 'sine']:
         return jsonify({'status': 'error', 'message': '无效的布局模式'}), 400
-        
+
     line_name = current_state['line_name']
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
-    
     try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-            
-        if line_name in route_data:
-            # 环线特殊处理：如果是环线且尝试设置为单行，则强制设为双行
-            is_loop = route_data[line_name].get('type') == 'loop'
-            if is_loop and mode == 'one_line':
-                mode = 'two_line'
-
-            # 检查当前交路服务是否有配置覆盖，若有则保存到当前交路的 config 字典中，否则保存到线路
-            services = route_data[line_name].get('services', [])
-            current_route = current_state.get('route_name')
-            saved_to_service = False
-            for svc in services:
-                if _get_service_route_name(svc) == current_route:
-                    if 'config' in svc and isinstance(svc['config'], dict):
-                        svc['config']['layout'] = mode
-                        saved_to_service = True
-                        break
-
-            if not saved_to_service:
-                route_data[line_name]['layout'] = mode
-
-            save_json_file(route_file, route_data)
-                
-            # 立即失效缓存，确保页面刷新后读取到最新数据
-            if 'route.json' in _DATA_CACHE:
-                del _DATA_CACHE['route.json']
-            
-            # 如果 RouteTools 实例存在，也需要重载其数据
-            if tools is not None:
-                try:
-                    tools._load_data()
-                except Exception as e:
-                    print(f"重载 RouteTools 数据失败: {e}")
-                
-            return jsonify({'status': 'success', 'layout': mode})
-        else:
+        # 环线特殊处理：如果是环线且尝试设置为单行，则强制设为双行
+        is_loop = _get_network_index().line_config(line_name).get('type') == 'loop'
+        if is_loop and mode == 'one_line':
+            mode = 'two_line'
+        if not _save_route_setting(line_name, 'layout', mode, current_state.get('route_name')):
             return jsonify({'status': 'error', 'message': '未找到线路'}), 404
+        return jsonify({'status': 'success', 'layout': mode})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/state/detail_style', methods=['POST'])
 def update_detail_style():
-    global current_state
+    current_state = _current_state()
     style = (request.json or {}).get('style')
     if style not in ['default', 'column']:
         return jsonify({'status': 'error', 'message': '无效的详情样式'}), 400
 
-    line_name = current_state['line_name']
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
-
     try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-
-        if line_name not in route_data:
+        if not _save_route_setting(current_state['line_name'], 'detail_style', style):
             return jsonify({'status': 'error', 'message': '未找到线路'}), 404
-
-        line_cfg = route_data.get(line_name, {})
-        if not isinstance(line_cfg, dict):
-            line_cfg = {}
-        line_cfg['detail_style'] = style
-        route_data[line_name] = line_cfg
-
-        save_json_file(route_file, route_data)
-
-        if 'route.json' in _DATA_CACHE:
-            del _DATA_CACHE['route.json']
-
-        if tools is not None:
-            try:
-                tools._load_data()
-            except Exception as e:
-                print(f"重载 RouteTools 数据失败: {e}")
-
         return jsonify({'status': 'success', 'detail_style': style})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/state/run_style', methods=['POST'])
 def update_run_style():
-    global current_state
+    current_state = _current_state()
     style = (request.json or {}).get('style')
     if style not in ['default', 'detail']:
         return jsonify({'status': 'error', 'message': '无效的首页样式'}), 400
 
-    line_name = current_state['line_name']
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
-
     try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-
-        if line_name not in route_data:
+        if not _save_route_setting(current_state['line_name'], 'run_style', style):
             return jsonify({'status': 'error', 'message': '未找到线路'}), 404
-
-        line_cfg = route_data.get(line_name, {})
-        if not isinstance(line_cfg, dict):
-            line_cfg = {}
-        line_cfg['run_style'] = style
-        route_data[line_name] = line_cfg
-
-        save_json_file(route_file, route_data)
-
-        if 'route.json' in _DATA_CACHE:
-            del _DATA_CACHE['route.json']
-
-        if tools is not None:
-            try:
-                tools._load_data()
-            except Exception as e:
-                print(f"重载 RouteTools 数据失败: {e}")
-
         return jsonify({'status': 'success', 'run_style': style})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -611,55 +815,13 @@ def update_run_style():
 @app.route('/api/state/route/prev', methods=['POST'])
 def prev_route():
     """切换到上一个路由 (上方向键)"""
-    global current_state
-    line_name = current_state['line_name']
-    direction = current_state.get('direction', 0)
-    
-    # 获取该线路下所有的 route 列表 (过滤掉 disabled=true 的)
-    data_dir = get_data_dir()
-    route_file = os.path.join(data_dir, 'route.json')
-    try:
-        with open(route_file, 'r', encoding='utf-8') as f:
-            route_data = json.load(f)
-            services = route_data.get(line_name, {}).get('services', [])
-            # 过滤掉 disabled=true 的服务
-            active_services = [s for s in services if not s.get('disabled', False)]
-            route_names = [s.get('type') or s.get('service_name') for s in active_services]
-            
-            if not route_names:
-                return jsonify({'status': 'error', 'message': '无可用路由'}), 404
-                
-            current_route = current_state['route_name']
-            try:
-                curr_idx = route_names.index(current_route)
-            except ValueError:
-                # 如果当前路由被禁用了，则跳到第一个可用的
-                curr_idx = len(route_names)
-                
-            prev_idx = (curr_idx - 1 + len(route_names)) % len(route_names)
-            new_route = route_names[prev_idx]
-            current_state['route_name'] = new_route
-            
-            # 切换路由后，重置到该交路的第一站
-            line_info = None
-            if tools is not None:
-                line_info = tools.get_line_map_info(line_name, new_route)
-            if line_info is None:
-                line_info = fallback_get_line_map_info(line_name, new_route)
-                
-            if line_info:
-                current_state['next_station'] = _pick_initial_next_station_for_switch(line_name, new_route, direction, line_info)
-                    
-            save_current_state(current_state)
-            return jsonify(current_state)
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return _switch_route(-1)
 
 
 @app.route('/api/state/door/toggle', methods=['POST'])
 def toggle_door_side():
     """切换开门侧 (t 键)"""
-    global current_state
+    current_state = _current_state()
     current_side = current_state.get('door_side', '本侧')
     new_side = '对侧' if current_side == '本侧' else '本侧'
     current_state['door_side'] = new_side
@@ -669,7 +831,8 @@ def toggle_door_side():
 @app.route('/api/state/next_no_refresh', methods=['POST'])
 def next_station_no_refresh():
     """切换到下一站但不刷新页面 (] 键)"""
-    global current_state
+    tools = _tools()
+    current_state = _current_state()
     line_name = current_state['line_name']
     route_name = current_state['route_name']
     
@@ -697,236 +860,42 @@ def next_station_no_refresh():
             
     return jsonify({'status': 'error', 'message': '无法切换到下一站'}), 400
 
-def _normalize_schedule_config(raw_config):
-    """兼容两种班次配置格式：简写列表或带 display_count 的对象。"""
-    if isinstance(raw_config, dict):
-        display_count = raw_config.get('display_count', 2)
-        sequence = raw_config.get('route_order') or raw_config.get('sequence') or raw_config.get('routes') or []
-    elif isinstance(raw_config, list):
-        display_count = 2
-        sequence = raw_config
-    else:
-        display_count = 2
-        sequence = []
-
-    try:
-        display_count = int(display_count)
-    except Exception:
-        display_count = 2
-    display_count = max(1, min(display_count, 6))
-
-    normalized_sequence = []
-    for item in sequence:
-        if isinstance(item, dict):
-            route = item.get('route') or item.get('route_name') or item.get('service_name') or item.get('type')
-            if route:
-                normalized_sequence.append(str(route))
-        elif isinstance(item, int):
-            normalized_sequence.append(f"route{item}")
-        elif isinstance(item, str):
-            stripped = item.strip()
-            if not stripped:
-                continue
-            normalized_sequence.append(f"route{stripped}" if stripped.isdigit() else stripped)
-
-    return {
-        'display_count': display_count,
-        'sequence': normalized_sequence
-    }
-
 def _get_schedule_config():
-    if 'schedule.json' not in _DATA_CACHE:
-        _DATA_CACHE['schedule.json'] = _load_json('schedule.json')
-    return _DATA_CACHE['schedule.json'] if isinstance(_DATA_CACHE['schedule.json'], dict) else {}
+    data_cache = current_network().data_cache
+    if 'schedule.json' not in data_cache:
+        data_cache['schedule.json'] = _load_json('schedule.json')
+    return data_cache['schedule.json'] if isinstance(data_cache['schedule.json'], dict) else {}
 
 def _get_service_route_name(service):
-    if not isinstance(service, dict):
-        return ''
-    return service.get('type') or service.get('service_name') or service.get('name') or ''
-
-def _get_service_terminal_station(line_name, route_name, direction=0):
-    """根据线路、交路和方向计算终点站。"""
-    route_data = _get_route_data()
-    line_cfg = route_data.get(line_name, {}) if isinstance(route_data, dict) else {}
-    line_type = line_cfg.get('type', 'linear') if isinstance(line_cfg, dict) else 'linear'
-    services = line_cfg.get('services', []) if isinstance(line_cfg, dict) else []
-
-    service = None
-    for item in services:
-        if _get_service_route_name(item) == route_name:
-            service = item
-            break
-
-    if not isinstance(service, dict):
-        return ''
-
-    terminal = (service.get('terminal_station') or '').strip()
-    if terminal:
-        return terminal
-
-    if line_type == 'loop':
-        return ''
-
-    stations = service.get('stations', [])
-    if not isinstance(stations, list) or not stations:
-        return ''
-
-    try:
-        direction = int(direction or 0)
-    except Exception:
-        direction = 0
-
-    return str(stations[0] if direction == 1 else stations[-1])
+    return service_route_name(service)
 
-def _ring_label_for_route(route_name, direction=0):
-    """环线班次显示名称。由当前运行方向决定，不由交路编号决定。"""
-    try:
-        return '内环' if int(direction or 0) == 1 else '外环'
-    except Exception:
-        return '外环'
+def _get_schedule_engine():
+    """编译后的班次模型，schedule.json / 线路索引 / 英文名缓存被替换后自动重建"""
+    index = _get_network_index()
+    schedule_config = _get_schedule_config()
+    names = _get_display_names()
+    data_cache = current_network().data_cache
+    return _derived(data_cache, 'schedule_engine', (index, data_cache.get('schedule.json'), names),
+                    lambda: ScheduleEngine(index, schedule_config, names))
 
+@_timed('schedule')
 def _build_schedule_entries(line_name, schedule_index=0):
     """构建班次展示页需要显示的连续班次。"""
-    route_data = _get_route_data()
-    line_cfg = route_data.get(line_name, {}) if isinstance(route_data, dict) else {}
-    services = line_cfg.get('services', []) if isinstance(line_cfg, dict) else []
-    active_route_names = [
-        _get_service_route_name(s)
-        for s in services
-        if _get_service_route_name(s) and not s.get('disabled', False)
-    ]
-
-    schedule_config = _get_schedule_config()
-    raw_line_schedule = schedule_config.get(line_name, {}) if isinstance(schedule_config, dict) else {}
-    normalized = _normalize_schedule_config(raw_line_schedule)
-    sequence = [route for route in normalized.get('sequence', []) if route in active_route_names]
-
-    if not sequence:
-        sequence = active_route_names[:]
-
-    display_count = normalized.get('display_count', 2) or 2
-    if not sequence:
-        return [], 0, display_count
-
-    try:
-        schedule_index = int(schedule_index or 0)
-    except Exception:
-        schedule_index = 0
-    schedule_index = schedule_index % len(sequence)
-
-    trans_data = _get_trans_data()
-    direction = current_state.get('direction', 0)
-    line_type = line_cfg.get('type', 'linear') if isinstance(line_cfg, dict) else 'linear'
-    is_loop = line_type == 'loop'
-    next_station = current_state.get('next_station', '')
-    next_station_en = trans_data.get(next_station, next_station) if isinstance(trans_data, dict) else next_station
-    if isinstance(next_station_en, str):
-        next_station_en = re.sub(r'<\s*br\s*/?\s*>', ' ', next_station_en, flags=re.IGNORECASE)
-        next_station_en = re.sub(r'\s+', ' ', next_station_en).strip()
-    entries = []
-    search_count = 0
-    max_search = len(sequence) * 2
-    idx = schedule_index
-    while len(entries) < display_count and search_count < max_search:
-        route_name = sequence[idx % len(sequence)]
-        idx = (idx + 1) % len(sequence)
-        search_count += 1
-
-        service = None
-        for item in services:
-            if _get_service_route_name(item) == route_name:
-                service = item
-                break
-        service_label = (service or {}).get('label', '')
-        express_label = service_label if service_label == '直达 Express' else ''
-        terminal_station = _get_service_terminal_station(line_name, route_name, direction)
-        has_terminal = bool((terminal_station or '').strip())
-
-        # 检查当前站是否在该交路的站列表中（非环线）
-        serving_station = True
-        is_terminal_station = False
-        if not is_loop:
-            route_stations = (service or {}).get('stations', [])
-            if isinstance(route_stations, list) and route_stations:
-                serving_station = next_station in route_stations
-                if serving_station and terminal_station:
-                    is_terminal_station = next_station == terminal_station
-            if not serving_station:
-                continue
-
-        terminal_station_en = trans_data.get(terminal_station, terminal_station) if isinstance(trans_data, dict) else terminal_station
-        if isinstance(terminal_station_en, str):
-            terminal_station_en = re.sub(r'<\s*br\s*/?\s*>', ' ', terminal_station_en, flags=re.IGNORECASE)
-            terminal_station_en = re.sub(r'\s+', ' ', terminal_station_en).strip()
-        entries.append({
-            'route_name': route_name,
-            'terminal_station': terminal_station,
-            'terminal_station_en': terminal_station_en,
-            'is_loop': is_loop,
-            'has_terminal': has_terminal,
-            'serving_station': serving_station,
-            'is_terminal_station': is_terminal_station,
-            'label': service_label,
-            'express_label': express_label,
-            'ring_label': _ring_label_for_route(route_name, direction) if is_loop else '',
-            'next_station': next_station if is_loop else '',
-            'next_station_en': next_station_en if is_loop else ''
-        })
-
-    # 如果所有交路都被过滤掉（当前站不途经任何交路），回退显示默认班次
-    if not entries and not is_loop and sequence:
-        for offset in range(display_count):
-            route_name = sequence[(schedule_index + offset) % len(sequence)]
-            service = None
-            for item in services:
-                if _get_service_route_name(item) == route_name:
-                    service = item
-                    break
-            terminal_station = _get_service_terminal_station(line_name, route_name, direction)
-            has_terminal = bool((terminal_station or '').strip())
-            terminal_station_en = trans_data.get(terminal_station, terminal_station) if isinstance(trans_data, dict) else terminal_station
-            if isinstance(terminal_station_en, str):
-                terminal_station_en = re.sub(r'<\s*br\s*/?\s*>', ' ', terminal_station_en, flags=re.IGNORECASE)
-                terminal_station_en = re.sub(r'\s+', ' ', terminal_station_en).strip()
-            entries.append({
-                'route_name': route_name,
-                'terminal_station': terminal_station,
-                'terminal_station_en': terminal_station_en,
-                'is_loop': is_loop,
-                'has_terminal': has_terminal,
-                'serving_station': False,
-                'is_terminal_station': False,
-                'label': service.get('label', '') if service else '',
-                'express_label': '直达 Express' if (service or {}).get('label') == '直达 Express' else '',
-                'ring_label': _ring_label_for_route(route_name, direction) if is_loop else '',
-                'next_station': next_station if is_loop else '',
-                'next_station_en': next_station_en if is_loop else ''
-            })
-
-    return entries, schedule_index, display_count
+    current_state = _current_state()
+    return _get_schedule_engine().entries(line_name, schedule_index, current_state.get('direction', 0),
+                                          current_state.get('next_station', ''))
 
 
 def _advance_schedule(delta):
-    global current_state
+    current_state = _current_state()
     line_name = current_state.get('line_name')
-    entries, index, _display_count = _build_schedule_entries(line_name, current_state.get('schedule_index', 0))
-
-    route_data = _get_route_data()
-    line_cfg = route_data.get(line_name, {}) if isinstance(route_data, dict) else {}
-    services = line_cfg.get('services', []) if isinstance(line_cfg, dict) else []
-    schedule_config = _get_schedule_config()
-    raw_line_schedule = schedule_config.get(line_name, {}) if isinstance(schedule_config, dict) else {}
-    normalized = _normalize_schedule_config(raw_line_schedule)
-    active_route_names = [
-        _get_service_route_name(s)
-        for s in services
-        if _get_service_route_name(s) and not s.get('disabled', False)
-    ]
-    sequence = [route for route in normalized.get('sequence', []) if route in active_route_names] or active_route_names
+    line_schedule = _get_schedule_engine().line(line_name)
+    sequence = line_schedule.sequence
 
     if not sequence:
         return jsonify({'status': 'error', 'message': '无可用班次'}), 404
 
+    index = line_schedule.normalize_index(current_state.get('schedule_index', 0))
     new_index = (index + delta) % len(sequence)
     current_state['schedule_index'] = new_index
     save_current_state(current_state)
@@ -938,10 +907,11 @@ def _advance_schedule(delta):
         'entries': entries
     })
 
+@_timed('schedule')
 def _get_schedule_payload():
     """返回当前第5页需要的班次与线路元数据，供局部刷新使用。"""
-    global current_state
-    current_state = load_current_state()
+    tools = _tools()
+    current_state = _current_state()
     line_name = current_state.get('line_name', '')
 
     line_display_name = line_name
@@ -967,8 +937,8 @@ def _get_schedule_payload():
         line_color = fallback_get_line_color(line_name) or '#2f6bff'
     header_text_color, is_light_theme = get_header_theme(line_color)
 
+    # 只读路径：规范化后的班次下标只用于本次响应，不写入共享的会话状态
     entries, schedule_index, display_count = _build_schedule_entries(line_name, current_state.get('schedule_index', 0))
-    current_state['schedule_index'] = schedule_index
 
     return {
         'status': 'success',
@@ -985,9 +955,13 @@ def _get_schedule_payload():
 
 @app.route('/api/schedule/data')
 def api_schedule_data():
-    """获取第5页当前线路班次数据，用于无闪烁局部刷新。"""
+    """获取第5页当前线路班次数据，用于无闪烁局部刷新（支持 If-None-Match）。"""
     try:
-        return jsonify(_get_schedule_payload())
+        etag = _state_etag()
+        not_modified = _not_modified(etag)
+        if not_modified is not None:
+            return not_modified
+        return _with_etag(jsonify(_get_schedule_payload()), etag)
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -1023,11 +997,145 @@ def get_header_theme(line_color):
     except Exception:
         return '#ffffff', False
 
+# 单页外壳：/api/view/<页面> 返回页面的 JSON 视图模型与各区域的 HTML 片段，
+# 前端据此局部替换页面，而不是整页刷新
+VIEW_PAGES = {
+    'index': '/',
+    'line_map': '/line_map',
+    'line_detail': '/line_detail',
+    'arrival': '/arrival',
+    'schedule': '/schedule'
+}
+VIEW_REGIONS = ('head', 'header', 'content', 'scripts')
+# 体积大且与状态无关的静态数据不放入视图模型
+VIEW_MODEL_EXCLUDE = {'config', 'line_trans_data', 'station_data', 'color_data'}
+_BASE_STYLE_RE = re.compile(r'<style id="pis-base-style">(.*?)</style>', re.S)
+_TITLE_RE = re.compile(r'<title>(.*?)</title>', re.S)
+
+def _extract_view_region(html, name):
+    start_marker = f"<!--pis-view:{name}-->"
+    end_marker = f"<!--/pis-view:{name}-->"
+    start = html.find(start_marker)
+    end = html.find(end_marker, start)
+    if start < 0 or end < 0:
+        return ''
+    return html[start + len(start_marker):end]
+
+def _json_safe_model(context):
+    model = {}
+    for key, value in context.items():
+        if key in VIEW_MODEL_EXCLUDE:
+            continue
+        try:
+            json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            continue
+        model[key] = value
+    return model
+
+def _render_page(template_name, **context):
+    """渲染页面；视图模型请求（/api/view/<页面>）时改为返回 JSON 视图模型"""
+    with _phase('render'):
+        page_html = render_template(template_name, **context)
+    cache_key = g.pop('page_cache_key', None)
+    if not g.get('view_page'):
+        rendered = page_html
+    else:
+        base_style = _BASE_STYLE_RE.search(page_html)
+        title = _TITLE_RE.search(page_html)
+        rendered = {
+            'status': 'success',
+            'page': g.view_page,
+            'path': VIEW_PAGES[g.view_page],
+            'title': html_unescape(title.group(1).strip()) if title else '',
+            'theme': 'light' if context.get('is_light_theme') else '',
+            'model': _json_safe_model(context),
+            'base_style': base_style.group(1) if base_style else '',
+            'regions': {name: _extract_view_region(page_html, name) for name in VIEW_REGIONS}
+        }
+    if cache_key is not None:
+        # 渲染期间状态可能被其他请求就地修改，状态仍与键一致时才写入缓存
+        session = _current_session()
+        with session.lock:
+            if _state_cache_key(session.state) == cache_key[-1]:
+                _page_cache.put(cache_key, rendered, len(page_html))
+    return _page_response(rendered)
+
+def _page_response(rendered):
+    """页面 HTML 直接返回；视图模型附上当前的状态与数据版本"""
+    if isinstance(rendered, str):
+        return rendered
+    return jsonify(dict(rendered, state_version=get_state_version(), data_version=get_data_version()))
+
+def _page_cache_settings():
+    """(最多缓存的页面数, 缓存总大小上限 MB)；页面数为 0 时不缓存"""
+    adv = load_global_config().get("advance_settings", {}) or {}
+    if not adv.get("enable_advance_settings", False):
+        return 256, 32
+    try:
+        return max(int(adv.get("page_cache_entries", 256)), 0), max(float(adv.get("page_cache_mb", 32)), 0)
+    except (TypeError, ValueError):
+        return 256, 32
+
+# 渲染结果缓存：相同城市、列车状态、数据与全局配置下页面输出相同，再次访问（回到同一站、两次换向等）直接返回
+_page_cache_entries, _page_cache_mb = _page_cache_settings()
+_page_cache = PageCache(_page_cache_entries, int(_page_cache_mb * 1024 * 1024)) if _page_cache_entries else None
+PAGE_CACHE_LOOKUPS = metrics.counter('pis_page_cache_lookups_total', '页面渲染缓存查询次数', ('page', 'result'))
+
+def _state_cache_key(state):
+    """状态的可哈希快照；含不可哈希的值时返回 None"""
+    if state is None:
+        return None
+    try:
+        state_key = tuple(sorted(state.items()))
+        hash(state_key)
+    except TypeError:
+        return None
+    return state_key
+
+def _page_cache_key(page):
+    """页面输出依赖的全部输入；状态含不可哈希的值时返回 None（不缓存）"""
+    network = current_network()
+    state_key = _state_cache_key(_current_state(network))
+    if state_key is None:
+        return None
+    # 全局配置文件的 mtime 与大小作为配置版本，文件被删除或替换后键随之变化
+    return (network.city, network.data_version, _GLOBAL_CONFIG.file_stat(), request.script_root,
+            g.get('train_id'), page, bool(g.get('view_page')), state_key)
+
+def _cached_page(func):
+    """页面处理函数装饰器：命中渲染缓存时不再构建上下文与渲染模板"""
+    page = func.__name__
+
+    @functools.wraps(func)
+    def wrapper():
+        if _page_cache is None:
+            return func()
+        key = _page_cache_key(page)
+        if key is not None:
+            rendered = _page_cache.get(key)
+            if rendered is not None:
+                PAGE_CACHE_LOOKUPS.inc(page, 'hit')
+                return _page_response(rendered)
+            PAGE_CACHE_LOOKUPS.inc(page, 'miss')
+            g.page_cache_key = key
+        return func()
+    return wrapper
+
+@app.route('/api/view/<page>', methods=['GET'])
+def api_view(page):
+    """API接口：页面视图模型（index / line_map / line_detail / arrival / schedule）"""
+    if page not in VIEW_PAGES:
+        return jsonify({'status': 'error', 'message': f"未知页面 '{page}'"}), 404
+    g.view_page = page
+    return app.view_functions[page]()
+
 @app.route('/')
+@_cached_page
 def index():
     """首页 - 默认显示下一站信息（适配direction与终点展示）"""
-    global current_state
-    current_state = load_current_state()
+    tools = _tools()
+    current_state = _current_state()
     # 获取线路主题色
     line_color = None
     try:
@@ -1077,29 +1185,17 @@ def index():
                     terminal_station = fallback_get_terminal_station(line_name, route_name)
                 # 起点站回退：取该路线的首站
                 try:
-                    route_data = _get_route_data()
-                    services = route_data.get(line_name, {}).get('services', [])
-                    for s in services:
-                        name = s.get('type') or s.get('service_name')
-                        if name == route_name:
-                            stations = s.get('stations', [])
-                            if stations:
-                                start_station = stations[0]
-                            break
+                    stations = _get_network_index().stations(line_name, route_name)
+                    if stations:
+                        start_station = stations[0]
                 except Exception:
                     pass
             else:
                 try:
-                    route_data = _get_route_data()
-                    services = route_data.get(line_name, {}).get('services', [])
-                    for s in services:
-                        name = s.get('type') or s.get('service_name')
-                        if name == route_name:
-                            stations = s.get('stations', [])
-                            if stations:
-                                terminal_station = stations[0]
-                                start_station = stations[-1] if len(stations) > 0 else None
-                            break
+                    stations = _get_network_index().stations(line_name, route_name)
+                    if stations:
+                        terminal_station = stations[0]
+                        start_station = stations[-1]
                 except Exception:
                     pass
     except Exception:
@@ -1112,16 +1208,10 @@ def index():
         route_name = current_state['route_name']
         direction = current_state.get('direction', 0)
         # 线路类型与原始服务数据（用于环线识别与终点字段）
-        route_data = _get_route_data()
-        line_info_raw = route_data.get(line_name, {})
-        line_type = line_info_raw.get('type', 'linear')
-        raw_services = line_info_raw.get('services', [])
+        network_index = _get_network_index()
+        line_type = network_index.line_config(line_name).get('type', 'linear')
         def _raw_service_by_name(name):
-            for s in raw_services:
-                n = s.get('type') or s.get('service_name')
-                if n == name:
-                    return s
-            return None
+            return network_index.service(line_name, name)
         def _service_group(raw):
             try:
                 g = (raw or {}).get('group', '0')
@@ -1138,14 +1228,7 @@ def index():
             except Exception:
                 return '外环运行'
         # 获取该线路下的所有服务名称
-        all_services_raw = []
-        try:
-            route_data = _get_route_data()
-            all_services_raw = route_data.get(line_name, {}).get('services', [])
-        except Exception:
-            all_services_raw = []
-            
-        routes = [s.get('type') or s.get('service_name') for s in all_services_raw]
+        routes = list(network_index.routes(line_name))
         
         # 主线信息
         main_count = 0
@@ -1283,8 +1366,8 @@ def index():
     except Exception:
         pass
 
-    # 获取翻译数据
-    trans_data = _get_trans_data()
+    # 站点英文显示名（按数据版本预先生成）
+    names = _get_display_names()
 
     # 获取线路中英文名
     line_display_name = None
@@ -1301,33 +1384,8 @@ def index():
     except Exception:
         pass
 
-    run_style = 'default'
-    try:
-        line_name = current_state.get('line_name')
-        if line_name:
-            data_dir = get_data_dir()
-            route_file = os.path.join(data_dir, 'route.json')
-            with open(route_file, 'r', encoding='utf-8') as f:
-                route_data_raw = json.load(f)
-            line_cfg = route_data_raw.get(line_name, {})
-            if not isinstance(line_cfg, dict):
-                line_cfg = {}
-            if 'run_style' not in line_cfg:
-                line_cfg['run_style'] = 'default'
-                route_data_raw[line_name] = line_cfg
-                save_json_file(route_file, route_data_raw)
-                if 'route.json' in _DATA_CACHE:
-                    del _DATA_CACHE['route.json']
-                if tools is not None:
-                    try:
-                        tools._load_data()
-                    except Exception as e:
-                        print(f"重载 RouteTools 数据失败: {e}")
-            run_style = (line_cfg.get('run_style') or 'default')
-            if run_style not in ['default', 'detail']:
-                run_style = 'default'
-    except Exception:
-        run_style = 'default'
+    # 样式字段在加载 route.json 时已补全，这里只读内存数据
+    run_style = _route_style(current_state.get('line_name'), 'run_style')
     
     # 下一站换乘徽章（用于头部显示）
     transfer_badges = []
@@ -1354,41 +1412,11 @@ def index():
                  pass
 
         if next_station_info:
-            if tools is not None:
-                try:
-                    current_code = tools._line_code_from_key(line_name)
-                    for code in next_station_info.get('transfer_lines', []):
-                        if code != current_code:
-                            code_str = str(code).strip()
-                            if code_str.isdigit():
-                                key = f"line_{int(code_str)}"
-                                code_disp = str(int(code_str))
-                            else:
-                                key = f"line_{code_str}"
-                                code_disp = code_str
-                            transfer_badges.append({'code': code_disp, 'color': tools.get_line_color(key)})
-                except Exception:
-                    pass
-            else:
-                # 回退模式
-                try:
-                    current_code = _line_code_from_key(line_name)
-                    for code in next_station_info.get('transfer_lines', []):
-                        if code != current_code:
-                            code_str = str(code).strip()
-                            if code_str.isdigit():
-                                key = f"line_{int(code_str)}"
-                                code_disp = str(int(code_str))
-                            else:
-                                key = f"line_{code_str}"
-                                code_disp = code_str
-                            transfer_badges.append({'code': code_disp, 'color': fallback_get_line_color(key)})
-                except Exception:
-                    pass
+            _lines_display, transfer_badges = _build_transfer_badges(line_name, next_station_info.get('transfer_lines', []))
     except Exception:
         pass
 
-    return render_template('index.html',
+    return _render_page('index.html',
                            line_color=line_color,
                            line_display_name=line_display_name,
                            line_en_name=line_en_name,
@@ -1399,19 +1427,20 @@ def index():
                            route_services=route_services,
                            loop_ring_label_main=loop_ring_label_main,
                            loop_terminal_main=loop_terminal_main,
-                           trans_data=trans_data,
+                           names=names,
                            transfer_badges=transfer_badges,
                            run_style=run_style,
-                           config=app_config,
+                           config=current_network().app_config,
                            **current_state)
 
 
 
 @app.route('/line_map')
+@_cached_page
 def line_map():
     """线路图页面（基于真实数据渲染）"""
-    global current_state
-    current_state = load_current_state()
+    tools = _tools()
+    current_state = _current_state()
     try:
         # 获取线路主题色
         line_color = None
@@ -1425,8 +1454,8 @@ def line_map():
 
         header_text_color, is_light_theme = get_header_theme(line_color)
 
-        # 获取翻译数据
-        trans_data = _get_trans_data()
+        # 站点英文显示名（按数据版本预先生成）
+        names = _get_display_names()
         
         line_name = current_state['line_name']
         route_name = current_state['route_name']
@@ -1434,9 +1463,13 @@ def line_map():
         line_info = None
         line_display_name = line_name
         line_en_name = None
+        # 记录展示数据所属交路与来源，反向显示时可直接取缓存的反向站序
+        display_route = route_name
+        line_info_from_tools = False
         if tools is not None:
             try:
                 line_info = tools.get_line_map_info(line_name, route_name)
+                line_info_from_tools = True
                 line_display_name = tools.get_line_display_name(line_name)
                 line_en_name = tools.get_line_en_name(line_name)
             except Exception as e:
@@ -1457,71 +1490,27 @@ def line_map():
         try:
             # 当前路线的站序
             current_route_stations = [s.get('station_name') for s in (line_info or [])]
-            # 获取该线路所有route名
-            routes = []
-            if tools is not None:
-                try:
-                    routes = tools.get_routes_for_line(line_name)
-                except Exception:
-                    routes = []
-            if not routes:
-                try:
-                    routes = fallback_get_routes_for_line(line_name)
-                except Exception:
-                    routes = []
-            # 工具：拿到指定route的站序（仅名称）
-            def _names_for_route(rn):
-                info_r = []
-                if tools is not None:
-                    try:
-                        info_r = tools.get_station_info(line_name, rn)
-                    except Exception:
-                        info_r = []
-                if not info_r:
-                    info_r = fallback_get_station_info(line_name, rn)
-                return [s.get('station_name') for s in info_r]
-            # 判断small是否是big的连续子序列（支持与big同向或反向）
-            def _is_contiguous_subseq(small, big):
-                if not small or not big or len(small) > len(big):
-                    return False
-                # 正向匹配
-                try:
-                    idx = big.index(small[0])
-                    if big[idx:idx+len(small)] == small:
-                        return True
-                except ValueError:
-                    pass
-                # 反向匹配
-                small_rev = list(reversed(small))
-                try:
-                    idx2 = big.index(small_rev[0])
-                    if big[idx2:idx2+len(small_rev)] == small_rev:
-                        return True
-                except ValueError:
-                    pass
-                return False
-            # 选择最长的包含当前route的“大路线”
+            # 包含当前route的最长“大路线”在加载数据时已预先计算
             candidate_full = None
-            candidate_full_len = len(current_route_stations)
-            for r in routes:
-                if r == route_name:
-                    continue
-                names_r = _names_for_route(r)
-                if len(names_r) > candidate_full_len and _is_contiguous_subseq(current_route_stations, names_r):
-                    candidate_full = r
-                    candidate_full_len = len(names_r)
+            if current_route_stations:
+                container = _get_network_index().containing_route(line_name, route_name)
+                if container is not None:
+                    candidate_full = container[0]
             if candidate_full:
                 full_route_mode = True
                 # 使用“大路线”的富信息作为展示数据
                 full_line_info = None
+                full_line_info_from_tools = False
                 if tools is not None:
                     try:
                         full_line_info = tools.get_line_map_info(line_name, candidate_full)
+                        full_line_info_from_tools = True
                         line_display_name = tools.get_line_display_name(line_name)
                         line_en_name = tools.get_line_en_name(line_name)
                         line_color = tools.get_line_color(line_name)
                     except Exception:
                         full_line_info = None
+                        full_line_info_from_tools = False
                 if full_line_info is None:
                     try:
                         full_line_info = fallback_get_line_map_info(line_name, candidate_full)
@@ -1532,6 +1521,8 @@ def line_map():
                         full_line_info = None
                 if full_line_info:
                     line_info = full_line_info
+                    display_route = candidate_full
+                    line_info_from_tools = full_line_info_from_tools
                 # 将当前路线站序注入到模板上下文（用于灰显非当前route站点）
                 # 注意：即便未找到大路线也注入当前站序，用于普通模式
         except Exception as e:
@@ -1542,7 +1533,10 @@ def line_map():
         try:
             direction = current_state.get('direction', 0)
             if line_info and isinstance(line_info, list) and direction == 1:
-                line_info = list(reversed(line_info))
+                if line_info_from_tools:
+                    line_info = tools.get_line_map_info(line_name, display_route, reverse=True)
+                else:
+                    line_info = list(reversed(line_info))
                 is_reversed = True
         except Exception as e:
             print(f"整理线路显示方向失败: {e}")
@@ -1560,16 +1554,11 @@ def line_map():
         loop_has_terminal = False
         loop_terminal_station = ''
         try:
-            route_data = _get_route_data()
-            d = route_data.get(line_name, {})
-            services = d.get('services', [])
-            for s in services:
-                name = s.get('type') or s.get('service_name')
-                if name == route_name:
-                    term = (s.get('terminal_station') or '').strip()
-                    loop_has_terminal = bool(term)
-                    loop_terminal_station = term
-                    break
+            s = _get_network_index().service(line_name, route_name)
+            if s is not None:
+                term = (s.get('terminal_station') or '').strip()
+                loop_has_terminal = bool(term)
+                loop_terminal_station = term
         except Exception:
             loop_has_terminal = False
             loop_terminal_station = ''
@@ -1586,38 +1575,8 @@ def line_map():
                     break
         except Exception:
             next_station_info = None
-        if next_station_info and tools is not None:
-            try:
-                current_code = tools._line_code_from_key(line_name)
-                for code in next_station_info.get('transfer_lines', []):
-                    if code != current_code:
-                        code_str = str(code).strip()
-                        if code_str.isdigit():
-                            key = f"line_{int(code_str)}"
-                            code_disp = str(int(code_str))
-                        else:
-                            key = f"line_{code_str}"
-                            code_disp = code_str
-                        transfer_lines_display.append(tools.get_line_display_name(key))
-                        transfer_badges.append({'code': code_disp, 'color': tools.get_line_color(key)})
-            except Exception:
-                pass
-        elif next_station_info:
-            try:
-                current_code = _line_code_from_key(line_name)
-                for code in next_station_info.get('transfer_lines', []):
-                    if code != current_code:
-                        code_str = str(code).strip()
-                        if code_str.isdigit():
-                            key = f"line_{int(code_str)}"
-                            code_disp = str(int(code_str))
-                        else:
-                            key = f"line_{code_str}"
-                            code_disp = code_str
-                        transfer_lines_display.append(fallback_get_line_display_name(key))
-                        transfer_badges.append({'code': code_disp, 'color': fallback_get_line_color(key)})
-            except Exception:
-                pass
+        if next_station_info:
+            transfer_lines_display, transfer_badges = _build_transfer_badges(line_name, next_station_info.get('transfer_lines', []))
 
         # 布局模式（非环线有效；环线强制为auto）
         layout_mode = 'auto'
@@ -1627,14 +1586,10 @@ def line_map():
             layout_mode = (d.get('layout') or 'auto')
 
             # 交路服务级别配置覆盖
-            services = d.get('services', [])
-            current_route = current_state.get('route_name')
-            for svc in services:
-                if _get_service_route_name(svc) == current_route:
-                    cfg = svc.get('config')
-                    if isinstance(cfg, dict) and 'layout' in cfg:
-                        layout_mode = cfg['layout']
-                        break
+            svc = _get_network_index().service(line_name, current_state.get('route_name'))
+            cfg = (svc or {}).get('config')
+            if isinstance(cfg, dict) and 'layout' in cfg:
+                layout_mode = cfg['layout']
         except Exception:
             layout_mode = 'auto'
 
@@ -1657,7 +1612,7 @@ def line_map():
         except Exception:
             services_data = []
 
-        return render_template('line_map.html',
+        return _render_page('line_map.html',
                                line_info=line_info,
                                line_display_name=line_display_name,
                                line_en_name=line_en_name,
@@ -1670,12 +1625,13 @@ def line_map():
                                loop_terminal_station=loop_terminal_station,
                                current_route_stations=current_route_stations,
                                full_route_mode=full_route_mode,
-                               trans_data=trans_data,
+                               names=names,
+                               line_trans_data=names.subset(_service_station_names(services_data)),
                                transfer_badges=transfer_badges,
                                layout_mode=layout_mode,
                                station_spacing_multiplier=station_spacing_multiplier,
                                services=services_data,
-                               config=app_config,
+                               config=current_network().app_config,
                                **current_state)
     except Exception as e:
         error_msg = f"获取线路信息失败: {str(e)}"
@@ -1683,37 +1639,16 @@ def line_map():
         return error_msg, 500
 
 @app.route('/line_detail')
+@_cached_page
 def line_detail():
     """线路详情页面（基于真实数据渲染）"""
-    global current_state
-    current_state = load_current_state()
+    tools = _tools()
+    current_state = _current_state()
     try:
         line_name = current_state['line_name']
         route_name = current_state['route_name']
 
-        detail_style = 'default'
-        try:
-            data_dir = get_data_dir()
-            route_file = os.path.join(data_dir, 'route.json')
-            with open(route_file, 'r', encoding='utf-8') as f:
-                route_data_raw = json.load(f)
-            line_cfg = route_data_raw.get(line_name, {})
-            if not isinstance(line_cfg, dict):
-                line_cfg = {}
-            if 'detail_style' not in line_cfg:
-                line_cfg['detail_style'] = 'default'
-                route_data_raw[line_name] = line_cfg
-                save_json_file(route_file, route_data_raw)
-                if 'route.json' in _DATA_CACHE:
-                    del _DATA_CACHE['route.json']
-                if tools is not None:
-                    try:
-                        tools._load_data()
-                    except Exception as e:
-                        print(f"重载 RouteTools 数据失败: {e}")
-            detail_style = (line_cfg.get('detail_style') or 'default')
-        except Exception:
-            detail_style = 'default'
+        detail_style = _route_style(line_name, 'detail_style')
         
         # 获取富含英文名与换乘信息的线路数据
         line_info = None
@@ -1753,17 +1688,13 @@ def line_detail():
         loop_has_terminal = False
         loop_terminal_station = ''
         try:
-            route_data = _get_route_data()
-            d = route_data.get(line_name, {})
-            is_loop = (d.get('type') == 'loop')
-            services = d.get('services', [])
-            for s in services:
-                name = s.get('type') or s.get('service_name')
-                if name == route_name:
-                    term = (s.get('terminal_station') or '').strip()
-                    loop_has_terminal = bool(term)
-                    loop_terminal_station = term
-                    break
+            network_index = _get_network_index()
+            is_loop = (network_index.line_config(line_name).get('type') == 'loop')
+            s = network_index.service(line_name, route_name)
+            if s is not None:
+                term = (s.get('terminal_station') or '').strip()
+                loop_has_terminal = bool(term)
+                loop_terminal_station = term
         except Exception:
             pass
 
@@ -1803,46 +1734,16 @@ def line_detail():
         if line_color is None:
             line_color = fallback_get_line_color(line_name)
         
-        if next_station_info and tools is not None:
-            try:
-                current_code = tools._line_code_from_key(line_name)
-                for code in next_station_info.get('transfer_lines', []):
-                    if code != current_code:
-                        code_str = str(code).strip()
-                        if code_str.isdigit():
-                            key = f"line_{int(code_str)}"
-                            code_disp = str(int(code_str))
-                        else:
-                            key = f"line_{code_str}"
-                            code_disp = code_str
-                        transfer_lines_display.append(tools.get_line_display_name(key))
-                        transfer_badges.append({'code': code_disp, 'color': tools.get_line_color(key)})
-            except Exception:
-                pass
-        elif next_station_info:
-            try:
-                current_code = _line_code_from_key(line_name)
-                for code in next_station_info.get('transfer_lines', []):
-                    if code != current_code:
-                        code_str = str(code).strip()
-                        if code_str.isdigit():
-                            key = f"line_{int(code_str)}"
-                            code_disp = str(int(code_str))
-                        else:
-                            key = f"line_{code_str}"
-                            code_disp = code_str
-                        transfer_lines_display.append(fallback_get_line_display_name(key))
-                        transfer_badges.append({'code': code_disp, 'color': fallback_get_line_color(key)})
-            except Exception:
-                pass
+        if next_station_info:
+            transfer_lines_display, transfer_badges = _build_transfer_badges(line_name, next_station_info.get('transfer_lines', []))
 
-        # 翻译数据
-        trans_data = _get_trans_data()
+        # 站点英文显示名（按数据版本预先生成）
+        names = _get_display_names()
         station_data = _get_station_data()
         color_data = _get_color_data()
         
         # 环线终点站按字段识别，序列保持原始顺序由前端按方向截取
-        return render_template('line_detail.html',
+        return _render_page('line_detail.html',
                               line_info=line_info,
                               line_display_name=line_display_name,
                               line_en_name=line_en_name,
@@ -1859,10 +1760,10 @@ def line_detail():
                               loop_has_terminal=loop_has_terminal,
                               loop_terminal_station=loop_terminal_station,
                               terminal_station=terminal_station,
-                              trans_data=trans_data,
+                              names=names,
                               station_data=station_data,
                               color_data=color_data,
-                              config=app_config,
+                              config=current_network().app_config,
                               **current_state)
     except Exception as e:
         error_msg = f"获取线路信息失败: {str(e)}"
@@ -1870,10 +1771,11 @@ def line_detail():
         return error_msg, 500
 
 @app.route('/arrival')
+@_cached_page
 def arrival():
     """到站信息页面（基于真实数据渲染）"""
-    global current_state
-    current_state = load_current_state()
+    tools = _tools()
+    current_state = _current_state()
     try:
         line_name = current_state['line_name']
         route_name = current_state['route_name']
@@ -1924,17 +1826,13 @@ def arrival():
         loop_has_terminal = False
         loop_terminal_station = ''
         try:
-            route_data = _get_route_data()
-            line_config = route_data.get(line_name, {})
-            is_loop = (line_config.get('type') == 'loop')
-            services = line_config.get('services', [])
-            for s in services:
-                name = s.get('type') or s.get('service_name')
-                if name == route_name:
-                    term = (s.get('terminal_station') or '').strip()
-                    loop_has_terminal = bool(term)
-                    loop_terminal_station = term
-                    break
+            network_index = _get_network_index()
+            is_loop = (network_index.line_config(line_name).get('type') == 'loop')
+            s = network_index.service(line_name, route_name)
+            if s is not None:
+                term = (s.get('terminal_station') or '').strip()
+                loop_has_terminal = bool(term)
+                loop_terminal_station = term
         except Exception:
             pass
 
@@ -1985,21 +1883,7 @@ def arrival():
         transfer_lines_display = []
         transfer_badges = []
         if next_station_info and tools is not None:
-            try:
-                current_code = tools._line_code_from_key(line_name)
-                for code in next_station_info.get('transfer_lines', []):
-                    if code != current_code:
-                        code_str = str(code).strip()
-                        if code_str.isdigit():
-                            key = f"line_{int(code_str)}"
-                            code_disp = str(int(code_str))
-                        else:
-                            key = f"line_{code_str}"
-                            code_disp = code_str
-                        transfer_lines_display.append(tools.get_line_display_name(key))
-                        transfer_badges.append({'code': code_disp, 'color': tools.get_line_color(key)})
-            except Exception:
-                pass
+            transfer_lines_display, transfer_badges = _build_transfer_badges(line_name, next_station_info.get('transfer_lines', []))
         
         # 获取车厢节数
         route_data = _get_route_data()
@@ -2011,10 +1895,10 @@ def arrival():
             except ValueError:
                 carriage_count = 6
         
-        # 翻译数据
-        trans_data = _get_trans_data()
+        # 站点英文显示名（按数据版本预先生成）
+        names = _get_display_names()
         
-        return render_template('arrival.html',
+        return _render_page('arrival.html',
                               current_station_info=current_station_info,
                               line_info=line_info,
                               current_route_stations=current_route_stations,
@@ -2032,9 +1916,9 @@ def arrival():
                               is_loop=is_loop,
                               loop_has_terminal=loop_has_terminal,
                               loop_terminal_station=loop_terminal_station,
-                              trans_data=trans_data,
+                              names=names,
                               carriage_count=carriage_count,
-                              config=app_config,
+                              config=current_network().app_config,
                               **current_state)
     except Exception as e:
         error_msg = f"获取到站信息失败: {str(e)}"
@@ -2042,10 +1926,11 @@ def arrival():
         return error_msg, 500
 
 @app.route('/schedule')
+@_cached_page
 def schedule():
     """班次展示页。"""
-    global current_state
-    current_state = load_current_state()
+    tools = _tools()
+    current_state = _current_state()
     try:
         line_name = current_state.get('line_name', '')
 
@@ -2073,9 +1958,10 @@ def schedule():
         header_text_color, is_light_theme = get_header_theme(line_color)
 
         entries, schedule_index, display_count = _build_schedule_entries(line_name, current_state.get('schedule_index', 0))
-        current_state['schedule_index'] = schedule_index
+        # 在副本上使用规范化后的班次下标，GET 不修改共享的会话状态（修改只经由 save_current_state）
+        view_state = dict(current_state, schedule_index=schedule_index)
 
-        return render_template('schedule.html',
+        return _render_page('schedule.html',
                                entries=entries,
                                display_count=display_count,
                                line_display_name=line_display_name,
@@ -2083,8 +1969,8 @@ def schedule():
                                line_color=line_color,
                                header_text_color=header_text_color,
                                is_light_theme=is_light_theme,
-                               config=app_config,
-                               **current_state)
+                               config=current_network().app_config,
+                               **view_state)
     except Exception as e:
         error_msg = f"获取班次信息失败: {str(e)}"
         print(error_msg)
@@ -2093,6 +1979,8 @@ def schedule():
 @app.route('/api/get_station_info')
 def api_get_station_info():
     """API接口：获取站点信息"""
+    tools = _tools()
+    current_state = _current_state()
     try:
         line_name = request.args.get('line_name', current_state['line_name'])
         route_name = request.args.get('route_name', current_state['route_name'])
@@ -2131,6 +2019,7 @@ def api_get_station_info():
 @app.route('/api/get_all_lines')
 def api_get_all_lines():
     """API接口：获取所有线路"""
+    tools = _tools()
     try:
         # 尝试从RouteTools获取数据
         if tools is not None:
@@ -2165,6 +2054,7 @@ def api_get_all_lines():
 @app.route('/api/get_routes_for_line')
 def api_get_routes_for_line():
     """API接口：获取指定线路的所有路线"""
+    tools = _tools()
     try:
         line_name = request.args.get('line_name')
         if not line_name:
@@ -2203,15 +2093,46 @@ def api_get_routes_for_line():
             'message': str(e)
         }), 400
 
+@app.route('/api/city', methods=['GET'])
+def get_city():
+    """API接口：获取当前请求的城市、默认城市、可用城市与已加载城市"""
+    return jsonify({
+        'status': 'success',
+        'city': get_current_city(),
+        'default_city': get_default_city(),
+        'city_version': get_city_version(),
+        'cities': list_cities(),
+        'registry': city_registry.stats()
+    })
+
+@app.route('/api/city', methods=['POST'])
+def set_city():
+    """API接口：运行时切换默认城市"""
+    city = (request.json or {}).get('city')
+    try:
+        city = switch_city(city)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return jsonify({
+        'status': 'success',
+        'city': city,
+        'city_version': get_city_version(),
+        'state': city_registry.get(city).state
+    })
+
 @app.route('/api/update_state', methods=['POST'])
 def update_state():
     """API接口：更新当前状态（用于模拟测试）"""
+    current_state = _current_state()
     try:
         data = request.json
         if data:
             for key, value in data.items():
                 if key in current_state:
                     current_state[key] = value
+            save_current_state(current_state)
         
         return jsonify({
             'status': 'success',
@@ -2225,6 +2146,7 @@ def update_state():
 
 # 获取线路显示名称（优先使用RouteTools，其次使用数据文件回退）
 def get_line_display_name(line):
+    tools = _tools()
     try:
         if tools is not None:
             return tools.get_line_display_name(line)
@@ -2251,50 +2173,353 @@ def ensure_directories():
             print(f"创建目录: {directory}")
 
 # 数据文件读取与回退工具（代码与数据分离）
-_DATA_CACHE = {}
 
-def _data_path(name):
-    return os.path.join(get_data_dir(), name)
+# 数据目录下的文件；监视器按文件粒度重载这些文件
+DATA_FILES = ['route.json', 'station.json', 'trans_name.json', 'color.json', 'schedule.json', 'config.json']
+
+_DATA_RELOAD_LOCK = threading.RLock()
+_watch_data_dirs = False
+_watch_options = {'interval': 0.25, 'debounce': 0.3}
+_city_watcher = None
+_network_override = threading.local()
+
+def current_network():
+    """当前请求所选城市的网络（请求之外为默认城市）"""
+    network = getattr(_network_override, 'network', None)
+    if network is not None:
+        return network
+    if has_request_context():
+        network = g.get('network')
+        if network is not None:
+            return network
+    return city_registry.get_default()
+
+@contextmanager
+def _use_network(network, session_id=None):
+    """在当前线程内临时以指定城市网络与列车会话作为 current_network() / current_session_id()"""
+    previous = (getattr(_network_override, 'network', None), getattr(_network_override, 'session_id', None))
+    _network_override.network = network
+    _network_override.session_id = session_id
+    try:
+        yield network
+    finally:
+        _network_override.network, _network_override.session_id = previous
+
+def _tools():
+    tools = current_network().tools
+    if tools is not None and _request_timing is not None and has_request_context() and g.get('request_timer') is not None:
+        return _TimedTools(tools)
+    return tools
+
+def get_data_version():
+    """当前城市的数据版本号，任一数据文件重载后单调递增（跨城市不重复）"""
+    return current_network().data_version
+
+def _load_city_network(city):
+    """加载城市网络：数据缓存、RouteTools、应用配置（供 CityRegistry 按需调用）"""
+    city = str(city or '').strip()
+    data_dir = _city_data_dir(city)
+    if not city or city.startswith('.') or os.path.basename(city) != city or not os.path.isfile(os.path.join(data_dir, 'route.json')):
+        raise ValueError(f"城市 '{city}' 的数据不存在")
+    network = CityNetwork(city, data_dir)
+    network.data_cache = {name: _load_json(name, data_dir) for name in DATA_FILES if name != 'config.json'}
+    # 索引（含交路包含关系）与站点英文名表在加载时构建，不等到第一次请求
+    _build_network_index(network.data_cache)
+    _build_display_names(network.data_cache)
+    network.tools = _create_route_tools(data_dir)
+    network.app_config = load_app_config(data_dir)
+    network.data_tag = _data_fingerprint(data_dir)
+    _current_state(network, network.session(None))
+    if _watch_data_dirs:
+        _start_network_watcher(network)
+    return network
+
+def _on_city_evicted(network):
+    print(f"内存预算不足，卸载城市: {network.city}")
+    for session in list(network.sessions.values()):
+        if session.state is not None:
+            save_current_state(session.state, network, session)
+    if network.watcher is not None:
+        network.watcher.stop()
+        network.watcher = None
+
+def _reload_data_files(names, network=None):
+    """按文件重载数据缓存与 RouteTools（未变化的文件不重新解析），并递增数据版本"""
+    network = network or current_network()
+    names = [n for n in names if n in DATA_FILES]
+    if not names:
+        return
+    with _DATA_RELOAD_LOCK:
+        for name in names:
+            if name == 'config.json':
+                network.app_config = load_app_config(network.data_dir)
+            else:
+                network.data_cache[name] = _load_json(name, network.data_dir)
+            DATA_RELOADS.inc(network.city, name)
+        _build_network_index(network.data_cache)
+        _build_display_names(network.data_cache)
+        if network.tools is not None:
+            try:
+                network.tools.reload_files(names)
+                ROUTE_TOOLS_RELOADS.inc(network.city, 'success')
+            except Exception as e:
+                ROUTE_TOOLS_RELOADS.inc(network.city, 'error')
+                print(f"重载 RouteTools 数据失败: {e}")
+        network.bump_version()
+        network.data_tag = _data_fingerprint(network.data_dir)
+        network.measure()
+        if network.watcher is not None:
+            network.watcher.refresh(names)
+
+def _start_network_watcher(network):
+    if network.watcher is None:
+        def _on_changed(changed):
+            print(f"检测到数据文件变更（{network.city}），重新加载: {', '.join(sorted(changed))}")
+            _reload_data_files(changed, network)
+        network.watcher = DataWatcher(network.data_dir, DATA_FILES, _on_changed, **_watch_options)
+    return network.watcher.start()
+
+def _start_data_watcher(interval=0.25, debounce=0.3):
+    """启动已加载城市的数据目录监视器（之后加载的城市自动启动），同时监视 city_config.json"""
+    global _watch_data_dirs, _city_watcher
+    _watch_data_dirs = True
+    _watch_options.update(interval=interval, debounce=debounce)
+    for network in city_registry.networks():
+        _start_network_watcher(network)
+    if _city_watcher is None:
+        _city_watcher = DataWatcher(os.path.dirname(CITY_CONFIG_FILE), [os.path.basename(CITY_CONFIG_FILE)],
+                                    _on_city_config_changed, interval=interval, debounce=debounce)
+        _city_watcher.start()
+    return _city_watcher
+
+def _on_city_config_changed(_changed):
+    city = _read_city_config()
+    if city != get_default_city():
+        print(f"检测到 city_config.json 变更，切换城市: {city}")
+        switch_city(city, persist=False)
+
+def switch_city(city, persist=True):
+    """
+    运行时切换默认城市：先通过注册表完整加载新城市的数据、配置与RouteTools，
+    再一次性替换默认城市指针，请求不会看到新旧城市混杂的数据。
+
+    Args:
+        city: data 目录下的城市名
+        persist: 是否写回 city_config.json
+
+    Raises:
+        ValueError: 城市数据不存在
+    """
+    global _city_version
+    city = str(city or '').strip()
+    network = city_registry.get(city)
+    with _DATA_RELOAD_LOCK:
+        old_network = city_registry.peek(city_registry.default_city)
+        if old_network is network:
+            return city
+        old_state = old_network.state if old_network is not None else None
+        new_session = network.session(None)
+        _current_state(network, new_session)
+        city_registry.set_default(city)
+        _city_version += 1
+        # 根目录 current_state.json 改为记录新默认城市的状态，原默认城市的状态另存
+        if old_network is not None and old_state is not None:
+            save_current_state(old_state, old_network, old_network.session(None))
+        save_current_state(new_session.state, network, new_session)
+        if persist:
+            config_data = _CITY_CONFIG.load()
+            config_data = dict(config_data) if isinstance(config_data, dict) else {}
+            config_data['current_city'] = city
+            with open(CITY_CONFIG_FILE, 'w', encoding='utf-8') as f:
+                json.dump(config_data, f, ensure_ascii=False, indent=4)
+            if _city_watcher is not None:
+                _city_watcher.refresh()
+        with _use_network(network):
+            _reset_state_for_network()
+    return city
+
+def _reset_state_for_network():
+    """当前线路/交路/站点在（新城市的）网络中不存在时，重置到可用线路交路的起始站"""
+    tools = _tools()
+    current_state = _current_state()
+    network_index = _get_network_index()
+    line_name = current_state.get('line_name')
+    route_name = current_state.get('route_name')
+    if network_index.station_position(line_name, route_name, current_state.get('next_station')) is not None:
+        return
+    lines = network_index.lines()
+    if not lines:
+        return
+    new_line = line_name if network_index.has_line(line_name) else lines[0]
+    if network_index.service(new_line, route_name) is not None:
+        new_route = route_name
+    else:
+        routes = network_index.active_routes(new_line) or network_index.routes(new_line)
+        new_route = routes[0] if routes else 'route1'
+    line_info = None
+    if tools is not None:
+        try:
+            line_info = tools.get_line_map_info(new_line, new_route)
+        except Exception:
+            line_info = None
+    if line_info is None:
+        line_info = fallback_get_line_map_info(new_line, new_route)
+    current_state['line_name'] = new_line
+    current_state['route_name'] = new_route
+    current_state['next_station'] = _pick_initial_next_station_for_switch(new_line, new_route, current_state.get('direction', 0), line_info) if line_info else ''
+    current_state['schedule_index'] = 0
+    save_current_state(current_state)
+
+def _data_fingerprint(data_dir):
+    """数据文件指纹：由各数据文件的修改时间与大小得出，同一份数据在不同进程、重启前后相同"""
+    parts = []
+    for name in DATA_FILES:
+        try:
+            st = os.stat(os.path.join(data_dir, name))
+            parts.append(f"{name}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{name}:-")
+    return hashlib.blake2s('|'.join(parts).encode('utf-8'), digest_size=8).hexdigest()
+
+def _data_path(name, data_dir=None):
+    return os.path.join(data_dir or get_data_dir(), name)
 
-def _load_json(name):
+def _load_json(name, data_dir=None):
     try:
-        with open(_data_path(name), 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(_data_path(name, data_dir), 'r', encoding='utf-8') as f:
+            data = json.load(f)
     except Exception as e:
         print(f"加载数据文件失败 {name}: {e}")
         return {}
+    if name == 'route.json':
+        _apply_route_defaults(data)
+    return data
+
+# route.json 中各线路的显示样式字段：字段 -> (默认值, 可选值)
+ROUTE_STYLE_FIELDS = {
+    'run_style': ('default', ('default', 'detail')),
+    'detail_style': ('default', ('default', 'column'))
+}
+
+def _apply_route_defaults(route_data):
+    """加载 route.json 时补全各线路缺省或无效的显示样式字段（只修改内存数据，不回写文件）"""
+    if not isinstance(route_data, dict):
+        return route_data
+    for line_cfg in route_data.values():
+        if not isinstance(line_cfg, dict):
+            continue
+        for field, (default, choices) in ROUTE_STYLE_FIELDS.items():
+            if line_cfg.get(field) not in choices:
+                line_cfg[field] = default
+    return route_data
+
+def _route_style(line_name, field):
+    """读取线路的显示样式（run_style / detail_style），线路不存在时返回默认值"""
+    line_cfg = _get_route_data().get(line_name) if line_name else None
+    if isinstance(line_cfg, dict) and field in line_cfg:
+        return line_cfg[field]
+    return ROUTE_STYLE_FIELDS[field][0]
 
 def _get_route_data():
-    if 'route.json' not in _DATA_CACHE:
-        _DATA_CACHE['route.json'] = _load_json('route.json')
-    return _DATA_CACHE['route.json']
+    data_cache = current_network().data_cache
+    if 'route.json' not in data_cache:
+        data_cache['route.json'] = _load_json('route.json')
+    return data_cache['route.json']
 
 def _get_station_data():
-    if 'station.json' not in _DATA_CACHE:
-        _DATA_CACHE['station.json'] = _load_json('station.json')
-    return _DATA_CACHE['station.json']
+    data_cache = current_network().data_cache
+    if 'station.json' not in data_cache:
+        data_cache['station.json'] = _load_json('station.json')
+    return data_cache['station.json']
 
 def _get_color_data():
-    if 'color.json' not in _DATA_CACHE:
-        _DATA_CACHE['color.json'] = _load_json('color.json')
-    return _DATA_CACHE['color.json']
+    data_cache = current_network().data_cache
+    if 'color.json' not in data_cache:
+        data_cache['color.json'] = _load_json('color.json')
+    return data_cache['color.json']
 
 def _get_trans_data():
-    if 'trans_name.json' not in _DATA_CACHE:
-        _DATA_CACHE['trans_name.json'] = _load_json('trans_name.json')
-    return _DATA_CACHE['trans_name.json']
+    data_cache = current_network().data_cache
+    if 'trans_name.json' not in data_cache:
+        data_cache['trans_name.json'] = _load_json('trans_name.json')
+    return data_cache['trans_name.json']
+
+def _service_station_names(services):
+    """交路列表中出现的全部站名（去重，保持顺序）"""
+    seen = {}
+    for service in services if isinstance(services, list) else []:
+        stations = service.get('stations') if isinstance(service, dict) else None
+        for name in stations if isinstance(stations, list) else []:
+            if isinstance(name, str):
+                seen.setdefault(name, None)
+    return list(seen)
+
+def _get_display_names():
+    """站点英文显示名表，trans_name.json/station.json 缓存被替换后自动重建"""
+    _get_trans_data()
+    _get_station_data()
+    return _build_display_names(current_network().data_cache)
+
+def _build_display_names(data_cache):
+    trans_data = data_cache.get('trans_name.json')
+    station_data = data_cache.get('station.json')
+    station_names = station_data.keys() if isinstance(station_data, dict) else ()
+    return _derived(data_cache, 'display_names', (trans_data, station_data),
+                    lambda: DisplayNameTable(trans_data, station_names))
+
+def _get_network_index():
+    """基于数据缓存构建的线路网络索引，route.json/station.json 缓存被替换后自动重建"""
+    _get_route_data()
+    _get_station_data()
+    return _build_network_index(current_network().data_cache)
+
+def _build_network_index(data_cache):
+    route_data = data_cache.get('route.json')
+    station_data = data_cache.get('station.json')
+    return _derived(data_cache, 'network_index', (route_data, station_data),
+                    lambda: NetworkIndex(route_data, station_data))
+
+def _derived(data_cache, key, sources, build):
+    """
+    data_cache 中的派生对象，按来源对象的身份缓存为 (来源, 派生对象)
+
+    来源对象被替换（数据文件重载）后调用 build() 重新构建。
+    """
+    cached = data_cache.get(key)
+    if cached is not None and len(cached[0]) == len(sources) and all(a is b for a, b in zip(cached[0], sources)):
+        CACHE_LOOKUPS.inc(key, 'hit')
+        return cached[1]
+    CACHE_LOOKUPS.inc(key, 'miss')
+    value = build()
+    data_cache[key] = (sources, value)
+    return value
 
 def _line_code_from_key(line_key):
+    return line_code_from_key(line_key)
+
+def _build_transfer_badges(line_name, transfer_codes):
+    """根据换乘线路代码构造显示名与徽章（排除当前线路）"""
+    tools = _tools()
+    network_index = _get_network_index()
+    lines_display = []
+    badges = []
     try:
-        part = line_key.split('_')[1]
+        for code in transfer_codes or []:
+            if network_index.is_current_line_code(code, line_name):
+                continue
+            key = line_key_from_code(code)
+            if tools is not None:
+                lines_display.append(tools.get_line_display_name(key))
+                color = tools.get_line_color(key)
+            else:
+                lines_display.append(fallback_get_line_display_name(key))
+                color = fallback_get_line_color(key)
+            badges.append({'code': key[5:], 'color': color})
     except Exception:
-        return None
-    s = str(part).strip()
-    if s.isdigit():
-        return str(int(s))
-    else:
-        return s
+        pass
+    return lines_display, badges
 
+@_timed('fallback')
 def fallback_get_line_display_name(line_key):
     route_data = _get_route_data()
     d = route_data.get(line_key, {})
@@ -2303,6 +2528,7 @@ def fallback_get_line_display_name(line_key):
         return full_name.split('-')[0]
     return full_name
 
+@_timed('fallback')
 def fallback_get_line_en_name(line_key):
     route_data = _get_route_data()
     d = route_data.get(line_key, {})
@@ -2315,49 +2541,31 @@ def fallback_get_line_en_name(line_key):
         return f"Line {part}"
     return line_key
 
+@_timed('fallback')
 def fallback_get_line_color(line_key):
     color_data = _get_color_data()
     return color_data.get(line_key)
 
+@_timed('fallback')
 def fallback_get_routes_for_line(line_key):
-    route_data = _get_route_data()
-    d = route_data.get(line_key, {})
-    services = d.get('services', [])
-    names = []
-    for s in services:
-        name = s.get('type') or s.get('service_name')
-        if name:
-            names.append(name)
-    return names
+    return list(_get_network_index().routes(line_key))
 
+@_timed('fallback')
 def fallback_get_terminal_station(line_key, route_name):
-    route_data = _get_route_data()
-    d = route_data.get(line_key, {})
-    services = d.get('services', [])
-    for s in services:
-        name = s.get('type') or s.get('service_name')
-        if name == route_name:
-            stations = s.get('stations', [])
-            if stations:
-                return stations[-1]
+    stations = _get_network_index().stations(line_key, route_name)
+    if stations:
+        return stations[-1]
     return None
 
+@_timed('fallback')
 def fallback_get_line_map_info(line_key, route_name):
-    route_data = _get_route_data()
-    station_data = _get_station_data()
+    network_index = _get_network_index()
+    station_data = network_index.station_data
     trans_data = _get_trans_data()
-    d = route_data.get(line_key, {})
-    services = d.get('services', [])
-    target = None
-    for s in services:
-        name = s.get('type') or s.get('service_name')
-        if name == route_name:
-            target = s
-            break
-    if target is None:
+    stations = network_index.stations(line_key, route_name)
+    if stations is None:
         return None
-    stations = target.get('stations', [])
-    line_code = _line_code_from_key(line_key)
+    line_code = network_index.line_code(line_key)
     result = []
     for name in stations:
         entry = {
@@ -2376,23 +2584,15 @@ def fallback_get_line_map_info(line_key, route_name):
             # 统一处理站点所在线路代码，支持数字与字母数字（如 S3）
             codes_all = []
             for rec in info:
-                raw_code = rec[0]
-                code_str = str(raw_code).strip()
                 # 规范化：数字去掉前导0，其它保持原样（例如 S3）
-                if code_str.isdigit():
-                    code_norm = str(int(code_str))
-                else:
-                    code_norm = code_str
                 idx = rec[1] if len(rec) > 1 else None
-                codes_all.append([code_norm, idx])
-            # 当前线路代码统一为字符串，用于比较
-            current_code_norm = str(line_code) if line_code is not None else None
+                codes_all.append([canonical_line_code(rec[0]), idx])
             # 站点索引保留所有线路的 [code, idx]
             indices = codes_all
             # 排除当前线路后的换乘线路
             transfer_lines = []
             for c, _ in codes_all:
-                if current_code_norm is None or c != current_code_norm:
+                if c != line_code:
                     transfer_lines.append(c)
             # 设置基础字段
             entry['station_index'] = indices
@@ -2414,35 +2614,245 @@ def fallback_get_line_map_info(line_key, route_name):
         result.append(entry)
     return result
 
+@_timed('fallback')
 def fallback_get_station_info(line_key, route_name):
-    route_data = _get_route_data()
     trans_data = _get_trans_data()
-    d = route_data.get(line_key, {})
-    services = d.get('services', [])
-    target = None
-    for s in services:
-        name = s.get('type') or s.get('service_name')
-        if name == route_name:
-            target = s
-            break
-    if target is None:
+    stations = _get_network_index().stations(line_key, route_name)
+    if stations is None:
         return []
-    stations = target.get('stations', [])
     return [{'station_name': n, 'station_name_en': trans_data.get(n, n)} for n in stations]
 
+@_timed('fallback')
 def fallback_get_all_lines():
     route_data = _get_route_data()
     return list(route_data.keys())
 
 
-if __name__ == '__main__':
-    # 创建必要的目录
+def _memory_budget_bytes():
+    adv = load_global_config().get("advance_settings", {}) or {}
+    budget_mb = adv.get("city_memory_budget_mb") if adv.get("enable_advance_settings", False) else None
+    try:
+        return int(float(budget_mb) * 1024 * 1024) if budget_mb is not None else None
+    except (TypeError, ValueError):
+        return None
+
+# 城市网络注册表：默认城市在启动时加载，其他城市在首次请求时加载并按内存预算淘汰
+city_registry = CityRegistry(_load_city_network, memory_budget=_memory_budget_bytes(), on_evict=_on_city_evicted)
+city_registry.set_default(_read_city_config())
+
+@app.before_request
+def _start_request_timer():
+    # 最先注册，计时包含城市选择
+    g.request_start = time.perf_counter()
+    if _request_timing is not None:
+        g.request_timer = RequestTimer()
+
+@app.before_request
+def _select_city_network():
+    """
+    按 URL 前缀（/city/<城市>/...）或请求头 X-PIS-City 选择本次请求的城市，
+    按 ?train=<编号> 或请求头 X-PIS-Train 选择列车会话
+    """
+    city = request.environ.get('pis.city') or request.headers.get('X-PIS-City')
+    train_id = request.args.get('train') or request.headers.get('X-PIS-Train')
+    if train_id and not TRAIN_ID_PATTERN.match(train_id):
+        return jsonify({'status': 'error', 'message': f"无效的列车编号 '{train_id}'"}), 400
+    try:
+        with _phase('city'):
+            network = city_registry.get(city) if city else city_registry.get_default()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    g.train_id = train_id or None
+    with network.lock:
+        network.active_requests += 1
+    g.network = network
+    # 多进程模式下修改状态的请求在整个处理期间持有该列车记录的写锁，读取—修改—写入不会与其他工作进程交错
+    if _shared_state is not None and request.method == 'POST' and _is_state_write(request.url_rule):
+        record = _shared_state.record(network.city, g.train_id)
+        record.acquire()
+        g.state_record = record
+
+def _is_state_write(rule):
+    return rule is not None and (rule.rule.startswith('/api/state/') or rule.rule == '/api/update_state')
+
+@app.after_request
+def _record_request_metrics(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+    HTTP_LATENCY.observe(elapsed, route, request.method)
+    network = g.get('network')
+    if network is not None and request.method == 'POST' and _is_state_write(request.url_rule):
+        KEYPRESS_LATENCY.observe(elapsed, network.city, g.get('train_id') or 'default')
+    return response
+
+@app.after_request
+def _emit_request_timing(response):
+    timer = g.get('request_timer')
+    if timer is None:
+        return response
+    total = timer.total()
+    response.headers['Server-Timing'] = timer.server_timing(total)
+    network = g.get('network')
+    _request_timing.record({
+        'time': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'city': network.city if network is not None else None,
+        'train': g.get('train_id'),
+        'total_ms': round(total * 1000, 3),
+        'phases': timer.summary()
+    })
+    return response
+
+@app.route('/api/debug/timings', methods=['GET'])
+def api_debug_timings():
+    """API接口：最近请求的分阶段耗时（最新的在前），需在高级设置中启用 request_timing"""
+    if _request_timing is None:
+        return jsonify({'status': 'success', 'enabled': False, 'requests': []})
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'limit 必须为整数'}), 400
+    return jsonify({
+        'status': 'success',
+        'enabled': True,
+        'capacity': _request_timing.capacity,
+        'recorded': _request_timing.recorded,
+        'requests': _request_timing.recent(max(limit, 1))
+    })
+
+@metrics.collector
+def _collect_component_metrics():
+    """各组件已有的统计数：城市注册表、状态写回、SSE 推送、配置与线路图缓存"""
+    registry = city_registry.stats()
+    networks = city_registry.networks()
+    persister = _state_persister
+    stream = _state_broadcaster.stats()
+    config = get_global_config_stats()
+    families = [
+        ('pis_city_loads_total', 'counter', '城市网络加载次数', [({}, registry['loads'])]),
+        ('pis_city_evictions_total', 'counter', '城市网络因内存预算被淘汰的次数', [({}, registry['evictions'])]),
+        ('pis_city_data_bytes', 'gauge', '已加载城市的数据估算内存（字节）', [({'city': n.city}, n.size) for n in networks]),
+        ('pis_city_sessions', 'gauge', '已加载城市的列车会话数', [({'city': n.city}, len(n.sessions)) for n in networks]),
+        ('pis_city_active_requests', 'gauge', '各城市进行中的请求数', [({'city': n.city}, n.active_requests) for n in networks]),
+        ('pis_state_writes_total', 'counter', '状态文件实际写入次数', [({}, persister.writes)]),
+        ('pis_state_write_seconds_total', 'counter', '状态文件写入累计耗时（秒）', [({}, persister.write_seconds)]),
+        ('pis_state_writes_coalesced_total', 'counter', '被合并（未单独写入）的状态修改次数', [({}, persister.coalesced)]),
+        ('pis_state_stream_subscribers', 'gauge', '状态推送订阅数', [({}, stream['subscribers'])]),
+        ('pis_state_stream_events_total', 'counter', '推送的状态事件数', [({}, stream['published'])]),
+        ('pis_shared_state_pollers', 'gauge', '轮询共享状态记录的线程数（每列车一个）', [({}, _shared_state_poller.active())]),
+        ('pis_global_config_lookups_total', 'counter', '全局配置文件缓存查询次数（miss 为读取磁盘）', [
+            ({'result': 'hit'}, config.get('saved_reads', 0)),
+            ({'result': 'miss'}, config.get('disk_reads', 0))
+        ])
+    ]
+    line_map = []
+    for n in networks:
+        if n.tools is not None:
+            line_map.append(({'city': n.city, 'result': 'hit'}, getattr(n.tools, 'line_map_hits', 0)))
+            line_map.append(({'city': n.city, 'result': 'miss'}, getattr(n.tools, 'line_map_misses', 0)))
+    families.append(('pis_route_tools_line_map_lookups_total', 'counter', 'RouteTools 线路图缓存查询次数', line_map))
+    if _page_cache is not None:
+        page_cache = _page_cache.stats()
+        families.append(('pis_page_cache_entries', 'gauge', '页面渲染缓存条目数', [({}, page_cache['entries'])]))
+        families.append(('pis_page_cache_size_chars', 'gauge', '页面渲染缓存总大小（字符）', [({}, page_cache['size'])]))
+        families.append(('pis_page_cache_evictions_total', 'counter', '页面渲染缓存淘汰次数', [({}, page_cache['evictions'])]))
+    return families
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """运行指标（Prometheus 文本格式）"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.teardown_request
+def _release_city_network(_exc=None):
+    record = g.pop('state_record', None)
+    if record is not None:
+        record.release()
+    network = g.pop('network', None)
+    if network is not None:
+        with network.lock:
+            network.active_requests -= 1
+
+def enable_shared_state(directory=None):
+    """启用多进程共享状态，记录文件默认位于 states/shared；平台不支持时保持单进程模式"""
+    global _shared_state
+    if _shared_state is None:
+        try:
+            _shared_state = SharedStateStore(directory or os.path.join(STATES_DIR, 'shared'))
+        except Exception as e:
+            print(f"启用共享状态失败，状态仅保存在本进程内: {e}")
+    return _shared_state
+
+# Jinja 字节码缓存目录：模板编译结果跨重启复用
+TEMPLATE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'jinja')
+_template_cache = None
+
+def enable_template_cache(directory=None):
+    """启用模板字节码磁盘缓存；目录不可写时跳过（每次启动重新编译）"""
+    global _template_cache
+    if _template_cache is None:
+        try:
+            _template_cache = TemplateBytecodeCache(directory or TEMPLATE_CACHE_DIR)
+            app.jinja_env.bytecode_cache = _template_cache
+        except Exception as e:
+            print(f"启用模板字节码缓存失败: {e}")
+    return _template_cache
+
+def precompile_page_templates():
+    """启动时预先编译全部页面模板并打印报告，开机后第一次访问各页面不再等待编译"""
+    report = precompile_templates(app.jinja_env, _template_cache)
+    print(format_precompile_report(report))
+    return report
+
+def create_app(shared_state=True, watch_data_dir=None):
+    """
+    应用工厂：供多进程 WSGI 服务器在每个工作进程中调用，如
+        gunicorn -w 4 -b 0.0.0.0:8089 'app:create_app()'
+
+    Args:
+        shared_state: 是否启用共享内存状态，使各工作进程看到同一份列车状态
+        watch_data_dir: 是否监视数据目录，默认按高级设置 watch_data_dir
+    """
     ensure_directories()
-    
+    adv = load_global_config().get("advance_settings", {}) or {}
+    enable_adv = adv.get("enable_advance_settings", False)
+    if shared_state:
+        enable_shared_state()
+    if not enable_adv or adv.get("template_bytecode_cache", True):
+        enable_template_cache()
+    if not enable_adv or adv.get("precompile_templates", True):
+        precompile_page_templates()
+    if watch_data_dir is None:
+        watch_data_dir = not enable_adv or adv.get("watch_data_dir", True)
+    # 监视数据目录，外部修改数据文件后按文件重载
+    if watch_data_dir:
+        _start_data_watcher()
+    return app
+
+
+if __name__ == '__main__':
+    # 开发服务器为单进程，不需要共享状态
+    create_app(shared_state=False)
+
     # 加载高级设置
     config = load_global_config()
     adv = config.get("advance_settings", {})
     enable_adv = adv.get("enable_advance_settings", False)
+
+    # 预热线路图缓存，使开机后第一次按键与之后同样快
+    tools = _tools()
+    if enable_adv and adv.get("warm_up_line_map_cache", False) and tools is not None:
+        warm_start = time.perf_counter()
+        def _warm_up_progress(done, total):
+            print(f"预热线路图缓存: {done}/{total}")
+        warmed = tools.warm_up_line_map_cache(processes=adv.get("warm_up_processes"), progress=_warm_up_progress)
+        print(f"线路图缓存预热完成: {warmed} 个交路，用时 {time.perf_counter() - warm_start:.2f}s")
     
     host = '127.0.0.1'
     port = 8089
@@ -2459,7 +2869,6 @@ if __name__ == '__main__':
         try:
             import webview
             import threading
-            import time
 
             def run_server():
                 # 窗口模式下关闭 debug 以避免重复启动
@@ -16,7 +16,7 @@ function updateTime() {
 // 初始更新时间并设置定时器
 document.addEventListener('DOMContentLoaded', () => {
     updateTime();
-    setInterval(updateTime, 60000); // 每分钟更新一次
+    pisNative.setInterval.call(window, updateTime, 60000); // 每分钟更新一次（外壳定时器，切换视图时保留）
 });
 
 // 获取线路颜色
@@ -108,22 +108,267 @@ function handleError(error, elementId = null) {
     }
 }
 
+// 多城市部署时页面位于 /city/<城市>/ 前缀下，站内路径需要带上该前缀；
+// 指定了列车编号（?train=）时同时带上编号，使页面与接口使用同一列车的状态
+function pisUrl(path) {
+    let url = (window.PIS_BASE || '') + path;
+    if (window.PIS_TRAIN) {
+        url += (url.includes('?') ? '&' : '?') + 'train=' + encodeURIComponent(window.PIS_TRAIN);
+    }
+    return url;
+}
+
+// 本页面的客户端编号：状态推送中带有该编号的修改由本页面发起，无需再次刷新
+const PIS_CLIENT_ID = Math.random().toString(36).slice(2) + Date.now().toString(36);
+
+// 请求站内接口（带城市前缀、列车编号与客户端编号）
+function pisFetch(path, options = {}) {
+    const headers = Object.assign({}, options.headers || {}, { 'X-PIS-Client': PIS_CLIENT_ID });
+    return fetch(pisUrl(path), Object.assign({}, options, { headers }));
+}
+
+// 订阅状态推送：其他屏幕或控制端修改了本列车的状态时刷新本页面
+function startStateStream() {
+    if (!window.EventSource || window.PIS_STATIC) return;
+    const source = new EventSource(pisUrl('/api/state/stream'));
+    let version = null;
+    source.addEventListener('snapshot', event => {
+        const data = JSON.parse(event.data);
+        // 断线重连后若期间状态有变化，同样刷新
+        if (version !== null && data.version > version) {
+            onRemoteStateChange(data);
+        }
+        version = data.version;
+    });
+    source.addEventListener('state', event => {
+        const data = JSON.parse(event.data);
+        if (version !== null && data.version <= version) return;
+        version = data.version;
+        if (data.origin !== PIS_CLIENT_ID) {
+            onRemoteStateChange(data);
+        }
+    });
+}
+
+function onRemoteStateChange(data) {
+    if (typeof window.onPisStateChange === 'function') {
+        window.onPisStateChange(data);
+    } else if (pisPath() === '/schedule' && typeof window.refreshSchedulePage === 'function') {
+        window.refreshSchedulePage();
+    } else {
+        pisRefreshView();
+    }
+}
+
+document.addEventListener('DOMContentLoaded', startStateStream);
+
+// 去掉城市前缀后的当前页面路径
+function pisPath() {
+    const base = window.PIS_BASE || '';
+    const path = window.location.pathname;
+    if (base && path.startsWith(base)) {
+        return path.slice(base.length) || '/';
+    }
+    return path;
+}
+
+// 单页外壳：按键操作后从 /api/view/<页面> 获取视图并局部替换 head/header/content/scripts 区域，
+// 已解析的样式、字体与公共脚本保留，不再整页刷新；任何一步失败都回退为整页加载
+const PIS_VIEW_PAGES = {
+    '/': 'index',
+    '/line_map': 'line_map',
+    '/line_detail': 'line_detail',
+    '/arrival': 'arrival',
+    '/schedule': 'schedule'
+};
+
+// 外壳自身使用的原生定时器与事件注册（页面脚本使用的版本会被记录，切换视图时清理）
+const pisNative = {
+    setInterval: window.setInterval,
+    setTimeout: window.setTimeout,
+    addWindowListener: window.addEventListener,
+    addDocumentListener: document.addEventListener
+};
+let pisShownPath = null;
+let pisViewCleanups = [];
+let pisViewReady = null;
+
+function pisSpaEnabled() {
+    return !window.PIS_STATIC && window.PIS_SPA !== false && !!window.history.pushState && !!PIS_VIEW_PAGES[pisShownPath];
+}
+
+function pisFullLoad(path, push) {
+    if (push) {
+        window.location.href = pisUrl(path);
+    } else {
+        window.location.reload();
+    }
+}
+
+// 刷新当前视图（状态变化后）
+function pisRefreshView() {
+    return pisShowView(pisPath(), false);
+}
+
+function pisShowView(path, push) {
+    const page = PIS_VIEW_PAGES[path];
+    if (!page || !pisSpaEnabled()) {
+        pisFullLoad(path, push);
+        return Promise.resolve();
+    }
+    return pisFetch('/api/view/' + page)
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(view => {
+            const pageChanged = path !== pisShownPath;
+            if (push && pageChanged) {
+                window.history.pushState({ pisPath: path }, '', pisUrl(path));
+            }
+            pisApplyView(view);
+            pisShownPath = path;
+        })
+        .catch(err => {
+            console.error('局部刷新失败，改为整页加载:', err);
+            pisFullLoad(path, push);
+        });
+}
+
+function pisFindRegion(name) {
+    const walker = document.createTreeWalker(document, NodeFilter.SHOW_COMMENT);
+    let start = null;
+    while (walker.nextNode()) {
+        const data = walker.currentNode.data.trim();
+        if (data === 'pis-view:' + name) {
+            start = walker.currentNode;
+        } else if (start && data === '/pis-view:' + name) {
+            return [start, walker.currentNode];
+        }
+    }
+    return null;
+}
+
+// 替换两个注释标记之间的节点，返回新内容中需要执行的脚本源码
+function pisReplaceRegion(name, html) {
+    const region = pisFindRegion(name);
+    if (!region) throw new Error('缺少视图区域: ' + name);
+    const [start, end] = region;
+    while (start.nextSibling && start.nextSibling !== end) {
+        start.parentNode.removeChild(start.nextSibling);
+    }
+    // template 中解析出的脚本不会自动执行，由 pisRunViewScripts 统一执行
+    const template = document.createElement('template');
+    template.innerHTML = html;
+    const sources = Array.from(template.content.querySelectorAll('script'))
+        .filter(script => !script.type || /javascript|ecmascript/i.test(script.type))
+        .map(script => script.textContent);
+    end.parentNode.insertBefore(template.content, end);
+    return sources;
+}
+
+function pisApplyView(view) {
+    pisViewCleanups.forEach(cleanup => {
+        try { cleanup(); } catch (e) { /* 忽略已失效的监听 */ }
+    });
+    pisViewCleanups = [];
+
+    document.title = view.title;
+    if (view.theme) {
+        document.body.setAttribute('data-theme', view.theme);
+    } else {
+        document.body.removeAttribute('data-theme');
+    }
+    const baseStyle = document.getElementById('pis-base-style');
+    if (baseStyle) baseStyle.textContent = view.base_style;
+
+    // head 中的页面样式含随状态变化的值（线路色、车厢缩放、班次行数等），同一页面也需替换
+    let sources = pisReplaceRegion('head', view.regions.head);
+    sources = sources.concat(pisReplaceRegion('header', view.regions.header));
+    sources = sources.concat(pisReplaceRegion('content', view.regions.content));
+    sources = sources.concat(pisReplaceRegion('scripts', view.regions.scripts));
+    pisRunViewScripts(sources);
+    updateTime();
+}
+
+// 执行视图脚本：整体包在一个块中，避免与上一次视图的顶层 const/let 重复声明；
+// 脚本中注册的 DOMContentLoaded/load 回调在执行完后立即调用
+function pisRunViewScripts(sources) {
+    const readyCallbacks = [];
+    let failed = null;
+    const onError = event => { failed = event.error || event.message; };
+    pisViewReady = readyCallbacks;
+    pisNative.addWindowListener.call(window, 'error', onError);
+    try {
+        const script = document.createElement('script');
+        script.textContent = '{\n' + sources.join('\n;\n') + '\n}';
+        document.body.appendChild(script);
+        script.remove();
+        readyCallbacks.forEach(callback => callback.call(document, new Event('DOMContentLoaded')));
+    } finally {
+        pisViewReady = null;
+        window.removeEventListener('error', onError);
+    }
+    if (failed) {
+        throw new Error('视图脚本执行失败: ' + failed);
+    }
+}
+
+// 记录页面脚本注册的定时器与 window/document 事件，切换视图时统一清理
+function pisTrackViewResources() {
+    window.setInterval = function(...args) {
+        const id = pisNative.setInterval.apply(window, args);
+        pisViewCleanups.push(() => clearInterval(id));
+        return id;
+    };
+    // 单次定时器触发后即从清理列表移除，避免长时间停留在同一视图时列表持续增长
+    window.setTimeout = function(callback, delay, ...rest) {
+        if (typeof callback !== 'function') {
+            return pisNative.setTimeout.call(window, callback, delay, ...rest);
+        }
+        const cleanup = () => clearTimeout(id);
+        const id = pisNative.setTimeout.call(window, (...args) => {
+            const index = pisViewCleanups.indexOf(cleanup);
+            if (index !== -1) pisViewCleanups.splice(index, 1);
+            callback(...args);
+        }, delay, ...rest);
+        pisViewCleanups.push(cleanup);
+        return id;
+    };
+    const wrapListener = (target, native) => function(type, listener, options) {
+        if (pisViewReady && (type === 'DOMContentLoaded' || type === 'load')) {
+            pisViewReady.push(listener);
+            return;
+        }
+        native.call(target, type, listener, options);
+        pisViewCleanups.push(() => target.removeEventListener(type, listener, options));
+    };
+    window.addEventListener = wrapListener(window, pisNative.addWindowListener);
+    document.addEventListener = wrapListener(document, pisNative.addDocumentListener);
+}
+
+window.addEventListener('popstate', () => {
+    if (PIS_VIEW_PAGES[pisPath()] && pisShownPath) {
+        pisShowView(pisPath(), false);
+    }
+});
+
 // 页面跳转函数
 function navigateTo(page) {
-    window.location.href = page;
+    pisShowView(page, true);
 }
 
 function updateSchedule(direction) {
     const endpoint = direction === 'prev' ? '/api/state/schedule/prev' : '/api/state/schedule/next';
-    fetch(endpoint, { method: 'POST' })
+    pisFetch(endpoint, { method: 'POST' })
         .then(response => response.json())
         .then(data => {
             if (data.status === 'success') {
                 console.log('已切换班次:', data.schedule_index);
-                if (window.location.pathname === '/schedule' && typeof window.applyScheduleData === 'function') {
+                if (pisPath() === '/schedule' && typeof window.applyScheduleData === 'function') {
                     window.applyScheduleData(data);
                 } else {
-                    window.location.reload();
+                    pisRefreshView();
                 }
             } else {
                 console.error('切换班次失败:', data.message);
@@ -142,6 +387,17 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // 键盘快捷键监听
 document.addEventListener('keydown', function(event) {
+    // 静态导出的页面（tools/export_static.py）：按键跳转到导出时预先连接的目标页面，不请求接口
+    if (window.PIS_STATIC) {
+        const key = event.key.length === 1 ? event.key.toLowerCase() : event.key;
+        const target = window.PIS_STATIC.nav[key];
+        if (target) {
+            window.location.href = target;
+            return;
+        }
+        // 只保留不依赖服务器的 M 键
+        if (key !== 'm') return;
+    }
     // 1 -> 首页, 2 -> 线路图, 3 -> 线路详情, 4 -> 到站, 5 -> 班次
     if (event.key === '1') {
         navigateTo('/');
@@ -152,7 +408,7 @@ document.addEventListener('keydown', function(event) {
     } else if (event.key === '4') {
             navigateTo('/arrival');
     } else if (event.key === '5') {
-            if (window.location.pathname === '/schedule') {
+            if (pisPath() === '/schedule') {
                 if (typeof window.refreshSchedulePage === 'function') {
                     window.refreshSchedulePage();
                 }
@@ -161,11 +417,11 @@ document.addEventListener('keydown', function(event) {
             navigateTo('/schedule');
         } else if (event.key.toLowerCase() === 't') {
             // T 键 -> 切换开门侧
-            fetch('/api/state/door/toggle', { method: 'POST' })
+            pisFetch('/api/state/door/toggle', { method: 'POST' })
                 .then(response => response.json())
                 .then(data => {
                     if (data.status === 'success') {
-                        window.location.reload();
+                        pisRefreshView();
                     }
                 });
         } else if (event.key.toLowerCase() === 'm') {
@@ -180,7 +436,7 @@ document.addEventListener('keydown', function(event) {
             }
         } else if (event.key.toLowerCase() === 'f') {
             // F 键 -> 切换到下一站（不刷新）
-            fetch('/api/state/next_no_refresh', { method: 'POST' })
+            pisFetch('/api/state/next_no_refresh', { method: 'POST' })
                 .then(response => response.json())
                 .then(data => {
                     if (data.status === 'success') {
@@ -188,106 +444,106 @@ document.addEventListener('keydown', function(event) {
                     }
                 });
         } else if (event.key.toLowerCase() === 'd') {
-        if (window.location.pathname === '/schedule' && typeof window.switchScheduleStation === 'function') {
+        if (pisPath() === '/schedule' && typeof window.switchScheduleStation === 'function') {
             window.switchScheduleStation('next');
             return;
         }
         // D 键 -> 下一站
-        fetch('/api/state/next', { method: 'POST' })
+        pisFetch('/api/state/next', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换至下一站:', data.next_station);
-                window.location.reload(); // 刷新页面以更新显示
+                pisRefreshView(); // 局部刷新以更新显示
             })
             .catch(err => console.error('切换下一站失败:', err));
     } else if (event.key.toLowerCase() === 'a') {
-        if (window.location.pathname === '/schedule' && typeof window.switchScheduleStation === 'function') {
+        if (pisPath() === '/schedule' && typeof window.switchScheduleStation === 'function') {
             window.switchScheduleStation('prev');
             return;
         }
         // A 键 -> 上一站
-        fetch('/api/state/prev', { method: 'POST' })
+        pisFetch('/api/state/prev', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换至上一站:', data.next_station);
-                window.location.reload(); // 刷新页面以更新显示
+                pisRefreshView(); // 局部刷新以更新显示
             })
             .catch(err => console.error('切换上一站失败:', err));
     } else if (event.key.toLowerCase() === 'r') {
         // R 键 -> 一键反向
-        fetch('/api/state/reverse', { method: 'POST' })
+        pisFetch('/api/state/reverse', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换方向:', data.direction === 0 ? '正向' : '反向');
-                window.location.reload();
+                pisRefreshView();
             })
             .catch(err => console.error('切换方向失败:', err));
     } else if (event.key.toLowerCase() === 's') {
-        if (window.location.pathname === '/schedule') {
+        if (pisPath() === '/schedule') {
             updateSchedule('next');
             return;
         }
         // S 键 -> 切换下一个路由
-        fetch('/api/state/route/next', { method: 'POST' })
+        pisFetch('/api/state/route/next', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换路由:', data.route_name);
-                window.location.reload();
+                pisRefreshView();
             })
             .catch(err => console.error('切换路由失败:', err));
     } else if (event.key.toLowerCase() === 'w') {
-        if (window.location.pathname === '/schedule') {
+        if (pisPath() === '/schedule') {
             updateSchedule('prev');
             return;
         }
         // W 键 -> 切换上一个路由
-        fetch('/api/state/route/prev', { method: 'POST' })
+        pisFetch('/api/state/route/prev', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换路由:', data.route_name);
-                window.location.reload();
+                pisRefreshView();
             })
             .catch(err => console.error('切换路由失败:', err));
     } else if (event.key.toLowerCase() === 'l') {
-        if (window.location.pathname === '/schedule' && typeof window.switchScheduleLine === 'function') {
+        if (pisPath() === '/schedule' && typeof window.switchScheduleLine === 'function') {
             window.switchScheduleLine('next');
             return;
         }
         // L 键 -> 切换下一条线路
-        fetch('/api/state/line/next', { method: 'POST' })
+        pisFetch('/api/state/line/next', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换至线路:', data.line_name);
-                window.location.reload();
+                pisRefreshView();
             })
             .catch(err => console.error('切换线路失败:', err));
     } else if (event.key.toLowerCase() === 'k') {
-        if (window.location.pathname === '/schedule' && typeof window.switchScheduleLine === 'function') {
+        if (pisPath() === '/schedule' && typeof window.switchScheduleLine === 'function') {
             window.switchScheduleLine('prev');
             return;
         }
         // K 键 -> 切换上一条线路
-        fetch('/api/state/line/prev', { method: 'POST' })
+        pisFetch('/api/state/line/prev', { method: 'POST' })
             .then(response => response.json())
             .then(data => {
                 console.log('已切换至线路:', data.line_name);
-                window.location.reload();
+                pisRefreshView();
             })
             .catch(err => console.error('切换线路失败:', err));
     } else if (event.key.toLowerCase() === 'i') {
         // i 键 -> 单行模式 (仅在页面2/线路图生效)
-        if (window.location.pathname === '/line_map') {
+        if (pisPath() === '/line_map') {
             updateLayout('one_line');
-        } else if (window.location.pathname === '/') {
+        } else if (pisPath() === '/') {
             updateRunStyle('default');
-        } else if (window.location.pathname === '/line_detail') {
+        } else if (pisPath() === '/line_detail') {
             updateDetailStyle('default');
         }
     } else if (event.key.toLowerCase() === 'o') {
         // o 键 -> 双行模式 (仅在页面2/线路图生效)
-        if (window.location.pathname === '/line_map') {
+        if (pisPath() === '/line_map') {
             updateLayout('two_line');
-        } else if (window.location.pathname === '/') {
+        } else if (pisPath() === '/') {
             // 检查是否存在分支
             const hasBranchesEl = document.getElementById('has-branches');
             const hasBranches = hasBranchesEl && hasBranchesEl.getAttribute('data-value') === 'true';
@@ -298,17 +554,17 @@ document.addEventListener('keydown', function(event) {
             } else {
                 updateRunStyle('detail');
             }
-        } else if (window.location.pathname === '/line_detail') {
+        } else if (pisPath() === '/line_detail') {
             updateDetailStyle('column');
         }
     } else if (event.key === '[') {
         // [ 键 -> 自动模式 (仅在页面2/线路图生效)
-        if (window.location.pathname === '/line_map') {
+        if (pisPath() === '/line_map') {
             updateLayout('auto');
         }
     } else if (event.key.toLowerCase() === 'p') {
         // p 键 -> 正弦波模式 (仅在页面2/线路图生效，非环线)
-        if (window.location.pathname === '/line_map') {
+        if (pisPath() === '/line_map') {
             updateLayout('sine');
         }
     }
@@ -316,7 +572,7 @@ document.addEventListener('keydown', function(event) {
 
 // 更新布局模式
 function updateLayout(mode) {
-    fetch('/api/state/layout', {
+    pisFetch('/api/state/layout', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ mode: mode })
@@ -325,7 +581,7 @@ function updateLayout(mode) {
     .then(data => {
         if (data.status === 'success') {
             console.log('布局模式已更新为:', data.layout);
-            window.location.reload();
+            pisRefreshView();
         } else {
             console.error('更新布局失败:', data.message);
         }
@@ -334,7 +590,7 @@ function updateLayout(mode) {
 }
 
 function updateDetailStyle(style) {
-    fetch('/api/state/detail_style', {
+    pisFetch('/api/state/detail_style', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ style: style })
@@ -342,7 +598,7 @@ function updateDetailStyle(style) {
     .then(response => response.json())
     .then(data => {
         if (data.status === 'success') {
-            window.location.reload();
+            pisRefreshView();
         } else {
             console.error('更新详情样式失败:', data.message);
         }
@@ -351,7 +607,7 @@ function updateDetailStyle(style) {
 }
 
 function updateRunStyle(style) {
-    fetch('/api/state/run_style', {
+    pisFetch('/api/state/run_style', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ style: style })
@@ -359,7 +615,7 @@ function updateRunStyle(style) {
     .then(response => response.json())
     .then(data => {
         if (data.status === 'success') {
-            window.location.reload();
+            pisRefreshView();
         } else {
             console.error('更新首页样式失败:', data.message);
         }
@@ -405,3 +661,10 @@ function throttle(func, limit) {
         }
     };
 }
+
+// 单页外壳初始化：放在文件末尾，公共脚本自身注册的监听与定时器不被视图切换清理
+pisShownPath = pisPath();
+if (pisSpaEnabled()) {
+    window.history.replaceState({ pisPath: pisShownPath }, '', window.location.href);
+    pisTrackViewResources();
+}
@@ -0,0 +1,169 @@
+"""
+接口微基准：对当前城市每条线路 × 交路 × 方向，测量各显示页面与查询接口的耗时，并与 JSON 基线比较。
+
+用法:
+    python tools/bench_endpoints.py [--city chongqing] [--repeat 5]
+    python tools/bench_endpoints.py --save-baseline          # 重新保存基线
+    python tools/bench_endpoints.py --tolerance 0.3          # p95 允许变慢 30%
+
+分别在 RouteTools 路径与 fallback_* 回退路径（tools=None）下测量。基线默认保存在
+tools/bench_endpoints_baseline.json（不存在时首次运行自动保存）；某接口的 p95 比基线慢超过
+容差（且绝对差超过 --min-delta-ms）时视为退化，以非零状态退出。
+基线与机器相关，应在同一台机器上比较。状态写入临时目录，不影响仓库中的状态文件。
+计时时关闭页面渲染缓存：同一状态重复请求会命中缓存，测到的不再是构建与渲染页面的耗时。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TRAIN = 'bench-endpoints'
+ENDPOINTS = ['/', '/line_map', '/line_detail', '/arrival', '/schedule', '/api/schedule/data', '/api/get_station_info']
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_endpoints_baseline.json')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+def combinations(app_module, network):
+    """[(线路, 交路, 方向, 该方向首站)]"""
+    result = []
+    with app_module._use_network(network):
+        index = app_module._get_network_index()
+        for line_name in index.lines():
+            for route_name in index.routes(line_name):
+                stations = index.stations(line_name, route_name)
+                if not stations:
+                    continue
+                result.append((line_name, route_name, 0, stations[0]))
+                result.append((line_name, route_name, 1, stations[-1]))
+    return result
+
+
+def run_mode(app_module, network, combos, repeat):
+    """测量一种模式下各接口的耗时，返回 ({接口: [秒]}, {接口: 失败次数})"""
+    client = app_module.app.test_client()
+    headers = {'X-PIS-City': network.city}
+    timings = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {}
+    for line_name, route_name, direction, first_station in combos:
+        client.post(f'/api/update_state?train={TRAIN}', headers=headers, json={
+            'line_name': line_name,
+            'route_name': route_name,
+            'direction': direction,
+            'next_station': first_station
+        })
+        for endpoint in ENDPOINTS:
+            # 预热一次（模板编译、数据缓存），不计时
+            client.get(f'{endpoint}?train={TRAIN}', headers=headers)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = client.get(f'{endpoint}?train={TRAIN}', headers=headers)
+                timings[endpoint].append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors[endpoint] = errors.get(endpoint, 0) + 1
+    return timings, errors
+
+
+def summarize(timings, errors):
+    return {
+        endpoint: {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 4),
+            'p95_ms': round(percentile(values, 95) * 1000, 4),
+            'errors': errors.get(endpoint, 0)
+        }
+        for endpoint, values in timings.items()
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """返回退化列表 [(模式, 接口, 基线 p95, 当前 p95)]"""
+    regressions = []
+    for mode, endpoints in results.items():
+        for endpoint, row in endpoints.items():
+            base = baseline.get('results', {}).get(mode, {}).get(endpoint)
+            if not base:
+                continue
+            limit = base['p95_ms'] * (1 + tolerance)
+            if row['p95_ms'] > limit and row['p95_ms'] - base['p95_ms'] > min_delta_ms:
+                regressions.append((mode, endpoint, base['p95_ms'], row['p95_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='接口微基准与 p95 退化检查')
+    parser.add_argument('--city', default=None, help='城市（默认使用 city_config.json）')
+    parser.add_argument('--repeat', type=int, default=5, help='每个组合每个接口的计时次数')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线 JSON 文件')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='p95 允许变慢的比例')
+    parser.add_argument('--min-delta-ms', type=float, default=0.2, help='p95 绝对差低于该值时不视为退化')
+    args = parser.parse_args()
+
+    import app as app_module
+
+    states_dir = tempfile.mkdtemp(prefix='pis-bench-endpoints-')
+    app_module.STATES_DIR = states_dir
+    app_module._page_cache = None
+    try:
+        network = app_module.city_registry.get(args.city) if args.city else app_module.city_registry.get_default()
+        combos = combinations(app_module, network)
+        print(f"城市: {network.city}，线路 × 交路 × 方向: {len(combos)}，每个接口计时 {args.repeat} 次")
+
+        results = {}
+        failed = 0
+        tools = network.tools
+        try:
+            for mode in ('tools', 'fallback'):
+                network.tools = tools if mode == 'tools' else None
+                if mode == 'tools' and tools is None:
+                    print('RouteTools 不可用，跳过 tools 模式')
+                    continue
+                timings, errors = run_mode(app_module, network, combos, args.repeat)
+                results[mode] = summarize(timings, errors)
+                failed += sum(errors.values())
+        finally:
+            network.tools = tools
+
+        print(f"{'mode':<9} {'endpoint':<24} {'count':>6} {'p50':>9} {'p95':>9} {'errors':>7}")
+        for mode, endpoints in results.items():
+            for endpoint, row in endpoints.items():
+                print(f"{mode:<9} {endpoint:<24} {row['count']:>6} {row['p50_ms']:>7.3f}ms {row['p95_ms']:>7.3f}ms {row['errors']:>7}")
+
+        current = {'city': network.city, 'repeat': args.repeat, 'results': results}
+        if args.save_baseline or not os.path.exists(args.baseline):
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+            print(f"已保存基线: {args.baseline}")
+            return 1 if failed else 0
+
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('city') != network.city:
+            print(f"基线城市为 {baseline.get('city')}，与当前城市 {network.city} 不同，跳过比较")
+            return 1 if failed else 0
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for mode, endpoint, base_p95, p95 in regressions:
+            print(f"退化: [{mode}] {endpoint} p95 {base_p95:.3f}ms -> {p95:.3f}ms")
+        if failed:
+            print(f"失败请求: {failed}")
+        print('通过' if not regressions and not failed else '失败')
+        return 1 if regressions or failed else 0
+    finally:
+        shutil.rmtree(states_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+NetworkIndex 微基准：比较逐个遍历 services 与索引查询的单次查询耗时。
+
+用法: python tools/bench_network_index.py [--repeat 20000]
+
+随着同一线路交路数量增加，线性遍历的耗时线性上升，而索引查询应保持平稳。
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from network_index import NetworkIndex
+
+
+def build_network(service_count, station_count=30):
+    """构造一条含 service_count 个交路的合成线路"""
+    stations = [f"站{i:03d}" for i in range(station_count)]
+    services = []
+    for i in range(service_count):
+        services.append({
+            'service_name': f"route{i + 1}",
+            'stations': stations[: max(2, station_count - (i % (station_count - 1)))]
+        })
+    route_data = {
+        'line_1': {
+            'line_name': '1号线-Line 1',
+            'type': 'linear',
+            'services': services
+        }
+    }
+    station_data = {name: [["01", f"{i + 1:02d}"]] for i, name in enumerate(stations)}
+    return route_data, station_data
+
+
+def linear_lookup(route_data, line_name, route_name):
+    """旧实现：遍历 services 比较 type/service_name"""
+    for service in route_data.get(line_name, {}).get('services', []):
+        if service.get('type') == route_name or service.get('service_name') == route_name:
+            return service
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NetworkIndex 查询耗时基准')
+    parser.add_argument('--repeat', type=int, default=20000, help='每组查询次数')
+    args = parser.parse_args()
+
+    print(f"{'services':>8} {'linear(ns)':>12} {'index(ns)':>12} {'build(ms)':>10}")
+    for count in (1, 4, 16, 64, 256, 1024):
+        route_data, station_data = build_network(count)
+        # 最坏情况：查询最后一个交路
+        target = f"route{count}"
+
+        start = timeit.default_timer()
+        index = NetworkIndex(route_data, station_data)
+        build_ms = (timeit.default_timer() - start) * 1000
+
+        assert index.service('line_1', target) is linear_lookup(route_data, 'line_1', target)
+
+        linear = timeit.timeit(lambda: linear_lookup(route_data, 'line_1', target), number=args.repeat)
+        indexed = timeit.timeit(lambda: index.service('line_1', target), number=args.repeat)
+        print(f"{count:>8} {linear / args.repeat * 1e9:>12.0f} {indexed / args.repeat * 1e9:>12.0f} {build_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+交路包含关系基准：比较线路图每次渲染时逐个交路检测“大路线”与查询预计算结果的耗时。
+
+用法: python tools/bench_route_containment.py [--services 30] [--stations 40] [--repeat 2000]
+
+构造一条含 --services 个交路的合成线路（全程交路与各种区间交路，部分反向），
+对每个交路分别用旧逻辑（对其余交路取站序后 list.index + 切片，正反各比较一次）
+与 NetworkIndex.containing_route() 查找包含它的最长交路，输出单次查询耗时与索引构建耗时。
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from network_index import NetworkIndex
+
+
+def build_network(service_count, station_count):
+    """构造合成线路：route1 为全程，其余为长度递减、起点错开的区间交路，每隔 3 个反向"""
+    stations = [f"站{i:03d}" for i in range(station_count)]
+    services = [{'service_name': 'route1', 'stations': stations}]
+    for i in range(1, service_count):
+        length = max(2, station_count - i)
+        start = i % (station_count - length + 1)
+        segment = stations[start:start + length]
+        if i % 3 == 0:
+            segment = list(reversed(segment))
+        services.append({'service_name': f"route{i + 1}", 'stations': segment})
+    route_data = {
+        'line_1': {
+            'line_name': '1号线-Line 1',
+            'type': 'linear',
+            'services': services
+        }
+    }
+    station_data = {name: [["01", f"{i + 1:02d}"]] for i, name in enumerate(stations)}
+    return route_data, station_data
+
+
+def is_contiguous_subseq(small, big):
+    """旧实现：small 是否为 big 的连续子序列（同向或反向）"""
+    if not small or not big or len(small) > len(big):
+        return False
+    try:
+        idx = big.index(small[0])
+        if big[idx:idx + len(small)] == small:
+            return True
+    except ValueError:
+        pass
+    small_rev = list(reversed(small))
+    try:
+        idx = big.index(small_rev[0])
+        if big[idx:idx + len(small_rev)] == small_rev:
+            return True
+    except ValueError:
+        pass
+    return False
+
+
+def per_render_lookup(index, line_name, route_name):
+    """旧实现：每次渲染时遍历所有交路并复制站序比较"""
+    current = list(index.stations(line_name, route_name) or [])
+    candidate = None
+    candidate_len = len(current)
+    for r in index.routes(line_name):
+        if r == route_name:
+            continue
+        names = list(index.stations(line_name, r) or [])
+        if len(names) > candidate_len and is_contiguous_subseq(current, names):
+            candidate = r
+            candidate_len = len(names)
+    return candidate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='交路包含关系查询耗时基准')
+    parser.add_argument('--services', type=int, default=30, help='合成线路的交路数量')
+    parser.add_argument('--stations', type=int, default=40, help='全程交路的站点数量')
+    parser.add_argument('--repeat', type=int, default=2000, help='每个交路的查询次数')
+    args = parser.parse_args()
+
+    route_data, station_data = build_network(args.services, args.stations)
+    start = timeit.default_timer()
+    index = NetworkIndex(route_data, station_data)
+    build_ms = (timeit.default_timer() - start) * 1000
+    routes = index.routes('line_1')
+
+    for route in routes:
+        container = index.containing_route('line_1', route)
+        assert (container[0] if container else None) == per_render_lookup(index, 'line_1', route), route
+
+    old = timeit.timeit(lambda: [per_render_lookup(index, 'line_1', r) for r in routes], number=args.repeat)
+    new = timeit.timeit(lambda: [index.containing_route('line_1', r) for r in routes], number=args.repeat)
+    lookups = args.repeat * len(routes)
+    contained = sum(1 for r in routes if index.containing_route('line_1', r))
+    print(f"交路: {len(routes)}，全程站点: {args.stations}，存在包含交路: {contained}")
+    print(f"每次渲染检测: {old / lookups * 1e6:>10.2f} us/次")
+    print(f"预计算查询:   {new / lookups * 1e6:>10.2f} us/次  ({old / new:.0f}x)")
+    print(f"索引构建（含包含关系）: {build_ms:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
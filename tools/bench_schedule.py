@@ -0,0 +1,68 @@
+"""
+班次模型基准：编译 schedule.json 的耗时、每次查询一组班次的耗时，以及 /api/schedule/data 请求耗时。
+
+用法: python tools/bench_schedule.py [--city chongqing] [--repeat 20000]
+
+查询覆盖该城市所有线路、各线路所有站点与两个方向；班次页轮询的主要开销即为一次查询。
+"""
+import argparse
+import os
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='班次模型查询耗时基准')
+    parser.add_argument('--city', default='chongqing', help='城市')
+    parser.add_argument('--repeat', type=int, default=20000, help='查询次数')
+    args = parser.parse_args()
+
+    import app as app_module
+    from schedule_engine import ScheduleEngine
+
+    network = app_module.city_registry.get(args.city)
+    with app_module._use_network(network):
+        index = app_module._get_network_index()
+        schedule_config = app_module._get_schedule_config()
+        names = app_module._get_display_names()
+
+        start = timeit.default_timer()
+        engine = ScheduleEngine(index, schedule_config, names)
+        build_ms = (timeit.default_timer() - start) * 1000
+
+        queries = []
+        for line in index.lines():
+            stations = set()
+            for route in index.routes(line):
+                stations.update(index.stations(line, route) or [])
+            for station in sorted(stations):
+                queries.append((line, station, 0))
+                queries.append((line, station, 1))
+        if not queries:
+            print('该城市没有线路数据')
+            return
+
+        def query(i=[0]):
+            line, station, direction = queries[i[0] % len(queries)]
+            i[0] += 1
+            return engine.entries(line, i[0], direction, station)
+
+        elapsed = timeit.timeit(query, number=args.repeat)
+
+    client = app_module.app.test_client()
+    headers = {'X-PIS-City': args.city}
+    client.get('/api/schedule/data', headers=headers)
+    requests = max(1, args.repeat // 20)
+    request_elapsed = timeit.timeit(lambda: client.get('/api/schedule/data', headers=headers), number=requests)
+
+    print(f"线路: {len(index.lines())}，查询组合: {len(queries)}")
+    print(f"编译班次模型: {build_ms:.2f} ms")
+    print(f"查询一组班次: {elapsed / args.repeat * 1e6:.2f} us/次")
+    print(f"/api/schedule/data: {request_elapsed / requests * 1e6:.0f} us/次（含 Flask 请求处理与 JSON 序列化）")
+
+
+if __name__ == '__main__':
+    main()
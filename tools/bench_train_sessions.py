@@ -0,0 +1,97 @@
+"""
+多列车会话基准：N 个列车会话并发按“下一站”，同时渲染各自的显示页面。
+
+用法: python tools/bench_train_sessions.py [--sessions 1,10,50,100] [--presses 20] [--city chongqing]
+
+每个会话一个线程，循环执行 POST /api/state/next?train=<编号> 与一次页面渲染，
+输出吞吐与按键/渲染的延迟分位数。会话状态写入临时目录，不影响仓库中的状态文件。
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ['/', '/line_map', '/line_detail', '/arrival']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+def run_round(app_module, session_count, presses, city):
+    client_headers = {'X-PIS-City': city} if city else {}
+    press_times = []
+    render_times = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(session_count)
+
+    def worker(n):
+        client = app_module.app.test_client()
+        train = f"bench-{session_count}-{n}"
+        local_press = []
+        local_render = []
+        barrier.wait()
+        for i in range(presses):
+            start = time.perf_counter()
+            r = client.post(f'/api/state/next?train={train}', headers=client_headers)
+            local_press.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                errors.append(r.status_code)
+            page = PAGES[(n + i) % len(PAGES)]
+            start = time.perf_counter()
+            r = client.get(f'{page}?train={train}', headers=client_headers)
+            local_render.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                errors.append(r.status_code)
+        with lock:
+            press_times.extend(local_press)
+            render_times.extend(local_render)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(session_count)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, press_times, render_times, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多列车会话并发基准')
+    parser.add_argument('--sessions', default='1,10,50,100', help='逗号分隔的会话数')
+    parser.add_argument('--presses', type=int, default=20, help='每个会话的按键次数')
+    parser.add_argument('--city', default=None, help='城市（默认使用 city_config.json）')
+    args = parser.parse_args()
+
+    import app as app_module
+
+    states_dir = tempfile.mkdtemp(prefix='pis-bench-states-')
+    app_module.STATES_DIR = states_dir
+    try:
+        print(f"{'sessions':>8} {'ops/s':>10} {'press p50':>10} {'press p95':>10} {'render p50':>11} {'render p95':>11} {'errors':>7}")
+        for count in [int(x) for x in args.sessions.split(',') if x.strip()]:
+            elapsed, press, render, errors = run_round(app_module, count, args.presses, args.city)
+            ops = (len(press) + len(render)) / elapsed if elapsed else 0.0
+            print(f"{count:>8} {ops:>10.1f} {percentile(press, 50) * 1000:>9.2f}ms {percentile(press, 95) * 1000:>9.2f}ms "
+                  f"{percentile(render, 50) * 1000:>10.2f}ms {percentile(render, 95) * 1000:>10.2f}ms {len(errors):>7}")
+        app_module._state_persister.flush()
+        network = app_module.city_registry.get(args.city) if args.city else app_module.city_registry.get_default()
+        print(f"会话数: {len(network.sessions)}，状态写入: {app_module._state_persister.writes}，合并: {app_module._state_persister.coalesced}")
+    finally:
+        shutil.rmtree(states_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+只读 GET 并发检查：多个列车会话并发请求各显示页面与查询接口，确认 GET 不会写入 route.json。
+
+用法: python tools/check_readonly_gets.py [--city chongqing] [--threads 16] [--rounds 10]
+
+将城市数据复制到临时目录，并删除 route.json 中各线路的 run_style / detail_style 字段
+（以前的页面处理函数会在 GET 中补写这些字段并重载数据）。并发请求结束后检查：
+route.json 的内容与修改时间不变、save_json_file 未被调用、数据版本未递增。
+任一项不满足时以非零状态退出。
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHECK_CITY = 'readonly-check'
+PAGES = ['/', '/line_map', '/line_detail', '/arrival', '/schedule',
+         '/api/view/index', '/api/view/line_detail', '/api/state', '/api/schedule/data']
+
+
+def file_signature(path):
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return st.st_mtime_ns, st.st_size, digest
+
+
+def prepare_data(city, work_dir):
+    """复制城市数据并去掉样式字段，返回 route.json 路径"""
+    data_dir = os.path.join(work_dir, CHECK_CITY)
+    shutil.copytree(os.path.join(ROOT, 'data', city), data_dir)
+    route_file = os.path.join(data_dir, 'route.json')
+    with open(route_file, 'r', encoding='utf-8') as f:
+        route_data = json.load(f)
+    for line_cfg in route_data.values():
+        if isinstance(line_cfg, dict):
+            line_cfg.pop('run_style', None)
+            line_cfg.pop('detail_style', None)
+    with open(route_file, 'w', encoding='utf-8') as f:
+        json.dump(route_data, f, ensure_ascii=False, indent=2)
+    return route_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检查并发 GET 不会改写 route.json')
+    parser.add_argument('--city', default='chongqing', help='复制其数据进行检查的城市')
+    parser.add_argument('--threads', type=int, default=16, help='并发线程（列车会话）数')
+    parser.add_argument('--rounds', type=int, default=10, help='每个线程请求全部页面的轮数')
+    args = parser.parse_args()
+
+    import app as app_module
+
+    work_dir = tempfile.mkdtemp(prefix='pis-readonly-check-')
+    app_module.STATES_DIR = os.path.join(work_dir, 'states')
+    app_module._city_data_dir = lambda city: os.path.join(work_dir, city)
+    headers = {'X-PIS-City': CHECK_CITY}
+
+    # 记录 save_json_file 调用（GET 期间不应有任何调用）
+    saves = []
+    original_save = app_module.save_json_file
+
+    def counting_save(file_path, data):
+        saves.append(file_path)
+        return original_save(file_path, data)
+
+    try:
+        route_file = prepare_data(args.city, work_dir)
+        network = app_module.city_registry.get(CHECK_CITY)
+
+        # 各会话先切换到不同线路（POST 只写会话状态文件）
+        setup = app_module.app.test_client()
+        for n in range(args.threads):
+            for _ in range(n):
+                setup.post(f'/api/state/line/next?train=check-{n}', headers=headers)
+
+        before = file_signature(route_file)
+        version_before = network.data_version
+        app_module.save_json_file = counting_save
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(args.threads)
+
+        def worker(n):
+            client = app_module.app.test_client()
+            barrier.wait()
+            for _ in range(args.rounds):
+                for page in PAGES:
+                    r = client.get(f'{page}?train=check-{n}', headers=headers)
+                    if r.status_code != 200:
+                        with lock:
+                            errors.append((n, page, r.status_code))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        app_module.save_json_file = original_save
+
+        after = file_signature(route_file)
+        requests_made = args.threads * args.rounds * len(PAGES)
+        print(f"请求: {requests_made}，非 200 响应: {len(errors)}")
+        print(f"save_json_file 调用: {len(saves)}")
+        print(f"route.json 未变化: {before == after}")
+        print(f"数据版本: {version_before} -> {network.data_version}")
+        for error in errors[:5]:
+            print(f"  错误响应: 会话 {error[0]} {error[1]} -> {error[2]}")
+        ok = not errors and not saves and before == after and version_before == network.data_version
+        print('通过' if ok else '失败')
+        return 0 if ok else 1
+    finally:
+        app_module.save_json_file = original_save
+        app_module._state_persister.flush()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
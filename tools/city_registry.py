@@ -0,0 +1,234 @@
+import itertools
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# 全局单调递增的数据版本号；各城市网络共享，淘汰后重新加载也不会与旧版本重复
+_VERSION_COUNTER = itertools.count(1)
+
+
+def next_data_version():
+    return next(_VERSION_COUNTER)
+
+
+def estimate_size(*objects):
+    """粗略估算对象图占用的内存字节数（递归统计 dict/list/tuple/set 及其元素）"""
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+            stack.append(vars(obj))
+    return total
+
+
+class StateSession:
+    """
+    一列车（会话）的内存状态；session_id 为 None 表示未指定列车的默认会话
+    """
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.state = None
+        self.version = 0
+        self.stat = None
+        self.lock = threading.RLock()
+
+    def bump_version(self):
+        with self.lock:
+            self.version += 1
+            return self.version
+
+
+class CityNetwork:
+    """
+    单个城市已加载的网络：数据目录、数据缓存、RouteTools、应用配置与各列车的状态
+    """
+
+    def __init__(self, city, data_dir):
+        self.city = city
+        self.data_dir = data_dir
+        self.tools = None
+        self.data_cache = {}
+        self.app_config = {}
+        self.sessions = {}
+        self.data_version = next_data_version()
+        # 数据文件指纹（由各文件的修改时间与大小得出），不同进程加载同一份数据时相同
+        self.data_tag = ''
+        self.watcher = None
+        self.size = 0
+        self.active_requests = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.RLock()
+
+    def bump_version(self):
+        self.data_version = next_data_version()
+        return self.data_version
+
+    def session(self, session_id=None):
+        """获取列车会话，不存在时创建"""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = StateSession(session_id)
+            return session
+
+    @property
+    def state(self):
+        """默认会话的状态"""
+        return self.session(None).state
+
+    def measure(self):
+        """重新估算内存占用（不含监视器线程等运行时对象）"""
+        states = [s.state for s in list(self.sessions.values())]
+        self.size = estimate_size(self.data_cache, self.tools, self.app_config, states)
+        return self.size
+
+
+class CityRegistry:
+    """
+    城市网络注册表
+
+    按需加载各城市的网络，按最近使用排序；总占用超过内存预算时按 LRU 淘汰
+    没有进行中请求的城市。默认城市不会被淘汰。
+    """
+
+    def __init__(self, loader, memory_budget=None, on_evict=None):
+        """
+        Args:
+            loader: loader(city) -> CityNetwork，城市不存在时抛出 ValueError
+            memory_budget: 内存预算（字节），None 表示不限制
+            on_evict: 城市被淘汰时的回调 on_evict(network)
+        """
+        self._loader = loader
+        self.memory_budget = memory_budget
+        self._on_evict = on_evict
+        self._networks = OrderedDict()
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.default_city = None
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, city):
+        """获取城市网络，未加载时加载（同一城市的并发请求只加载一次）"""
+        with self._lock:
+            network = self._networks.get(city)
+            if network is not None:
+                self._networks.move_to_end(city)
+                network.last_used = time.monotonic()
+                return network
+            load_lock = self._load_locks.setdefault(city, threading.Lock())
+        try:
+            with load_lock:
+                with self._lock:
+                    network = self._networks.get(city)
+                    if network is not None:
+                        return network
+                network = self._loader(city)
+                network.measure()
+                with self._lock:
+                    self._networks[city] = network
+                    self.loads += 1
+                    self._evict(keep=city)
+                return network
+        finally:
+            # 加载锁只在加载期间保留，加载结束（含失败）后移除，不随请求过的城市名增长
+            with self._lock:
+                if self._load_locks.get(city) is load_lock:
+                    del self._load_locks[city]
+
+    def peek(self, city):
+        """获取已加载的城市网络，不触发加载"""
+        with self._lock:
+            return self._networks.get(city)
+
+    def get_default(self):
+        return self.get(self.default_city)
+
+    def set_default(self, city):
+        """加载城市并设为默认城市（加载期间即视为默认城市，加载失败时恢复）"""
+        with self._lock:
+            previous = self.default_city
+            self.default_city = city
+        try:
+            return self.get(city)
+        except Exception:
+            with self._lock:
+                self.default_city = previous
+            raise
+
+    def networks(self):
+        with self._lock:
+            return list(self._networks.values())
+
+    def total_size(self):
+        with self._lock:
+            return sum(n.size for n in self._networks.values())
+
+    def _evict(self, keep=None):
+        if self.memory_budget is None:
+            return
+        total = sum(n.size for n in self._networks.values())
+        for city in list(self._networks.keys()):
+            if total <= self.memory_budget:
+                break
+            network = self._networks[city]
+            if city in (keep, self.default_city) or network.active_requests > 0:
+                continue
+            del self._networks[city]
+            total -= network.size
+            self.evictions += 1
+            if self._on_evict is not None:
+                try:
+                    self._on_evict(network)
+                except Exception as e:
+                    print(f"淘汰城市 {city} 失败: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'default_city': self.default_city,
+                'loaded': [
+                    {'city': n.city, 'size': n.size, 'active_requests': n.active_requests, 'sessions': len(n.sessions)}
+                    for n in self._networks.values()
+                ],
+                'total_size': sum(n.size for n in self._networks.values()),
+                'memory_budget': self.memory_budget,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
+
+
+class CityPrefixMiddleware:
+    """
+    WSGI 中间件：将 /city/<城市>/... 前缀移入 SCRIPT_NAME，并在 environ['pis.city'] 记录城市名
+
+    应用内部路由保持不变，url_for 与 request.script_root 自动带上城市前缀。
+    """
+
+    PREFIX = '/city/'
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.PREFIX):
+            city, _, rest = path[len(self.PREFIX):].partition('/')
+            if city:
+                environ['pis.city'] = city
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + self.PREFIX + city
+                environ['PATH_INFO'] = '/' + rest
+        return self.wsgi_app(environ, start_response)
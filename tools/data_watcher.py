@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+
+class DataWatcher:
+    """
+    数据目录变更监视器
+
+    后台线程轮询目录下指定文件的 mtime 与大小，在一段时间内不再变化（去抖）后
+    以变化的文件名集合回调 on_change，用于按文件粒度重载数据。
+    """
+
+    def __init__(self, directory, file_names, on_change, interval=0.25, debounce=0.3):
+        """
+        Args:
+            directory: 监视的数据目录，如 data/chengdu
+            file_names: 需要监视的文件名列表，如 ['route.json', 'station.json']
+            on_change: 回调 on_change(changed_names)，changed_names 为文件名集合
+            interval: 轮询间隔（秒）
+            debounce: 最后一次变化后需保持稳定的时间（秒），合并连续写入
+        """
+        self.directory = directory
+        self.file_names = list(file_names)
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self._stats = {name: self._stat(name) for name in self.file_names}
+        self._pending = set()
+        self._last_change = 0.0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _stat(self, name):
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def refresh(self, names=None):
+        """记录文件当前状态而不触发回调（用于程序自身写入后已主动重载的文件）"""
+        with self._lock:
+            for name in (names if names is not None else self.file_names):
+                if name in self._stats:
+                    self._stats[name] = self._stat(name)
+                    self._pending.discard(name)
+
+    def poll(self, now=None):
+        """
+        执行一次检查；去抖结束后回调并返回变化的文件名集合，否则返回空集合
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for name in self.file_names:
+                stat = self._stat(name)
+                if stat != self._stats.get(name):
+                    self._stats[name] = stat
+                    self._pending.add(name)
+                    self._last_change = now
+            if not self._pending or now - self._last_change < self.debounce:
+                return set()
+            changed = self._pending
+            self._pending = set()
+        try:
+            self.on_change(changed)
+        except Exception as e:
+            print(f"数据文件重载失败: {e}")
+        return changed
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 4)
+            self._thread = None
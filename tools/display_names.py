@@ -0,0 +1,73 @@
+import re
+from types import MappingProxyType
+
+from markupsafe import Markup, escape
+
+_BR_RE = re.compile(r'<\s*br\s*/?\s*>', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def clean_en_name(name):
+    """英文站名去掉 <br> 换行并合并空白（班次页单行显示）"""
+    if not isinstance(name, str):
+        return name
+    return _SPACE_RE.sub(' ', _BR_RE.sub(' ', name)).strip()
+
+
+class DisplayNameTable:
+    """
+    站点英文显示名表（只读）
+
+    由 trans_name.json 一次性构建，为每个站点预先生成模板与班次页使用的几种形式：
+    en     单行英文名（'<br>' 换为空格），已 HTML 转义的 Markup，可直接输出
+    html   原始英文名（保留 '<br>'），Markup，不在表中时为空串
+    clean  班次页使用的纯文本英文名（各种 <br> 写法换为空格并合并空白）
+    没有英文名的站点以中文名代替（html 除外）。数据变更时应整体重建。
+    """
+
+    def __init__(self, trans_data, station_names=()):
+        self.trans_data = trans_data if isinstance(trans_data, dict) else {}
+        en = {}
+        html = {}
+        clean = {}
+        for name in set(self.trans_data) | set(station_names):
+            if not isinstance(name, str):
+                continue
+            en[name] = self._en(name)
+            html[name] = self._html(name)
+            clean[name] = self._clean(name)
+        self._en_names = MappingProxyType(en)
+        self._html_names = MappingProxyType(html)
+        self._clean_names = MappingProxyType(clean)
+
+    def _raw(self, name):
+        if not name:
+            return ''
+        return self.trans_data.get(name, name)
+
+    def _en(self, name):
+        raw = self._raw(name)
+        return escape(raw.replace('<br>', ' ')) if isinstance(raw, str) and raw else Markup('')
+
+    def _html(self, name):
+        raw = self.trans_data.get(name) if name else None
+        return Markup(raw) if isinstance(raw, str) and raw else Markup('')
+
+    def _clean(self, name):
+        return clean_en_name(self._raw(name))
+
+    def en(self, name):
+        value = self._en_names.get(name) if isinstance(name, str) else None
+        return value if value is not None else self._en(name)
+
+    def html(self, name):
+        value = self._html_names.get(name) if isinstance(name, str) else None
+        return value if value is not None else self._html(name)
+
+    def clean(self, name):
+        value = self._clean_names.get(name) if isinstance(name, str) else None
+        return value if value is not None else self._clean(name)
+
+    def subset(self, names):
+        """指定站点的原始英文名映射（供页面脚本使用，不必下发整张翻译表）"""
+        return {name: self.trans_data[name] for name in names if isinstance(name, str) and name in self.trans_data}
@@ -0,0 +1,533 @@
+"""
+静态站点导出：把每个显示状态（线路 × 交路 × 方向 × 站点）的五个页面及布局变体渲染为静态 HTML，
+按键导航预先连接到对应的目标页面，可在没有 Python 服务器的播放器上直接打开。
+
+用法:
+    python tools/export_static.py [--city chongqing] [--output export/chongqing] [--processes N]
+    python tools/export_static.py --lines line_1,line_2      # 只导出部分线路
+    python tools/export_static.py --no-variants              # 不导出布局/样式变体
+    python tools/export_static.py --force                    # 忽略清单，全部重新渲染
+
+目录结构为 <输出目录>/<线路>/<交路>/d<方向>/s<站序>/<页面>.html，另有 static/ 资源副本与跳转到
+第一个状态的 index.html。页面中的快捷键（1-5 切换页面，d/a 下一站/上一站，r 反向，s/w 切换交路，
+l/k 切换线路，i/o/[/p 切换布局或样式）改为跳转到导出的目标页面；t、f 与班次页的 s/w 不可用。
+变体页面（<页面>.<样式>.html）在同一线路内按 d/a/r/s/w 切换时保持样式，切换页面或线路时回到数据中配置的样式。
+
+导航目标由应用自身的 /api/state/* 接口计算（反向、切换交路与线路），与服务器上按键的结果一致。
+各状态按线路交路方向分组，由进程池并行渲染；清单 manifest.json 记录每个状态的输入摘要
+（状态、导航目标、该线路相关的数据、全局配置、模板与代码），再次导出时只重新渲染摘要变化的状态，
+并删除已不存在的状态目录。状态写入临时目录，不影响仓库中的状态文件。
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+PAGES = (('index', '/'), ('line_map', '/line_map'), ('line_detail', '/line_detail'),
+         ('arrival', '/arrival'), ('schedule', '/schedule'))
+PAGE_KEYS = {'1': 'index', '2': 'line_map', '3': 'line_detail', '4': 'arrival', '5': 'schedule'}
+# 切换到其他状态的按键 -> 计算目标状态的接口（d/a 直接取站序中的相邻站）
+STATE_ENDPOINTS = {
+    'r': '/api/state/reverse',
+    's': '/api/state/route/next',
+    'w': '/api/state/route/prev',
+    'l': '/api/state/line/next',
+    'k': '/api/state/line/prev'
+}
+# 切换线路后回到配置的样式，其余状态按键保持当前变体
+RESET_VARIANT_KEYS = ('l', 'k')
+# 页面 -> (route.json 中的样式字段, {按键: 样式})，与 common.js 中 i/o/[/p 的行为一致
+VARIANT_KEYS = {
+    'index': ('run_style', {'i': 'default', 'o': 'detail'}),
+    'line_map': ('layout', {'i': 'one_line', 'o': 'two_line', '[': 'auto', 'p': 'sine'}),
+    'line_detail': ('detail_style', {'i': 'default', 'o': 'column'})
+}
+# 状态目录固定为四级：<线路>/<交路>/d<方向>/s<站序>
+STATE_DEPTH = 4
+DEFAULT_STATE = {
+    'door_side': '本侧',
+    'current_carriage': 1,
+    'schedule_index': 0
+}
+
+_STATIC_URL_RE = re.compile(r'''(["'(])/static/''')
+_HAS_BRANCHES_RE = re.compile(r'id="has-branches" data-value="true"')
+
+# 当前进程中的应用（主进程与各工作进程各自初始化一次）
+_app_module = None
+_client = None
+
+
+def setup_app(states_dir):
+    """导入应用：状态写入临时目录并同步写出，关闭页面渲染缓存（变体渲染会临时修改内存中的样式字段）"""
+    global _app_module, _client
+    if _app_module is not None:
+        return _app_module
+    import app as app_module
+    app_module.STATES_DIR = states_dir
+    app_module.STATE_FILE = os.path.join(states_dir, 'current_state.json')
+    app_module._state_persister.interval = 0
+    app_module._page_cache = None
+    # 导入时默认城市可能已加载，其会话记录的是仓库状态文件的 stat，改用临时目录后需丢弃
+    for network in app_module.city_registry.networks():
+        for session in list(network.sessions.values()):
+            with session.lock:
+                session.state = None
+                session.stat = None
+    try:
+        app_module.enable_template_cache()
+    except Exception as e:
+        print(f"启用模板字节码缓存失败: {e}")
+    _app_module = app_module
+    _client = app_module.app.test_client()
+    return app_module
+
+
+def _state_key(state):
+    return (state['line_name'], state['route_name'], int(state.get('direction', 0) or 0), state['next_station'])
+
+
+def _state_dir(line_name, route_name, direction, position):
+    return f"{line_name}/{route_name}/d{direction}/s{position:02d}"
+
+
+def _set_state(network, state):
+    """
+    直接设置默认会话的内存状态（不经过接口，不写状态文件）
+
+    同时记录状态文件当前的 stat，使 _current_state 以内存状态为准，不从文件重新加载。
+    """
+    session = network.session(None)
+    with session.lock:
+        session.state = dict(state)
+        session.stat = _app_module._stat_state_file(_app_module._state_file(network, None))
+
+
+def _post_state(network, state, endpoint):
+    """从 state 出发调用状态接口，返回接口给出的新状态"""
+    _set_state(network, state)
+    response = _client.post(endpoint, headers={'X-PIS-City': network.city})
+    data = response.get_json(silent=True)
+    if response.status_code != 200 or not isinstance(data, dict) or not data.get('line_name'):
+        return None
+    return data
+
+
+def _station_names(app_module, line_name, route_name, direction):
+    """与 /api/state/next 相同的站序（反向时倒序）"""
+    tools = app_module._tools()
+    line_info = None
+    if tools is not None:
+        try:
+            line_info = tools.get_line_map_info(line_name, route_name)
+        except Exception:
+            line_info = None
+    if line_info is None:
+        line_info = app_module.fallback_get_line_map_info(line_name, route_name)
+    names = [s['station_name'] for s in (line_info or [])]
+    if direction == 1:
+        names.reverse()
+    return names
+
+
+def _digest(*parts):
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _tree_digest(paths):
+    """代码与模板文件的摘要（按内容）"""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(d, f) for d, _dirs, names in os.walk(path) for f in names if not f.endswith('.pyc'))
+        for file_path in files:
+            digest.update(os.path.relpath(file_path, ROOT).encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def plan_states(app_module, network, lines=None, variants=True):
+    """
+    列出全部显示状态及其导航目标与输入摘要
+
+    Returns:
+        [(分组, [{'dir', 'state', 'nav', 'loop', 'hash'}])]，分组为 (线路, 交路, 方向)
+    """
+    with app_module._use_network(network):
+        route_data = app_module._get_route_data()
+        station_data = app_module._get_station_data()
+        trans_data = app_module._get_trans_data()
+        color_data = app_module._get_color_data()
+        schedule_config = app_module._get_schedule_config()
+        index = app_module._get_network_index()
+
+        # 所有状态共用的输入：代码、模板、全局与城市配置、各线路名称（换乘徽章会引用其他线路）
+        common = _digest(
+            _tree_digest([os.path.join(ROOT, 'app.py'), os.path.join(ROOT, 'tools'), os.path.join(ROOT, 'templates')]),
+            app_module.load_global_config(), network.app_config, color_data,
+            {line: (cfg.get('line_name'), cfg.get('type')) for line, cfg in route_data.items() if isinstance(cfg, dict)},
+            variants)
+
+        groups = []
+        for line_name, line_cfg in route_data.items():
+            if lines and line_name not in lines:
+                continue
+            stations = {s for svc in (line_cfg or {}).get('services', []) for s in svc.get('stations', [])}
+            line_digest = _digest(line_cfg, schedule_config.get(line_name),
+                                  {s: (station_data.get(s), trans_data.get(s)) for s in sorted(stations)})
+            is_loop = isinstance(line_cfg, dict) and line_cfg.get('type') == 'loop'
+            # 与切换交路/线路接口相同：跳过禁用的交路，全部禁用时使用第一个交路
+            for route_name in index.active_routes(line_name) or index.routes(line_name)[:1]:
+                for direction in (0, 1):
+                    names = _station_names(app_module, line_name, route_name, direction)
+                    unique = list(dict.fromkeys(names))
+                    if unique:
+                        groups.append(((line_name, route_name, direction), names, unique, line_digest, is_loop))
+
+    positions = {}
+    for (line_name, route_name, direction), _names, unique, _line_digest, _loop in groups:
+        for position, station in enumerate(unique, 1):
+            positions[(line_name, route_name, direction, station)] = _state_dir(line_name, route_name, direction, position)
+
+    plan = []
+    for (line_name, route_name, direction), names, unique, line_digest, is_loop in groups:
+        base = dict(DEFAULT_STATE, line_name=line_name, route_name=route_name, direction=direction,
+                    next_station=unique[0])
+        # 反向、切换交路与线路后回到起始站，与当前站无关：每组只需调用一次接口
+        group_nav = {}
+        for key, endpoint in STATE_ENDPOINTS.items():
+            target = _post_state(network, base, endpoint)
+            group_nav[key] = positions.get(_state_key(target)) if target else None
+        items = []
+        for station in unique:
+            index = names.index(station)
+            nav = dict(group_nav,
+                       d=positions.get((line_name, route_name, direction, names[(index + 1) % len(names)])),
+                       a=positions.get((line_name, route_name, direction, names[index - 1])))
+            state = dict(base, next_station=station)
+            items.append({
+                'dir': positions[(line_name, route_name, direction, station)],
+                'state': state,
+                'nav': nav,
+                'loop': is_loop,
+                'hash': _digest(common, line_digest, state, nav)
+            })
+        plan.append(((line_name, route_name, direction), items))
+    return plan
+
+
+@contextmanager
+def _style_override(app_module, network, line_name, route_name, field, value):
+    """临时修改内存中线路（及交路服务配置）的样式字段，渲染变体页面；不写回 route.json"""
+    with app_module._use_network(network):
+        targets = [app_module._get_route_data().get(line_name)]
+        if field == 'layout':
+            service = app_module._get_network_index().service(line_name, route_name)
+            config = (service or {}).get('config')
+            if isinstance(config, dict) and 'layout' in config:
+                targets.append(config)
+    targets = [t for t in targets if isinstance(t, dict)]
+    saved = [(t, field in t, t.get(field)) for t in targets]
+    for target in targets:
+        target[field] = value
+    try:
+        yield
+    finally:
+        for target, existed, previous in saved:
+            if existed:
+                target[field] = previous
+            else:
+                target.pop(field, None)
+
+
+def _configured_style(app_module, network, line_name, route_name, field):
+    """数据中配置的样式（基础页面使用），与页面处理函数的读取方式一致"""
+    with app_module._use_network(network):
+        if field != 'layout':
+            return app_module._route_style(line_name, field)
+        line_cfg = app_module._get_route_data().get(line_name) or {}
+        layout = line_cfg.get('layout') or 'auto'
+        service = app_module._get_network_index().service(line_name, route_name)
+        config = (service or {}).get('config')
+        if isinstance(config, dict) and 'layout' in config:
+            layout = config['layout']
+        return layout
+
+
+def _page_file(page, style=None):
+    return f"{page}.{style}.html" if style else f"{page}.html"
+
+
+def _href(from_dir, to_dir, filename):
+    if to_dir == from_dir:
+        return filename
+    return '../' * STATE_DEPTH + quote(to_dir) + '/' + quote(filename)
+
+
+def _finish_html(page_html, nav):
+    """静态资源改为相对路径，并注入按键导航表"""
+    page_html = _STATIC_URL_RE.sub(lambda m: m.group(1) + '../' * STATE_DEPTH + 'static/', page_html)
+    script = json.dumps({'nav': nav}, ensure_ascii=False).replace('</', '<\\/')
+    return page_html.replace('<head>', f'<head>\n    <script>window.PIS_STATIC = {script};</script>', 1)
+
+
+def _get_page(network, path):
+    response = _client.get(path, headers={'X-PIS-City': network.city})
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} 返回 {response.status_code}")
+    return response.get_data(as_text=True)
+
+
+def render_state(app_module, network, item, output, variants=True):
+    """渲染一个状态的全部页面（含变体）并写入其目录，返回写入的页面数"""
+    line_name, route_name = item['state']['line_name'], item['state']['route_name']
+    state_dir = item['dir']
+    _set_state(network, item['state'])
+
+    # 每个页面：{样式或 None: HTML}，None 为数据中配置的样式
+    rendered = {}
+    variant_keys = {}
+    for page, path in PAGES:
+        rendered[page] = {None: _get_page(network, path)}
+        if not variants or page not in VARIANT_KEYS:
+            continue
+        field, keymap = VARIANT_KEYS[page]
+        keymap = dict(keymap)
+        if page == 'line_map' and item['loop']:
+            # 环线不支持单行布局，设置接口会改为双行
+            keymap['i'] = 'two_line'
+        if page == 'index' and _HAS_BRANCHES_RE.search(rendered[page][None]):
+            # 有分支的线路按 o 也使用默认样式
+            keymap['o'] = 'default'
+        configured = _configured_style(app_module, network, line_name, route_name, field)
+        for style in dict.fromkeys(keymap.values()):
+            if style == configured:
+                rendered[page][style] = rendered[page][None]
+                continue
+            with _style_override(app_module, network, line_name, route_name, field, style):
+                rendered[page][style] = _get_page(network, path)
+        variant_keys[page] = keymap
+
+    directory = os.path.join(output, *state_dir.split('/'))
+    os.makedirs(directory, exist_ok=True)
+    written = set()
+    for page, styles in rendered.items():
+        for style, page_html in styles.items():
+            nav = {key: _page_file(target) for key, target in PAGE_KEYS.items()}
+            for key, target_dir in item['nav'].items():
+                if target_dir is None or (page == 'schedule' and key in ('s', 'w')):
+                    # 班次页的 s/w 切换班次组，静态页面只导出第一组
+                    continue
+                target_style = None if key in RESET_VARIANT_KEYS else style
+                nav[key] = _href(state_dir, target_dir, _page_file(page, target_style))
+            for key, target_style in variant_keys.get(page, {}).items():
+                nav[key] = _page_file(page, target_style)
+            filename = _page_file(page, style)
+            with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+                f.write(_finish_html(page_html, nav))
+            written.add(filename)
+    # 删除上次导出留下、本次不再生成的页面（如关闭了变体）
+    for name in os.listdir(directory):
+        if name.endswith('.html') and name not in written:
+            os.remove(os.path.join(directory, name))
+    return len(written)
+
+
+def render_group(states_dir, city, items, output, variants):
+    """进程池任务：渲染一组（同一线路交路方向）状态，返回 [(状态目录, 摘要, 页面数或错误信息)]"""
+    app_module = setup_app(states_dir)
+    network = app_module.city_registry.get(city)
+    results = []
+    for item in items:
+        try:
+            results.append((item['dir'], item['hash'], render_state(app_module, network, item, output, variants)))
+        except Exception as e:
+            results.append((item['dir'], item['hash'], f"{type(e).__name__}: {e}"))
+    return results
+
+
+def sync_static(source, target):
+    """复制 static/ 资源，只复制大小或修改时间不同的文件，并删除源目录中已不存在的文件；返回复制的文件数"""
+    copied = 0
+    expected = set()
+    for directory, _dirs, names in os.walk(source):
+        for name in names:
+            src = os.path.join(directory, name)
+            rel = os.path.relpath(src, source)
+            dst = os.path.join(target, rel)
+            expected.add(rel)
+            try:
+                src_stat, dst_stat = os.stat(src), os.stat(dst)
+                if src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+                    continue
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+            copied += 1
+    for directory, _dirs, names in os.walk(target):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.relpath(path, target) not in expected:
+                os.remove(path)
+    return copied
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'states': {}}
+
+
+def remove_state_dir(output, state_dir):
+    """删除已不存在的状态目录及随之变空的上级目录"""
+    path = os.path.join(output, *state_dir.split('/'))
+    shutil.rmtree(path, ignore_errors=True)
+    parent = os.path.dirname(path)
+    while os.path.abspath(parent) != os.path.abspath(output):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+
+def write_entry_page(output, first_dir, title):
+    entry = quote(first_dir) + '/index.html'
+    with open(os.path.join(output, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write('<!DOCTYPE html>\n<html lang="zh-CN">\n<head>\n<meta charset="UTF-8">\n'
+                f'<meta http-equiv="refresh" content="0; url={entry}">\n<title>{title}</title>\n</head>\n'
+                f'<body><a href="{entry}">{title}</a></body>\n</html>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出全部显示状态的静态页面')
+    parser.add_argument('--city', default=None, help='城市（默认使用 city_config.json）')
+    parser.add_argument('--output', default=None, help='输出目录，默认 export/<城市>')
+    parser.add_argument('--lines', default='', help='逗号分隔的线路键，默认全部线路')
+    parser.add_argument('--processes', type=int, default=None, help='渲染进程数，默认 CPU 核数，1 为当前进程内渲染')
+    parser.add_argument('--no-variants', action='store_true', help='只导出数据中配置的样式，不导出 i/o/[/p 变体')
+    parser.add_argument('--force', action='store_true', help='忽略清单，重新渲染全部状态')
+    args = parser.parse_args()
+
+    from state_persister import write_json_atomic
+
+    states_dir = tempfile.mkdtemp(prefix='pis-export-states-')
+    try:
+        app_module = setup_app(states_dir)
+        network = app_module.city_registry.get(args.city) if args.city else app_module.city_registry.get_default()
+        output = os.path.abspath(args.output or os.path.join(ROOT, 'export', network.city))
+        variants = not args.no_variants
+        lines = {x.strip() for x in args.lines.split(',') if x.strip()}
+
+        start = time.perf_counter()
+        plan = plan_states(app_module, network, lines, variants)
+        items = [item for _group, group_items in plan for item in group_items]
+        if not items:
+            print('没有可导出的状态')
+            return 1
+        planned = time.perf_counter() - start
+        # 每组都应有反向目标；缺失说明状态接口调用失败，导出的导航不完整
+        missing = [group for group, group_items in plan if group_items[0]['nav'].get('r') is None]
+        if missing:
+            for line_name, route_name, direction in missing[:20]:
+                print(f"无法计算反向目标: {line_name}/{route_name}/d{direction}")
+            print(f"{len(missing)} 组状态缺少反向导航，导出中止")
+            return 1
+
+        os.makedirs(output, exist_ok=True)
+        manifest = load_manifest(output)
+        previous = {} if args.force else manifest['states']
+        pending = []
+        for group, group_items in plan:
+            changed = [item for item in group_items
+                       if previous.get(item['dir']) != item['hash']
+                       or not os.path.exists(os.path.join(output, *item['dir'].split('/'), 'index.html'))]
+            if changed:
+                pending.append((group, changed))
+
+        # 导出部分线路时保留其他线路的状态，否则删除已不存在的状态目录
+        current = {item['dir'] for item in items}
+        kept = {d: h for d, h in manifest['states'].items()
+                if d in current or (lines and d.split('/', 1)[0] not in lines)}
+        removed = [d for d in manifest['states'] if d not in kept]
+        for state_dir in removed:
+            remove_state_dir(output, state_dir)
+        states = {d: h for d, h in kept.items() if d not in current or previous.get(d) == h}
+
+        total = sum(len(group_items) for _group, group_items in pending)
+        pages = 0
+        failures = []
+        done = 0
+
+        def collect(results):
+            nonlocal pages, done
+            for state_dir, digest, outcome in results:
+                done += 1
+                if isinstance(outcome, int):
+                    pages += outcome
+                    states[state_dir] = digest
+                else:
+                    failures.append((state_dir, outcome))
+            print(f"已渲染 {done}/{total} 个状态")
+
+        render_start = time.perf_counter()
+        if pending and args.processes is not None and args.processes <= 1:
+            for _group, group_items in pending:
+                collect(render_group(states_dir, network.city, group_items, output, variants))
+        elif pending:
+            try:
+                with ProcessPoolExecutor(max_workers=args.processes, initializer=setup_app,
+                                         initargs=(states_dir,)) as pool:
+                    futures = [pool.submit(render_group, states_dir, network.city, group_items, output, variants)
+                               for _group, group_items in pending]
+                    for future in as_completed(futures):
+                        collect(future.result())
+            except Exception as e:
+                # 进程池不可用（如打包环境）时回退为当前进程渲染
+                print(f"进程池渲染失败，改为单进程: {e}")
+                done = 0
+                for _group, group_items in pending:
+                    collect(render_group(states_dir, network.city, group_items, output, variants))
+        rendered_seconds = time.perf_counter() - render_start
+
+        copied = sync_static(os.path.join(ROOT, 'static'), os.path.join(output, 'static'))
+        write_entry_page(output, items[0]['dir'], network.app_config.get('app_name', network.city))
+        write_json_atomic(os.path.join(output, MANIFEST_FILE),
+                          {'version': MANIFEST_VERSION, 'city': network.city, 'states': states}, indent=1)
+
+        print(f"城市: {network.city}，输出: {output}")
+        print(f"状态: {len(items)}（重新渲染 {total}，未变化跳过 {len(items) - total}，删除 {len(removed)}），"
+              f"页面: {pages}，静态资源复制: {copied}")
+        print(f"规划用时 {planned:.2f}s，渲染用时 {rendered_seconds:.2f}s"
+              + (f"（{pages / rendered_seconds:.1f} 页/s）" if pages and rendered_seconds else ''))
+        for state_dir, error in failures[:20]:
+            print(f"渲染失败 {state_dir}: {error}")
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(states_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
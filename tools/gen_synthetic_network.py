@@ -0,0 +1,215 @@
+"""
+合成大规模线网生成器：按指定规模生成一套完整的城市数据，用于放大规模后的基准与页面测试。
+
+用法:
+    python tools/gen_synthetic_network.py --scale 10                  # 约为真实线网 10 倍，输出到 data/synthetic-10x
+    python tools/gen_synthetic_network.py --lines 200 --stations 60 --services 8 --name synthetic-big
+    python tools/gen_synthetic_network.py --scale 100 --transfer-density 0.3 --seed 7
+
+生成 route.json / station.json / color.json / trans_name.json / schedule.json / config.json，
+格式与 data/chongqing 等真实数据一致，可直接通过 /city/<名称>/ 或 X-PIS-City 访问，
+也可作为 tools/ 下各基准脚本的 --city 参数。每条线路包含：
+    route1       全程交路
+    区间交路     route1 的连续子区间（小交路），部分反向
+    支线交路     与 route1 共用前段后分叉（branch 指向 route1）
+    直达交路     隔站停靠，label 为“直达 Express”
+环线（--loops 条）只有全程交路与一个带终点站的交路。--transfer-density 为站点与其他线路换乘的比例。
+同一参数与 --seed 生成的结果相同。
+"""
+import argparse
+import colorsys
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from state_persister import write_json_atomic
+
+# 与仓库自带的成都数据规模相近的基准线网（--scale 1）
+BASE_LINES = 18
+EXPRESS_LABEL = '直达 Express'
+
+
+class NetworkGenerator:
+    """按参数生成线路与站点，站名与站码在整个线网内唯一"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.station_count = 0
+        self.station_codes = {}
+        self.trans_data = {}
+
+    def new_station(self):
+        self.station_count += 1
+        n = self.station_count
+        name = f"合成{n:05d}站"
+        # 少量英文名带 <br>，覆盖模板与班次页的换行处理
+        en = f"Synthetic<br>Station {n}" if n % 17 == 0 else f"Synthetic Station {n}"
+        self.trans_data[name] = en
+        self.station_codes[name] = []
+        return name
+
+    def line_stations(self, line_code, count, existing):
+        """生成一条线路的站序；按换乘密度复用其他线路的站点"""
+        stations = []
+        used = set()
+        for _ in range(count):
+            name = None
+            if existing and self.random.random() < self.args.transfer_density:
+                for _attempt in range(5):
+                    candidate = self.random.choice(existing)
+                    if candidate not in used:
+                        name = candidate
+                        break
+            if name is None:
+                name = self.new_station()
+            used.add(name)
+            stations.append(name)
+        for i, name in enumerate(stations, 1):
+            self.station_codes[name].append([line_code, f"{i:02d}"])
+        return stations
+
+    def linear_services(self, stations, line_code):
+        args = self.args
+        services = [{'service_name': 'route1', 'stations': stations}]
+        n = len(stations)
+        extra = max(0, args.services - 1)
+        branches = min(args.branches, extra)
+        express = min(args.express, extra - branches)
+        short_turns = extra - branches - express
+
+        for _ in range(short_turns):
+            length = self.random.randint(max(2, n // 3), max(2, n - 1))
+            start = self.random.randint(0, n - length)
+            segment = stations[start:start + length]
+            if self.random.random() < 0.2:
+                segment = list(reversed(segment))
+            services.append({'service_name': f"route{len(services) + 1}", 'stations': segment})
+
+        for _ in range(branches):
+            fork = self.random.randint(1, max(1, n - 2))
+            branch_stations = [self.new_station() for _ in range(max(2, n // 4))]
+            for i, name in enumerate(branch_stations, fork + 2):
+                self.station_codes[name].append([line_code, f"{i:02d}"])
+            services.append({
+                'service_name': f"route{len(services) + 1}",
+                'branch': 'route1',
+                'stations': stations[:fork + 1] + branch_stations
+            })
+
+        for _ in range(express):
+            step = self.random.randint(2, 4)
+            segment = stations[::step]
+            if segment[-1] != stations[-1]:
+                segment.append(stations[-1])
+            services.append({
+                'service_name': f"route{len(services) + 1}",
+                'label': EXPRESS_LABEL,
+                'stations': segment
+            })
+        return services
+
+    def generate(self):
+        args = self.args
+        route_data = {}
+        color_data = {}
+        schedule_data = {}
+        existing = []
+        existing_set = set()
+        for n in range(1, args.lines + 1):
+            line_key = f"line_{n}"
+            line_code = f"{n:02d}"
+            is_loop = n <= args.loops
+            count = max(3, int(self.random.gauss(args.stations, args.stations * 0.2)))
+            stations = self.line_stations(line_code, count, existing)
+            for name in stations:
+                if name not in existing_set:
+                    existing_set.add(name)
+                    existing.append(name)
+
+            if is_loop:
+                services = [
+                    {'service_name': 'route1', 'terminal_station': '', 'stations': stations},
+                    {'service_name': 'route2', 'group': '1', 'terminal_station': stations[-1], 'stations': stations}
+                ]
+            else:
+                services = self.linear_services(stations, line_code)
+
+            route_data[line_key] = {
+                'line_name': f"{n}号线-Line {n}",
+                'type': 'loop' if is_loop else 'linear',
+                'layout': 'two_line' if is_loop else 'auto',
+                'carriage_count': 6,
+                'station_spacing_multiplier': 1,
+                'run_style': 'detail' if n % 3 == 0 else 'default',
+                'detail_style': 'column' if n % 4 == 0 else 'default',
+                'services': services
+            }
+            r, g, b = colorsys.hsv_to_rgb((n * 0.618033988749895) % 1, 0.75, 0.85)
+            color_data[line_key] = f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
+            # 全程交路为主，其余交路穿插其间
+            route_order = []
+            for i in range(2, len(services) + 1):
+                route_order.extend([1, 1, i])
+            schedule_data[line_key] = {
+                'display_count': 3 if len(services) > 3 else 2,
+                'route_order': route_order or [1]
+            }
+
+        return {
+            'route.json': route_data,
+            'station.json': self.station_codes,
+            'trans_name.json': self.trans_data,
+            'color.json': color_data,
+            'schedule.json': schedule_data,
+            'config.json': {
+                'app_name': f"合成线网PIS系统（{args.name}）",
+                'copyright_year': '2025',
+                'company_name': '开源PIS',
+                'title_separator': ' - '
+            }
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成大规模线网生成器')
+    parser.add_argument('--scale', type=float, default=None, help=f'线路数为 {BASE_LINES} × scale（与 --lines 二选一）')
+    parser.add_argument('--lines', type=int, default=None, help='线路数')
+    parser.add_argument('--stations', type=int, default=30, help='每条线路的平均站数')
+    parser.add_argument('--services', type=int, default=4, help='每条非环线的交路数（含全程交路）')
+    parser.add_argument('--loops', type=int, default=None, help='环线数量（默认约每 10 条线路 1 条）')
+    parser.add_argument('--branches', type=int, default=1, help='每条非环线的支线交路数')
+    parser.add_argument('--express', type=int, default=1, help='每条非环线的直达交路数')
+    parser.add_argument('--transfer-density', type=float, default=0.15, help='站点与其他线路换乘的比例（0~1）')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--name', default=None, help='城市名称（默认 synthetic-<scale>x）')
+    parser.add_argument('--output', default=None, help='输出目录（默认 data/<名称>）')
+    args = parser.parse_args()
+
+    if args.lines is None:
+        args.lines = max(1, int(round(BASE_LINES * (args.scale or 1))))
+    if args.loops is None:
+        args.loops = max(1, args.lines // 10)
+    if args.name is None:
+        scale = args.scale if args.scale is not None else args.lines / BASE_LINES
+        args.name = f"synthetic-{scale:g}x"
+    output = args.output or os.path.join(ROOT, 'data', args.name)
+
+    files = NetworkGenerator(args).generate()
+    os.makedirs(output, exist_ok=True)
+    for name, data in files.items():
+        write_json_atomic(os.path.join(output, name), data, indent=2)
+
+    route_data = files['route.json']
+    services = sum(len(cfg['services']) for cfg in route_data.values())
+    transfers = sum(1 for codes in files['station.json'].values() if len({c[0] for c in codes}) > 1)
+    print(f"已生成: {output}")
+    print(f"线路: {len(route_data)}（环线 {args.loops}），交路: {services}，站点: {len(files['station.json'])}，换乘站: {transfers}")
+    print(f"访问: /city/{args.name}/  或请求头 X-PIS-City: {args.name}")
+
+
+if __name__ == '__main__':
+    main()
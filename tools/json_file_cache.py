@@ -0,0 +1,67 @@
+import copy
+import json
+import os
+import threading
+
+
+class CachedJsonFile:
+    """
+    带 stat 失效检查的 JSON 文件缓存
+
+    每次 load() 只做一次 os.stat，文件 mtime 与大小未变化时直接返回上次解析的结果，
+    变化后才重新打开并解析。返回的对象在调用间共享，调用方不应修改。
+    """
+
+    def __init__(self, path, default=None):
+        """
+        Args:
+            path: JSON 文件路径
+            default: 文件不存在或解析失败时返回的默认值
+        """
+        self.path = path
+        self.default = default
+        self.disk_reads = 0
+        self.saved_reads = 0
+        self._stat = None
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _current_stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def file_stat(self):
+        """文件当前的 (mtime_ns, 大小)，文件不存在时为 None"""
+        return self._current_stat()
+
+    def load(self):
+        """返回文件内容；文件未变化时不读磁盘"""
+        stat = self._current_stat()
+        with self._lock:
+            if self._loaded and stat == self._stat:
+                self.saved_reads += 1
+                return self._value
+            value = copy.deepcopy(self.default)
+            if stat is not None:
+                self.disk_reads += 1
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        value = json.load(f)
+                except Exception as e:
+                    print(f"加载配置文件失败 {self.path}: {e}")
+            self._value = value
+            self._stat = stat
+            self._loaded = True
+            return value
+
+    def invalidate(self):
+        """丢弃缓存，下次 load() 重新读取"""
+        with self._lock:
+            self._loaded = False
+
+    def stats(self):
+        return {'disk_reads': self.disk_reads, 'saved_reads': self.saved_reads}
@@ -0,0 +1,160 @@
+"""
+状态推送（/api/state/stream）负载测试：N 个显示屏同时订阅同一列车，测量按键后的推送延迟。
+
+用法: python tools/loadtest_state_stream.py [--displays 200] [--presses 20] [--idle 3]
+
+在本进程内启动多线程 WSGI 服务，客户端用单线程 selectors 维持全部 SSE 连接。
+输出每次按键从发出请求到各显示屏收到增量的延迟分位数，以及空闲期间进程的 CPU 占用
+（订阅者阻塞等待，空闲时 CPU 应接近 0）。状态写入临时目录，不影响仓库中的状态文件。
+"""
+import argparse
+import http.client
+import logging
+import os
+import selectors
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TRAIN = 'loadtest'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+class Display:
+    """一个 SSE 连接，解析收到的事件编号"""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        request = (f"GET /api/state/stream?train={TRAIN} HTTP/1.1\r\n"
+                   f"Host: 127.0.0.1:{port}\r\nAccept: text/event-stream\r\n\r\n")
+        self.sock.sendall(request.encode('ascii'))
+        self.sock.setblocking(False)
+        self.buffer = b''
+        self.header_done = False
+        self.snapshot = False
+        self.received = {}
+
+    def feed(self, data, now):
+        self.buffer += data
+        if not self.header_done:
+            if b'\r\n\r\n' not in self.buffer:
+                return
+            _, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+            self.header_done = True
+        while b'\n\n' in self.buffer:
+            block, self.buffer = self.buffer.split(b'\n\n', 1)
+            event_id = None
+            event = None
+            for line in block.decode('utf-8', 'replace').splitlines():
+                # 分块传输编码的长度行会混在其中，按前缀识别事件字段即可
+                if line.startswith('id: '):
+                    event_id = int(line[4:])
+                elif line.startswith('event: '):
+                    event = line[7:]
+            if event == 'snapshot':
+                self.snapshot = True
+            elif event == 'state' and event_id is not None:
+                self.received.setdefault(event_id, now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSE 状态推送负载测试')
+    parser.add_argument('--displays', type=int, default=200, help='同时连接的显示屏数量')
+    parser.add_argument('--presses', type=int, default=20, help='按键次数')
+    parser.add_argument('--interval', type=float, default=0.05, help='按键间隔（秒）')
+    parser.add_argument('--idle', type=float, default=3.0, help='测量空闲 CPU 占用的时长（秒）')
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    states_dir = tempfile.mkdtemp(prefix='pis-loadtest-states-')
+    app_module.STATES_DIR = states_dir
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    selector = selectors.DefaultSelector()
+    displays = []
+    try:
+        start = time.perf_counter()
+        for _ in range(args.displays):
+            display = Display(port)
+            displays.append(display)
+            selector.register(display.sock, selectors.EVENT_READ, display)
+
+        def pump(deadline):
+            while True:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    return
+                for key, _ in selector.select(timeout):
+                    try:
+                        data = key.fileobj.recv(65536)
+                    except BlockingIOError:
+                        continue
+                    if data:
+                        key.data.feed(data, time.perf_counter())
+
+        while not all(d.snapshot for d in displays):
+            pump(time.perf_counter() + 0.1)
+            if time.perf_counter() - start > 30:
+                break
+        connected = sum(1 for d in displays if d.snapshot)
+        print(f"已连接显示屏: {connected}/{args.displays}，用时 {time.perf_counter() - start:.2f}s，服务端线程: {threading.active_count()}")
+
+        cpu_start = time.process_time()
+        pump(time.perf_counter() + args.idle)
+        idle_cpu = (time.process_time() - cpu_start) / args.idle * 100
+        print(f"空闲 {args.idle:.1f}s 期间 CPU 占用: {idle_cpu:.1f}%")
+
+        control = http.client.HTTPConnection('127.0.0.1', port)
+        sent = {}
+        for _ in range(args.presses):
+            t0 = time.perf_counter()
+            control.request('POST', f'/api/state/next?train={TRAIN}', headers={'X-PIS-Client': 'loadtest'})
+            control.getresponse().read()
+            network = app_module.city_registry.get_default()
+            sent[network.session(TRAIN).version] = t0
+            pump(time.perf_counter() + args.interval)
+        pump(time.perf_counter() + 1.0)
+        control.close()
+
+        latencies = []
+        missing = 0
+        for version, t0 in sent.items():
+            for display in displays:
+                if version in display.received:
+                    latencies.append(display.received[version] - t0)
+                else:
+                    missing += 1
+        print(f"推送: {len(sent)} 次按键 x {len(displays)} 个显示屏，收到 {len(latencies)}，缺失 {missing}")
+        print(f"延迟 p50 {percentile(latencies, 50) * 1000:.2f}ms  p95 {percentile(latencies, 95) * 1000:.2f}ms  "
+              f"p99 {percentile(latencies, 99) * 1000:.2f}ms  max {max(latencies or [0]) * 1000:.2f}ms")
+        print(f"广播统计: {app_module._state_broadcaster.stats()}")
+    finally:
+        for display in displays:
+            try:
+                display.sock.close()
+            except OSError:
+                pass
+        server.shutdown()
+        shutil.rmtree(states_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+多进程部署负载测试：按不同工作进程数启动预派生（pre-fork）的 WSGI 工作进程，测量吞吐随进程数的变化，
+并检查各工作进程看到的列车状态是否一致。
+
+用法:
+    python tools/loadtest_workers.py [--workers 1,2,4] [--clients 8] [--duration 5]
+    python tools/loadtest_workers.py --no-shared        # 不启用共享状态，对比各进程状态不一致的情况
+
+每个工作进程调用 app.create_app() 后在同一个监听套接字上单线程处理请求（与 gunicorn -w N 的同步
+工作进程相同）。每个客户端进程使用独立的列车编号，循环执行：按键（POST /api/state/next）、
+读取状态（GET /api/state，可能由另一工作进程处理，应与按键结果一致）、渲染一个显示页面。
+状态写入临时目录，不影响仓库中的状态文件。需要支持 fork 的平台（Linux / macOS）。
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGES = ['/', '/line_map', '/line_detail', '/arrival', '/schedule']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+def serve(listen_fd, states_dir, city, shared):
+    """工作进程：导入应用并在继承的监听套接字上处理请求"""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    import app as app_module
+    app_module.STATES_DIR = states_dir
+    application = app_module.create_app(shared_state=shared, watch_data_dir=False)
+    if city:
+        app_module.city_registry.get(city)
+    server = make_server('127.0.0.1', 0, application, fd=listen_fd)
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    server.serve_forever()
+
+
+def request(port, method, path, headers):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request(method, path, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def client(port, train, city, start_at, deadline, results):
+    """客户端进程：在 [start_at, deadline) 内计时，之前的请求作为预热"""
+    headers = {'X-PIS-City': city} if city else {}
+    latencies = []
+    mismatches = errors = 0
+    step = 0
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        measured = now >= start_at
+        ops = []
+        try:
+            t0 = time.perf_counter()
+            status, body = request(port, 'POST', f'/api/state/next?train={train}', headers)
+            ops.append(time.perf_counter() - t0)
+            expected = json.loads(body).get('next_station') if status == 200 else None
+            t0 = time.perf_counter()
+            status_state, body = request(port, 'GET', f'/api/state?train={train}', headers)
+            ops.append(time.perf_counter() - t0)
+            seen = json.loads(body).get('next_station') if status_state == 200 else None
+            t0 = time.perf_counter()
+            status_page, _ = request(port, 'GET', f'{PAGES[step % len(PAGES)]}?train={train}', headers)
+            ops.append(time.perf_counter() - t0)
+        except (OSError, ValueError, http.client.HTTPException):
+            if measured:
+                errors += 1
+            continue
+        step += 1
+        if measured:
+            latencies.extend(ops)
+            errors += sum(1 for s in (status, status_state, status_page) if s != 200)
+            if expected is not None and seen != expected:
+                mismatches += 1
+    results.put({'latencies': latencies, 'mismatches': mismatches, 'errors': errors})
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, _ = request(port, 'GET', '/api/state', {})
+            if status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def run(workers, args, ctx):
+    states_dir = tempfile.mkdtemp(prefix='pis-loadtest-workers-')
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(256)
+    listener.set_inheritable(True)
+    port = listener.getsockname()[1]
+    servers = [ctx.Process(target=serve, args=(listener.fileno(), states_dir, args.city, not args.no_shared), daemon=True)
+               for _ in range(workers)]
+    try:
+        for process in servers:
+            process.start()
+        if not wait_ready(port):
+            raise RuntimeError('工作进程启动超时')
+        results = ctx.Queue()
+        start_at = time.perf_counter() + args.warmup
+        deadline = start_at + args.duration
+        clients = [ctx.Process(target=client, args=(port, f'loadtest-{i}', args.city, start_at, deadline, results))
+                   for i in range(args.clients)]
+        for process in clients:
+            process.start()
+        collected = [results.get() for _ in clients]
+        for process in clients:
+            process.join()
+    finally:
+        for process in servers:
+            if process.is_alive():
+                process.terminate()
+        for process in servers:
+            process.join(timeout=5)
+        listener.close()
+        shutil.rmtree(states_dir, ignore_errors=True)
+
+    latencies = [x for r in collected for x in r['latencies']]
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'rps': len(latencies) / args.duration,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'mismatches': sum(r['mismatches'] for r in collected),
+        'errors': sum(r['errors'] for r in collected)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程部署负载测试（吞吐随工作进程数的变化）')
+    parser.add_argument('--workers', default='1,2,4', help='逗号分隔的工作进程数')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端进程数（每个使用独立列车编号）')
+    parser.add_argument('--duration', type=float, default=5.0, help='每轮计时秒数')
+    parser.add_argument('--warmup', type=float, default=1.0, help='每轮计时前的预热秒数')
+    parser.add_argument('--city', default=None, help='城市（默认使用 city_config.json）')
+    parser.add_argument('--no-shared', action='store_true', help='不启用共享状态（各工作进程各自保存状态）')
+    parser.add_argument('--json', default=None, help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print('当前平台不支持 fork，无法运行多进程负载测试')
+        return 1
+    ctx = multiprocessing.get_context('fork')
+    counts = [int(x) for x in args.workers.split(',') if x.strip()]
+    print(f"CPU 核数: {os.cpu_count()}，客户端: {args.clients}，共享状态: {'否' if args.no_shared else '是'}"
+          f"（工作进程数超过可用核数后吞吐不再增长）")
+
+    rows = []
+    for workers in counts:
+        rows.append(run(workers, args, ctx))
+    base = rows[0]['rps'] if rows and rows[0]['rps'] else None
+    print(f"{'workers':>7} {'requests':>9} {'req/s':>9} {'speedup':>8} {'p50':>9} {'p95':>9} {'mismatch':>9} {'errors':>7}")
+    for row in rows:
+        speedup = row['rps'] / base if base else 0.0
+        print(f"{row['workers']:>7} {row['requests']:>9} {row['rps']:>9.1f} {speedup:>7.2f}x "
+              f"{row['p50_ms']:>7.2f}ms {row['p95_ms']:>7.2f}ms {row['mismatches']:>9} {row['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'shared_state': not args.no_shared, 'runs': rows},
+                      f, ensure_ascii=False, indent=2)
+    failed = any(row['errors'] for row in rows) or (not args.no_shared and any(row['mismatches'] for row in rows))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import math
+import threading
+from bisect import bisect_left
+
+# 请求耗时的默认分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """带标签的指标；每个指标一把锁，只在更新几个数值的期间持有"""
+
+    type_name = ''
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _child(self, values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_name}']
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return [0]
+
+    def inc(self, *labels, amount=1):
+        child = self._child(labels)
+        with self._lock:
+            child[0] += amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(values, child[0]) for values, child in self._children.items()]
+        for values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    """分桶直方图：每个分桶单独计数，输出时再累加为 Prometheus 的累计分桶"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        # [各分桶计数..., 超出最大分桶的计数, 总和]
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value, *labels):
+        child = self._child(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            child[slot] += 1
+            child[-1] += value
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(values, list(child)) for values, child in self._children.items()]
+        for values, child in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(child[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表，render() 输出 Prometheus 文本格式（0.0.4）
+
+    请求路径上更新的指标用 counter()/histogram() 创建；各组件已有的统计数（缓存命中、
+    写入次数等）通过 collector 在抓取时读取，不增加请求路径上的开销。
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """
+        注册抓取时调用的 func()，返回 [(指标名, 类型, 说明, [(标签字典, 值)])]
+        可用作装饰器。
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for func in self._collectors:
+            try:
+                families = func()
+            except Exception as e:
+                print(f"收集指标失败: {e}")
+                continue
+            for name, type_name, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {type_name}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
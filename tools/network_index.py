@@ -0,0 +1,212 @@
+from types import MappingProxyType
+
+
+def canonical_line_code(code):
+    """规范化线路代码：数字去掉前导0（'05' -> '5'），字母数字原样（'S3'）"""
+    if code is None:
+        return None
+    s = str(code).strip()
+    if s.isdigit():
+        return str(int(s))
+    return s
+
+
+def line_code_from_key(line_key):
+    """从'line_5'或'line_S3'解析出规范化线路代码，无法解析时返回None"""
+    try:
+        part = line_key.split('_')[1]
+    except Exception:
+        return None
+    return canonical_line_code(part)
+
+
+def line_key_from_code(code):
+    """线路代码转线路键：'05' -> 'line_5'，'S3' -> 'line_S3'"""
+    return f"line_{canonical_line_code(code)}"
+
+
+def service_route_name(service):
+    """交路名称：优先 type，其次 service_name / name"""
+    if not isinstance(service, dict):
+        return ''
+    return service.get('type') or service.get('service_name') or service.get('name') or ''
+
+
+class NetworkIndex:
+    """
+    线路网络的编译索引（只读）
+
+    由 route.json 与 station.json 一次性构建，提供 O(1) 的查询：
+    (线路, 交路) -> 交路服务，站点 -> 各线路站码，线路键 -> 规范化线路代码，
+    (线路, 交路) -> 包含该交路的最长交路（区间车/小交路对应的全程交路）。
+    数据变更时应整体重建，而不是修改已有实例。
+    """
+
+    def __init__(self, route_data, station_data):
+        self.route_data = route_data if isinstance(route_data, dict) else {}
+        self.station_data = station_data if isinstance(station_data, dict) else {}
+
+        services = {}
+        positions = {}
+        routes = {}
+        active_routes = {}
+        line_codes = {}
+        for line_key, line_cfg in self.route_data.items():
+            line_codes[line_key] = line_code_from_key(line_key)
+            names = []
+            active = []
+            raw_services = line_cfg.get('services', []) if isinstance(line_cfg, dict) else []
+            for service in raw_services or []:
+                if not isinstance(service, dict):
+                    continue
+                name = service_route_name(service)
+                if name:
+                    names.append(name)
+                    if not service.get('disabled', False):
+                        active.append(name)
+                # 与逐个比较 type/service_name 的旧逻辑一致：先出现的交路优先
+                for alias in (name, service.get('type'), service.get('service_name')):
+                    if alias and (line_key, alias) not in services:
+                        services[(line_key, alias)] = service
+                        positions[(line_key, alias)] = self._positions(service)
+            routes[line_key] = tuple(names)
+            active_routes[line_key] = tuple(active)
+
+        station_codes = {}
+        station_lines = {}
+        for station_name, entries in self.station_data.items():
+            codes = {}
+            raw_lines = set()
+            for item in entries if isinstance(entries, list) else []:
+                if not (isinstance(item, list) and len(item) >= 1):
+                    continue
+                raw_lines.add(item[0])
+                code = canonical_line_code(item[0])
+                if code not in codes:
+                    codes[code] = item[1] if len(item) >= 2 else None
+            station_codes[station_name] = MappingProxyType(codes)
+            station_lines[station_name] = tuple(sorted(raw_lines))
+
+        # 各线路的交路按站数从多到少（同长按 route.json 顺序）排列，查找包含关系时遇到第一个匹配即为结果
+        by_length = {}
+        for line_key, names in routes.items():
+            candidates = []
+            for order, name in enumerate(names):
+                stations = services[(line_key, name)].get('stations', [])
+                if isinstance(stations, list):
+                    candidates.append((-len(stations), order, name, stations, positions[(line_key, name)]))
+            candidates.sort(key=lambda c: (c[0], c[1]))
+            by_length[line_key] = candidates
+        containers = {}
+        for (line_key, alias), service in services.items():
+            container = self._find_container(alias, service, by_length[line_key])
+            if container is not None:
+                containers[(line_key, alias)] = container
+
+        self._services = MappingProxyType(services)
+        self._positions_by_service = MappingProxyType(positions)
+        self._containers = MappingProxyType(containers)
+        self._routes = MappingProxyType(routes)
+        self._active_routes = MappingProxyType(active_routes)
+        self._line_codes = MappingProxyType(line_codes)
+        self._station_codes = MappingProxyType(station_codes)
+        self._station_lines = MappingProxyType(station_lines)
+
+    @staticmethod
+    def _find_container(route_name, service, candidates):
+        """
+        查找同一线路中包含 route_name 站序的最长交路
+
+        规则与逐个比较的旧逻辑一致：候选交路须比当前交路更长，且当前站序是其连续子序列
+        （同向，或反向后连续，均从站名首次出现的位置比较）；最长者中取 route.json 中靠前的一个。
+        candidates 为该线路按站数降序排列的交路；返回 (交路名, 起始下标, 是否反向)，不存在时返回None。
+        """
+        small = service.get('stations', [])
+        if not isinstance(small, list) or not small:
+            return None
+        small_rev = small[::-1]
+        for neg_len, _, name, big, big_positions in candidates:
+            if -neg_len <= len(small):
+                break
+            if name == route_name:
+                continue
+            start = big_positions.get(small[0])
+            if start is not None and big[start:start + len(small)] == small:
+                return (name, start, False)
+            start = big_positions.get(small_rev[0])
+            if start is not None and big[start:start + len(small)] == small_rev:
+                return (name, start, True)
+        return None
+
+    @staticmethod
+    def _positions(service):
+        stations = service.get('stations', [])
+        result = {}
+        for i, name in enumerate(stations if isinstance(stations, list) else []):
+            result.setdefault(name, i)
+        return MappingProxyType(result)
+
+    def has_line(self, line_key):
+        return line_key in self._routes
+
+    def lines(self):
+        """所有线路键（保持 route.json 中的顺序）"""
+        return list(self._routes.keys())
+
+    def line_config(self, line_key):
+        cfg = self.route_data.get(line_key, {})
+        return cfg if isinstance(cfg, dict) else {}
+
+    def line_code(self, line_key):
+        """线路键对应的规范化线路代码，例如 'line_05' / 'line_5' -> '5'"""
+        if line_key in self._line_codes:
+            return self._line_codes[line_key]
+        return line_code_from_key(line_key)
+
+    def routes(self, line_key):
+        """线路下所有交路名称（含 disabled）"""
+        return self._routes.get(line_key, ())
+
+    def active_routes(self, line_key):
+        """线路下未被禁用的交路名称"""
+        return self._active_routes.get(line_key, ())
+
+    def service(self, line_key, route_name):
+        """(线路, 交路) -> 交路服务字典，不存在时返回None"""
+        return self._services.get((line_key, route_name))
+
+    def stations(self, line_key, route_name):
+        service = self.service(line_key, route_name)
+        if service is None:
+            return None
+        stations = service.get('stations', [])
+        return stations if isinstance(stations, list) else []
+
+    def containing_route(self, line_key, route_name):
+        """
+        包含该交路的最长交路：(交路名, 当前交路在其站序中的起始下标, 是否反向)，
+        没有更长的包含交路时返回None
+        """
+        return self._containers.get((line_key, route_name))
+
+    def station_position(self, line_key, route_name, station_name):
+        """站点在交路站序中的位置（首次出现），不存在时返回None"""
+        positions = self._positions_by_service.get((line_key, route_name))
+        if positions is None:
+            return None
+        return positions.get(station_name)
+
+    def station_codes(self, station_name):
+        """站点的 {规范化线路代码: 站码}"""
+        return self._station_codes.get(station_name, MappingProxyType({}))
+
+    def station_code_on_line(self, station_name, line_key):
+        """站点在指定线路上的站码（如 '01'），不在该线路上时返回None"""
+        return self.station_codes(station_name).get(self.line_code(line_key))
+
+    def station_lines(self, station_name):
+        """站点涉及的原始线路代码（排序去重），例如 ('05', '06')"""
+        return self._station_lines.get(station_name, ())
+
+    def is_current_line_code(self, code, line_key):
+        return canonical_line_code(code) == self.line_code(line_key)
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+class PageCache:
+    """
+    渲染结果的 LRU 缓存，按条目数与总大小（字符数）限制
+
+    键由调用方构造（页面、状态、数据版本等），值为 (大小, 任意对象)。
+    数据或配置版本变化后旧键不会再被命中，随 LRU 淘汰，无需显式失效。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, size):
+        """加入缓存；单个值超过总大小限制时不缓存"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[0]
+            self._entries[key] = (size, value)
+            self.size += size
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _key, (evicted_size, _value) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
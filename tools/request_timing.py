@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class RequestTimer:
+    """
+    单个请求的分阶段计时
+
+    同名阶段多次进入时累加耗时与次数；不同阶段可以嵌套，各自独立计时。
+    同名阶段嵌套（如回退函数内部调用另一个回退函数）只计外层，避免重复计时。
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self._active = set()
+
+    @contextmanager
+    def phase(self, name):
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._active.discard(name)
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        total, count = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + seconds, count + 1)
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def summary(self):
+        """{阶段: {'ms': 毫秒, 'count': 次数}}"""
+        return {name: {'ms': round(seconds * 1000, 3), 'count': count}
+                for name, (seconds, count) in self.phases.items()}
+
+    def server_timing(self, total=None):
+        """Server-Timing 响应头：各阶段与总耗时（毫秒）"""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, (seconds, _count) in self.phases.items()]
+        parts.append(f"total;dur={(self.total() if total is None else total) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+class TimingRecorder:
+    """最近请求的计时记录（环形缓冲，超出容量时丢弃最旧的记录）"""
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.recorded = 0
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def recent(self, limit=None):
+        """最近的记录，最新的在前"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
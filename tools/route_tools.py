@@ -1,5 +1,8 @@
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from network_index import NetworkIndex, line_key_from_code
 
 class RouteTools:
     """
@@ -33,35 +36,66 @@ class RouteTools:
         self.station_data = None
         self.trans_data = None
         self.color_data = None
+        self.index = None
+        # 数据版本：每次重载数据文件后递增，派生缓存以此判断是否失效
+        self.data_version = 0
+        # 线路图派生数据缓存：(line, route, reverse) -> (data_version, payload)
+        self._line_map_cache = {}
+        # 线路图缓存命中统计（不加锁，供监控参考）
+        self.line_map_hits = 0
+        self.line_map_misses = 0
         
         self._load_data()
     
     def _load_data(self):
         """加载线路、站台、英文名与主题色数据"""
-        try:
-            with open(self.route_file_path, 'r', encoding='utf-8') as f:
-                self.route_data = json.load(f)
-            
-            with open(self.station_file_path, 'r', encoding='utf-8') as f:
-                self.station_data = json.load(f)
-            
-            # 加载英文名映射
-            if os.path.exists(self.trans_file_path):
-                with open(self.trans_file_path, 'r', encoding='utf-8') as f:
-                    self.trans_data = json.load(f)
-            else:
-                self.trans_data = {}
+        self.reload_files(None)
+    
+    def _data_files(self):
+        """文件名 -> (属性名, 文件路径, 是否必需)"""
+        return {
+            os.path.basename(self.route_file_path): ('route_data', self.route_file_path, True),
+            os.path.basename(self.station_file_path): ('station_data', self.station_file_path, True),
+            os.path.basename(self.trans_file_path): ('trans_data', self.trans_file_path, False),
+            os.path.basename(self.color_file_path): ('color_data', self.color_file_path, False),
+        }
+    
+    def reload_files(self, names):
+        """
+        按文件重载数据，仅重新解析发生变化的文件
+        
+        Args:
+            names: 文件名列表，如 ['station.json']；None 表示全部重载
             
-            # 加载线路主题色
-            if os.path.exists(self.color_file_path):
-                with open(self.color_file_path, 'r', encoding='utf-8') as f:
-                    self.color_data = json.load(f)
-            else:
-                self.color_data = {}
+        Returns:
+            list: 实际重载的文件名
+        """
+        files = self._data_files()
+        targets = list(files) if names is None else [n for n in names if n in files]
+        if not targets:
+            return []
+        try:
+            loaded = {}
+            for name in targets:
+                attr, path, required = files[name]
+                # 英文名映射与线路主题色可缺省
+                if not required and not os.path.exists(path):
+                    loaded[attr] = {}
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded[attr] = json.load(f)
         except FileNotFoundError as e:
             raise FileNotFoundError(f"数据文件未找到: {e}")
         except json.JSONDecodeError as e:
             raise ValueError(f"数据文件格式错误: {e}")
+        
+        for attr, value in loaded.items():
+            setattr(self, attr, value)
+        if 'route_data' in loaded or 'station_data' in loaded or self.index is None:
+            self.index = NetworkIndex(self.route_data, self.station_data)
+        self.data_version += 1
+        self._line_map_cache = {}
+        return targets
     
     def get_station_info(self, line_name, route_name):
         """
@@ -84,18 +118,8 @@ class RouteTools:
         if line_name not in self.route_data:
             raise ValueError(f"线路 '{line_name}' 不存在")
         
-        line_info = self.route_data[line_name]
-        
         # 查找对应的路线
-        route_found = None
-        for service in line_info.get('services', []):
-            # 处理不同的路线名称字段
-            if 'type' in service and service['type'] == route_name:
-                route_found = service
-                break
-            elif 'service_name' in service and service['service_name'] == route_name:
-                route_found = service
-                break
+        route_found = self.index.service(line_name, route_name)
         
         if route_found is None:
             raise ValueError(f"路线 '{route_name}' 在线路 '{line_name}' 中不存在")
@@ -129,15 +153,7 @@ class RouteTools:
         if line_name not in self.route_data:
             raise ValueError(f"线路 '{line_name}' 不存在")
         
-        line_info = self.route_data[line_name]
-        routes = []
-        for service in line_info.get('services', []):
-            if 'type' in service:
-                routes.append(service['type'])
-            elif 'service_name' in service:
-                routes.append(service['service_name'])
-        
-        return routes
+        return list(self.index.routes(line_name))
     
     def get_line_display_name(self, line_key):
         """获取线路显示名称，比如 'line_5' -> '5号线'"""
@@ -167,16 +183,10 @@ class RouteTools:
         return line_key
     
     def _line_code_from_key(self, line_key):
-        """从'line_5'或'line_S3'解析出站点索引里的线路代码（数字两位、字母数字原样）"""
-        try:
-            part = line_key.split('_')[1]
-        except Exception:
-            return ''
-        s = str(part).strip()
-        if s.isdigit():
-            return f"{int(s):02d}"
-        else:
-            return s
+        """从'line_5'或'line_S3'解析出规范化线路代码（数字去前导0、字母数字原样）"""
+        if self.index is None:
+            self._load_data()
+        return self.index.line_code(line_key) or ''
     
     def get_station_en_name(self, station_name):
         """获取站点英文名，如果不存在，返回原名"""
@@ -188,25 +198,43 @@ class RouteTools:
         """返回站点涉及的线路代码列表，例如 ['05','06']"""
         if self.station_data is None:
             self._load_data()
-        entries = self.station_data.get(station_name, [])
-        lines = []
-        for item in entries:
-            if isinstance(item, list) and len(item) >= 1:
-                lines.append(item[0])
-        return sorted(list(set(lines)))
+        return list(self.index.station_lines(station_name))
     
-    def get_line_map_info(self, line_name, route_name):
+    def get_line_map_info(self, line_name, route_name, reverse=False):
         """
         获取用于线路图展示的站点信息（含英文名与换乘标识）
         返回: [{'station_name','station_name_en','station_index','is_transfer','transfer_lines','transfer_count_excl_current','transfer_badges'}]
         transfer_badges: [{'code': '4', 'color': '#XXXXXX'}]
+        reverse 为 True 时返回反向站序。结果按数据版本缓存并在调用间共享，调用方不应修改。
         """
         if self.route_data is None or self.station_data is None:
             self._load_data()
         
+        key = (line_name, route_name, bool(reverse))
+        cached = self._line_map_cache.get(key)
+        if cached is not None and cached[0] == self.data_version:
+            self.line_map_hits += 1
+            return cached[1]
+        self.line_map_misses += 1
+        
+        version = self.data_version
+        forward_key = (line_name, route_name, False)
+        forward = self._line_map_cache.get(forward_key)
+        if forward is not None and forward[0] == version:
+            payload = forward[1]
+        else:
+            payload = self._build_line_map_info(line_name, route_name)
+            self._line_map_cache[forward_key] = (version, payload)
+        if reverse:
+            payload = list(reversed(payload))
+            self._line_map_cache[key] = (version, payload)
+        return payload
+    
+    def _build_line_map_info(self, line_name, route_name):
+        """构建线路图站点信息（不经过缓存）"""
         # 复用已有逻辑获取站序
         base_list = self.get_station_info(line_name, route_name)
-        current_code = self._line_code_from_key(line_name)
+        index = self.index
         enriched = []
         for item in base_list:
             name = item['station_name']
@@ -214,26 +242,15 @@ class RouteTools:
             transfer_lines = self.get_transfer_lines(name)
             is_transfer = len(transfer_lines) > 1
             # 提取当前线路的索引号
-            station_index = None
-            for idx in item['station_index']:
-                if isinstance(idx, list) and len(idx) >= 2 and idx[0] == current_code:
-                    station_index = idx[1]
-                    break
-            transfer_count_excl_current = len([c for c in transfer_lines if c != current_code])
+            station_index = index.station_code_on_line(name, line_name)
+            other_lines = [c for c in transfer_lines if not index.is_current_line_code(c, line_name)]
+            transfer_count_excl_current = len(other_lines)
             # 构造换乘徽章（编号与颜色），排除当前线路
             badges = []
-            for code in transfer_lines:
-                if code == current_code:
-                    continue
-                code_str = str(code).strip()
-                if code_str.isdigit():
-                    line_key = f"line_{int(code_str)}"
-                    code_disp = str(int(code_str))
-                else:
-                    line_key = f"line_{code_str}"
-                    code_disp = code_str
+            for code in other_lines:
+                line_key = line_key_from_code(code)
                 badges.append({
-                    'code': code_disp,
+                    'code': line_key[5:],
                     'color': self.get_line_color(line_key)
                 })
             enriched.append({
@@ -247,16 +264,62 @@ class RouteTools:
             })
         return enriched
     
+    def warm_up_line_map_cache(self, processes=None, progress=None):
+        """
+        预先计算所有 线路×交路 的线路图数据（正向与反向）并写入缓存
+        
+        Args:
+            processes: 进程池大小，None 为 CPU 核数，小于等于1时在当前进程内计算
+            progress: 进度回调 progress(done, total)
+            
+        Returns:
+            int: 写入缓存的 (线路, 交路) 数量
+        """
+        if self.index is None:
+            self._load_data()
+        version = self.data_version
+        jobs = [(line, route) for line in self.index.lines() for route in self.index.routes(line)]
+        total = len(jobs)
+        if not jobs:
+            return 0
+        
+        results = []
+        if processes is not None and processes <= 1:
+            for done, (line, route) in enumerate(jobs, 1):
+                results.append(((line, route), self._build_line_map_info(line, route)))
+                if progress:
+                    progress(done, total)
+        else:
+            paths = (self.route_file_path, self.station_file_path, self.trans_file_path, self.color_file_path)
+            # 按线路分组提交，减少进程间往返
+            by_line = {}
+            for line, route in jobs:
+                by_line.setdefault(line, []).append(route)
+            try:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    futures = [pool.submit(_build_line_map_payloads, paths, line, routes) for line, routes in by_line.items()]
+                    for future in as_completed(futures):
+                        results.extend(future.result())
+                        if progress:
+                            progress(len(results), total)
+            except Exception as e:
+                # 进程池不可用（如打包环境）时回退为当前进程计算
+                print(f"进程池预热失败，改为单进程: {e}")
+                return self.warm_up_line_map_cache(processes=1, progress=progress)
+        
+        # 预热期间数据已被重载则丢弃结果
+        if version != self.data_version:
+            return 0
+        for (line, route), payload in results:
+            self._line_map_cache[(line, route, False)] = (version, payload)
+            self._line_map_cache[(line, route, True)] = (version, list(reversed(payload)))
+        return len(results)
+    
     def get_terminal_station(self, line_name, route_name):
         """获取终点站（线性：列表末尾；环线：优先使用terminal_station字段）"""
         if self.route_data is None:
             self._load_data()
-        line_info = self.route_data.get(line_name, {})
-        target = None
-        for service in line_info.get('services', []):
-            if service.get('type') == route_name or service.get('service_name') == route_name:
-                target = service
-                break
+        target = self.index.service(line_name, route_name)
         if not target:
             raise ValueError(f"路线 '{route_name}' 在线路 '{line_name}' 中不存在")
         if 'terminal_station' in target and target['terminal_station']:
@@ -268,21 +331,13 @@ class RouteTools:
         """获取下一站名称"""
         if self.route_data is None:
             self._load_data()
-        line_info = self.route_data.get(line_name, {})
-        target = None
-        for service in line_info.get('services', []):
-            if service.get('type') == route_name or service.get('service_name') == route_name:
-                target = service
-                break
+        target = self.index.service(line_name, route_name)
         if not target:
             raise ValueError(f"路线 '{route_name}' 在线路 '{line_name}' 中不存在")
         stations = target.get('stations', [])
-        for i, name in enumerate(stations):
-            if name == current_station:
-                if i + 1 < len(stations):
-                    return stations[i+1]
-                else:
-                    return None
+        i = self.index.station_position(line_name, route_name, current_station)
+        if i is not None and i + 1 < len(stations):
+            return stations[i + 1]
         return None
     
     def get_line_color(self, line_key):
@@ -300,9 +355,16 @@ class RouteTools:
     
     def get_line_color_by_code(self, code):
         """根据线路代码返回主题色，支持数字与字母数字（如 S3）"""
-        code_str = str(code).strip()
-        if code_str.isdigit():
-            key = f"line_{int(code_str)}"
-        else:
-            key = f"line_{code_str}"
-        return self.get_line_color(key)
\ No newline at end of file
+        return self.get_line_color(line_key_from_code(code))
+
+def _build_line_map_payloads(paths, line_name, route_names):
+    """进程池任务：在子进程中加载数据并计算一条线路各交路的线路图数据"""
+    tools = RouteTools(*paths)
+    results = []
+    for route_name in route_names:
+        try:
+            payload = tools._build_line_map_info(line_name, route_name)
+        except ValueError:
+            continue
+        results.append(((line_name, route_name), payload))
+    return results
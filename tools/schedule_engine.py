@@ -0,0 +1,233 @@
+from bisect import bisect_left
+from types import MappingProxyType
+
+EXPRESS_LABEL = '直达 Express'
+
+
+def normalize_schedule_config(raw_config):
+    """兼容两种班次配置格式：简写列表或带 display_count 的对象。"""
+    if isinstance(raw_config, dict):
+        display_count = raw_config.get('display_count', 2)
+        sequence = raw_config.get('route_order') or raw_config.get('sequence') or raw_config.get('routes') or []
+    elif isinstance(raw_config, list):
+        display_count = 2
+        sequence = raw_config
+    else:
+        display_count = 2
+        sequence = []
+
+    try:
+        display_count = int(display_count)
+    except Exception:
+        display_count = 2
+    display_count = max(1, min(display_count, 6))
+
+    normalized_sequence = []
+    for item in sequence:
+        if isinstance(item, dict):
+            route = item.get('route') or item.get('route_name') or item.get('service_name') or item.get('type')
+            if route:
+                normalized_sequence.append(str(route))
+        elif isinstance(item, int):
+            normalized_sequence.append(f"route{item}")
+        elif isinstance(item, str):
+            stripped = item.strip()
+            if not stripped:
+                continue
+            normalized_sequence.append(f"route{stripped}" if stripped.isdigit() else stripped)
+
+    return {
+        'display_count': display_count,
+        'sequence': normalized_sequence
+    }
+
+
+def service_terminal_station(service, line_type, direction=0):
+    """根据交路服务、线路类型和方向计算终点站。"""
+    if not isinstance(service, dict):
+        return ''
+
+    terminal = (service.get('terminal_station') or '').strip()
+    if terminal:
+        return terminal
+
+    if line_type == 'loop':
+        return ''
+
+    stations = service.get('stations', [])
+    if not isinstance(stations, list) or not stations:
+        return ''
+
+    try:
+        direction = int(direction or 0)
+    except Exception:
+        direction = 0
+
+    return str(stations[0] if direction == 1 else stations[-1])
+
+
+def ring_label(direction=0):
+    """环线班次显示名称。由当前运行方向决定，不由交路编号决定。"""
+    try:
+        return '内环' if int(direction or 0) == 1 else '外环'
+    except Exception:
+        return '外环'
+
+
+class LineSchedule:
+    """
+    单条线路编译后的班次模型（只读）
+
+    sequence 为过滤掉不存在/禁用交路后的循环班次顺序；每个交路预先算好两个方向的终点站
+    及其英文名、标签与途经站集合，并按站点记录途经该站的班次位置，
+    查询一组班次只需二分定位起点再取 display_count 个。
+    """
+
+    def __init__(self, line_name, line_cfg, active_routes, raw_schedule, index, names):
+        normalized = normalize_schedule_config(raw_schedule)
+        active = set(active_routes)
+        sequence = [route for route in normalized.get('sequence', []) if route in active]
+        if not sequence:
+            sequence = list(active_routes)
+
+        self.line_name = line_name
+        self.display_count = normalized.get('display_count', 2) or 2
+        self.sequence = tuple(sequence)
+        self.line_type = line_cfg.get('type', 'linear') if isinstance(line_cfg, dict) else 'linear'
+        self.is_loop = self.line_type == 'loop'
+
+        routes = {}
+        for route_name in set(sequence):
+            service = index.service(line_name, route_name)
+            label = (service or {}).get('label', '')
+            stations = (service or {}).get('stations', [])
+            served = frozenset(stations) if isinstance(stations, list) and stations else None
+            terminals = []
+            for direction in (0, 1):
+                terminal = service_terminal_station(service, self.line_type, direction)
+                terminals.append((terminal, names.clean(terminal), bool(terminal.strip())))
+            routes[route_name] = {
+                'label': label,
+                'express_label': label if label == EXPRESS_LABEL else '',
+                'served': served,
+                'terminals': tuple(terminals)
+            }
+        self._routes = MappingProxyType(routes)
+
+        # 站点 -> 途经该站的班次位置（升序，展开为三圈以便从任意起点连续取两圈）；
+        # 未限定站列表的交路途经所有站
+        always = [i for i, route in enumerate(sequence) if routes[route]['served'] is None]
+        positions = {}
+        for i, route in enumerate(sequence):
+            for station in routes[route]['served'] or ():
+                positions.setdefault(station, []).append(i)
+        self._always = self._unroll(always)
+        self._positions = MappingProxyType({
+            station: self._unroll(set(p) | set(always)) for station, p in positions.items()
+        })
+
+    def _unroll(self, positions):
+        length = len(self.sequence)
+        ordered = sorted(positions)
+        return tuple(p + lap * length for lap in range(3) for p in ordered)
+
+    def normalize_index(self, schedule_index):
+        if not self.sequence:
+            return 0
+        try:
+            schedule_index = int(schedule_index or 0)
+        except Exception:
+            schedule_index = 0
+        return schedule_index % len(self.sequence)
+
+    def _serving_positions(self, next_station, start):
+        """从 start 起（最多绕序列两圈）途经 next_station 的班次位置"""
+        length = len(self.sequence)
+        if self.is_loop:
+            return range(start, start + 2 * length)
+        positions = self._positions.get(next_station, self._always)
+        first = bisect_left(positions, start)
+        end = bisect_left(positions, start + 2 * length, first)
+        return positions[first:first + min(end - first, self.display_count)]
+
+    def _entry(self, route_name, direction, serving, is_terminal, next_station, next_station_en):
+        route = self._routes[route_name]
+        terminal, terminal_en, has_terminal = route['terminals'][1 if direction == 1 else 0]
+        return {
+            'route_name': route_name,
+            'terminal_station': terminal,
+            'terminal_station_en': terminal_en,
+            'is_loop': self.is_loop,
+            'has_terminal': has_terminal,
+            'serving_station': serving,
+            'is_terminal_station': is_terminal,
+            'label': route['label'],
+            'express_label': route['express_label'],
+            'ring_label': ring_label(direction) if self.is_loop else '',
+            'next_station': next_station if self.is_loop else '',
+            'next_station_en': next_station_en if self.is_loop else ''
+        }
+
+    def entries(self, schedule_index, direction, next_station, next_station_en=''):
+        """
+        当前应显示的一组班次
+
+        Returns:
+            (entries, schedule_index, display_count)；非环线时跳过不途经当前站的交路，
+            没有任何交路途经当前站时回退显示默认顺序的班次
+        """
+        if not self.sequence:
+            return [], 0, self.display_count
+        try:
+            direction = int(direction or 0)
+        except Exception:
+            direction = 0
+        schedule_index = self.normalize_index(schedule_index)
+        length = len(self.sequence)
+
+        entries = []
+        for position in self._serving_positions(next_station, schedule_index):
+            if len(entries) >= self.display_count:
+                break
+            route_name = self.sequence[position % length]
+            is_terminal = False
+            if not self.is_loop and self._routes[route_name]['served'] is not None:
+                terminal = self._routes[route_name]['terminals'][1 if direction == 1 else 0][0]
+                is_terminal = bool(terminal) and next_station == terminal
+            entries.append(self._entry(route_name, direction, True, is_terminal, next_station, next_station_en))
+
+        # 如果所有交路都被过滤掉（当前站不途经任何交路），回退显示默认班次
+        if not entries and not self.is_loop:
+            for offset in range(self.display_count):
+                route_name = self.sequence[(schedule_index + offset) % length]
+                entries.append(self._entry(route_name, direction, False, False, next_station, next_station_en))
+
+        return entries, schedule_index, self.display_count
+
+
+class ScheduleEngine:
+    """
+    全部线路的编译班次模型
+
+    由 schedule.json、线路网络索引与站点英文名表（DisplayNameTable）构建；任一数据变更时整体重建。
+    """
+
+    def __init__(self, index, schedule_config, names):
+        schedule_config = schedule_config if isinstance(schedule_config, dict) else {}
+        self._schedule_config = schedule_config
+        self._names = names
+        self._lines = MappingProxyType({
+            line_name: LineSchedule(line_name, index.line_config(line_name), index.active_routes(line_name),
+                                    schedule_config.get(line_name, {}), index, names)
+            for line_name in index.lines()
+        })
+
+    def line(self, line_name):
+        schedule = self._lines.get(line_name)
+        if schedule is None:
+            # 不存在的线路：没有任何班次
+            schedule = LineSchedule(line_name, {}, (), self._schedule_config.get(line_name, {}), None, self._names)
+        return schedule
+
+    def entries(self, line_name, schedule_index, direction, next_station):
+        return self.line(line_name).entries(schedule_index, direction, next_station, self._names.clean(next_station))
@@ -0,0 +1,214 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，共享状态不可用（单进程运行不受影响）
+    fcntl = None
+
+MAGIC = b'PISSTAT1'
+# 头部：魔数 | 序列号（写入期间为奇数） | 状态版本 | 状态 JSON 长度 | 记录创建时生成的随机纪元
+HEADER = struct.Struct('<8sQQII')
+HEADER_SIZE = 32
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+VERSION_OFFSET = 16
+DEFAULT_CAPACITY = 64 * 1024
+
+
+class SharedStateRecord:
+    """
+    一列车状态的共享内存记录（文件映射，多个工作进程映射同一文件）
+
+    布局为定长头部 + 状态 JSON。写入方持有锁（进程内线程锁 + 文件 flock），
+    先把序列号改为奇数，写入内容与新版本号后再改回偶数；读取方不加锁，
+    序列号为奇数或前后不一致时重试（seqlock）。
+    读取方通常只读头部的版本号，与本进程已解析的版本相同时不复制、不解析状态。
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = HEADER_SIZE + capacity
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        if self._mm[:8] != MAGIC:
+            with self.lock():
+                if self._mm[:8] != MAGIC:
+                    epoch = int.from_bytes(os.urandom(4), 'little') or 1
+                    HEADER.pack_into(self._mm, 0, MAGIC, 0, 0, 0, epoch)
+        # 记录文件被删除重建后版本号从头开始，纪元不同，可与旧版本号区分
+        self.epoch = HEADER.unpack_from(self._mm, 0)[4]
+
+    def acquire(self):
+        """获取写锁（同一线程可重入）"""
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._depth -= 1
+                self._thread_lock.release()
+                raise
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def lock(self):
+        return _RecordLock(self)
+
+    def version(self):
+        """当前版本号，0 表示尚未写入过状态"""
+        while True:
+            seq = SEQ.unpack_from(self._mm, SEQ_OFFSET)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            version = SEQ.unpack_from(self._mm, VERSION_OFFSET)[0]
+            if SEQ.unpack_from(self._mm, SEQ_OFFSET)[0] == seq:
+                return version
+
+    def read(self):
+        """(版本号, 状态字典)；尚未写入时为 (0, None)"""
+        while True:
+            _magic, seq, version, length, _epoch = HEADER.unpack_from(self._mm, 0)
+            if seq & 1:
+                time.sleep(0)
+                continue
+            payload = self._mm[HEADER_SIZE:HEADER_SIZE + length]
+            if SEQ.unpack_from(self._mm, SEQ_OFFSET)[0] != seq:
+                continue
+            if not version:
+                return 0, None
+            return version, json.loads(payload.decode('utf-8'))
+
+    def write(self, state):
+        """写入新状态并返回新版本号；调用方需持有写锁"""
+        payload = json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.capacity:
+            raise ValueError(f"状态超出共享记录容量（{len(payload)} > {self.capacity} 字节）")
+        _magic, seq, version, _length, epoch = HEADER.unpack_from(self._mm, 0)
+        SEQ.pack_into(self._mm, SEQ_OFFSET, seq + 1)
+        self._mm[HEADER_SIZE:HEADER_SIZE + len(payload)] = payload
+        HEADER.pack_into(self._mm, 0, MAGIC, seq + 1, version + 1, len(payload), epoch)
+        SEQ.pack_into(self._mm, SEQ_OFFSET, seq + 2)
+        return version + 1
+
+    def close(self):
+        try:
+            self._mm.close()
+        finally:
+            os.close(self._fd)
+
+
+class _RecordLock:
+    def __init__(self, record):
+        self.record = record
+
+    def __enter__(self):
+        self.record.acquire()
+        return self.record
+
+    def __exit__(self, *_exc):
+        self.record.release()
+
+
+class SharedStateStore:
+    """
+    按 (城市, 列车编号) 管理共享状态记录，记录文件位于 directory 下
+
+    文件描述符与 flock 不能跨 fork 共用：检测到进程号变化（工作进程由主进程 fork 而来）时重新打开。
+    """
+
+    def __init__(self, directory, capacity=DEFAULT_CAPACITY):
+        if fcntl is None:
+            raise RuntimeError('当前平台不支持共享状态（缺少 fcntl）')
+        self.directory = directory
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        self._records = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def record(self, city, session_id=None):
+        key = (city, session_id)
+        if self._pid == os.getpid():
+            record = self._records.get(key)
+            if record is not None:
+                return record
+        with self._lock:
+            if self._pid != os.getpid():
+                self._records = {}
+                self._pid = os.getpid()
+            record = self._records.get(key)
+            if record is None:
+                # 列车编号不含 @，默认会话的文件名为 <城市>@.state
+                path = os.path.join(self.directory, f"{city}@{session_id or ''}.state")
+                record = self._records[key] = SharedStateRecord(path, self.capacity)
+            return record
+
+
+class SharedStatePoller:
+    """
+    多进程模式下每个进程、每列车一个轮询线程：定期调用 poll() 检查共享记录的版本，
+    其他工作进程的修改由该线程发布给本进程的推送订阅者
+
+    SSE 连接线程因此只需阻塞在各自的队列上，轮询次数与连接的显示屏数量无关。
+    is_watched(key) 为假（已没有订阅者）时线程退出，之后再有订阅时重新启动。
+    """
+
+    def __init__(self, interval, is_watched):
+        self.interval = interval
+        self.is_watched = is_watched
+        self.polls = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 线程不随 fork 继承，锁可能正被父进程的轮询线程持有
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def watch(self, key, poll):
+        """确保 key 有轮询线程；调用方应先完成订阅，避免线程在订阅前判定无人订阅而退出"""
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._run, args=(key, poll), name=f'pis-shared-poll-{key}', daemon=True)
+            self._threads[key] = thread
+            thread.start()
+
+    def _run(self, key, poll):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.is_watched(key):
+                    if self._threads.get(key) is threading.current_thread():
+                        del self._threads[key]
+                    return
+            try:
+                poll()
+                self.polls += 1
+            except Exception as e:
+                print(f"轮询共享状态失败 {key}: {e}")
+
+    def active(self):
+        """正在运行的轮询线程数"""
+        with self._lock:
+            return sum(1 for thread in self._threads.values() if thread.is_alive())
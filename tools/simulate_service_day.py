@@ -0,0 +1,174 @@
+"""
+全天运营模拟：在本进程内按真实操作顺序回放一整天的运营，作为“按键 + 页面渲染”组合路径的吞吐基准。
+
+用法: python tools/simulate_service_day.py [--city chongqing] [--lines line_1,line_2] [--json report.json]
+
+依次遍历 route.json 中的每条线路，按 schedule.json 的 route_order（班次顺序）循环每个交路，
+两个运行方向各从首站走到末站：每一步通过 /api/state/* 接口操作，并渲染全部显示页面。
+输出总操作数、每秒操作数、各接口的延迟分位数与进程峰值内存（RSS）。
+模拟使用独立的列车会话，状态写入临时目录，不影响仓库中的状态文件。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TRAIN = 'simulator'
+PAGES = ['/', '/line_map', '/line_detail', '/arrival', '/schedule', '/api/schedule/data']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return values[index]
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），平台不支持时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Simulator:
+    """记录每个接口的耗时与失败次数"""
+
+    def __init__(self, app_module, city=None):
+        self.client = app_module.app.test_client()
+        self.headers = {'X-PIS-City': city} if city else {}
+        self.timings = {}
+        self.errors = {}
+
+    def request(self, method, path, payload=None):
+        start = time.perf_counter()
+        if method == 'POST':
+            response = self.client.post(f'{path}?train={TRAIN}', json=payload, headers=self.headers)
+        else:
+            response = self.client.get(f'{path}?train={TRAIN}', headers=self.headers)
+        elapsed = time.perf_counter() - start
+        key = f'{method} {path}'
+        self.timings.setdefault(key, []).append(elapsed)
+        if response.status_code != 200:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        return response
+
+    def render_pages(self):
+        for page in PAGES:
+            self.request('GET', page)
+
+    def run_service(self, line_name, route_name, stations):
+        """运行一个交路：两个方向各从首站到末站，每站渲染全部页面"""
+        self.request('POST', '/api/update_state', {
+            'line_name': line_name,
+            'route_name': route_name,
+            'direction': 0,
+            'next_station': stations[0]
+        })
+        for direction in (0, 1):
+            if direction == 1:
+                # 换向后回到反方向的首站
+                self.request('POST', '/api/state/reverse')
+            for _ in stations:
+                self.render_pages()
+                self.request('POST', '/api/state/next')
+            self.request('POST', '/api/state/schedule/next')
+
+
+def service_day_plan(app_module, network, lines=None):
+    """[(线路, 交路, 站序)]：每条线路按班次顺序各运行一轮"""
+    plan = []
+    with app_module._use_network(network):
+        index = app_module._get_network_index()
+        engine = app_module._get_schedule_engine()
+        for line_name in index.lines():
+            if lines and line_name not in lines:
+                continue
+            for route_name in engine.line(line_name).sequence:
+                stations = index.stations(line_name, route_name)
+                if stations:
+                    plan.append((line_name, route_name, stations))
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全天运营模拟（吞吐基准）')
+    parser.add_argument('--city', default=None, help='城市（默认使用 city_config.json）')
+    parser.add_argument('--lines', default='', help='逗号分隔的线路键，默认全部线路')
+    parser.add_argument('--json', default=None, help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    import app as app_module
+
+    states_dir = tempfile.mkdtemp(prefix='pis-simulate-states-')
+    app_module.STATES_DIR = states_dir
+    try:
+        network = app_module.city_registry.get(args.city) if args.city else app_module.city_registry.get_default()
+        lines = {x.strip() for x in args.lines.split(',') if x.strip()}
+        plan = service_day_plan(app_module, network, lines)
+        if not plan:
+            print('没有可模拟的线路')
+            return 1
+
+        simulator = Simulator(app_module, network.city)
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        for line_name, route_name, stations in plan:
+            simulator.run_service(line_name, route_name, stations)
+        elapsed = time.perf_counter() - start
+        app_module._state_persister.flush()
+
+        operations = sum(len(t) for t in simulator.timings.values())
+        errors = sum(simulator.errors.values())
+        rss = peak_rss_mb()
+        print(f"城市: {network.city}，线路: {len({p[0] for p in plan})}，交路: {len(plan)}，"
+              f"站点步数: {sum(len(p[2]) * 2 for p in plan)}")
+        print(f"操作: {operations}，用时 {elapsed:.2f}s，{operations / elapsed:.1f} ops/s，失败: {errors}")
+        if rss is not None:
+            print(f"峰值 RSS: {rss:.1f} MB（模拟前 {rss_before:.1f} MB）")
+
+        print(f"{'endpoint':<28} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'errors':>7}")
+        report = {}
+        for key in sorted(simulator.timings):
+            values = simulator.timings[key]
+            row = {
+                'count': len(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': max(values) * 1000,
+                'errors': simulator.errors.get(key, 0)
+            }
+            report[key] = row
+            print(f"{key:<28} {row['count']:>7} {row['p50_ms']:>7.2f}ms {row['p95_ms']:>7.2f}ms "
+                  f"{row['p99_ms']:>7.2f}ms {row['max_ms']:>7.2f}ms {row['errors']:>7}")
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'city': network.city,
+                    'operations': operations,
+                    'elapsed_s': elapsed,
+                    'ops_per_s': operations / elapsed,
+                    'errors': errors,
+                    'peak_rss_mb': rss,
+                    'endpoints': report
+                }, f, ensure_ascii=False, indent=2)
+        return 1 if errors else 0
+    finally:
+        shutil.rmtree(states_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
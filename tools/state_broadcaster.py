@@ -0,0 +1,127 @@
+import json
+import queue
+import threading
+
+
+class StateSubscription:
+    """
+    一个推送订阅者：事件放入有界队列，消费者阻塞等待（不轮询）
+
+    队列满（消费者过慢）时丢弃后续增量并标记 resync，消费者下次取事件时应重新发送完整状态。
+    """
+
+    def __init__(self, key, maxsize=64):
+        self.key = key
+        self.resync = False
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.resync = True
+
+    def get(self, timeout=None):
+        """阻塞等待下一个事件，超时返回 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+class StateBroadcaster:
+    """
+    状态变更广播
+
+    按键（如 (城市, 列车编号)）记录最近一次发布的状态快照；publish() 计算与快照相比变化的字段，
+    以 {'version': 版本, 'delta': {字段: 新值}} 推送给该键的所有订阅者。
+    """
+
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self.published = 0
+        self.delivered = 0
+        self._subscribers = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, state=None, version=None):
+        """订阅某个键；传入当前状态时作为增量计算的基准"""
+        subscription = StateSubscription(key, maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscription)
+            if state is not None and key not in self._snapshots:
+                self._snapshots[key] = (version, dict(state))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+                    self._snapshots.pop(subscription.key, None)
+
+    def publish(self, key, version, state, origin=None):
+        """
+        发布状态；没有订阅者或没有字段变化时不推送，返回推送的事件（或 None）
+
+        origin 为发起修改的客户端编号，随事件下发，发起方可据此忽略自己的修改
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if not subscribers:
+                return None
+            previous = self._snapshots.get(key, (None, {}))[1]
+            snapshot = dict(state)
+            delta = {k: v for k, v in snapshot.items() if previous.get(k) != v or k not in previous}
+            removed = [k for k in previous if k not in snapshot]
+            self._snapshots[key] = (version, snapshot)
+            if not delta and not removed:
+                return None
+            event = {'version': version, 'delta': delta}
+            if removed:
+                event['removed'] = removed
+            if origin:
+                event['origin'] = origin
+            targets = list(subscribers)
+            self.published += 1
+            self.delivered += len(targets)
+        for subscription in targets:
+            subscription.put(event)
+        return event
+
+    def subscriber_count(self, key=None):
+        with self._lock:
+            if key is not None:
+                return len(self._subscribers.get(key, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': sum(len(s) for s in self._subscribers.values()),
+                'keys': len(self._subscribers),
+                'published': self.published,
+                'delivered': self.delivered
+            }
+
+
+def format_sse(data, event=None, event_id=None):
+    """按 text/event-stream 格式编码一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    lines.append(f"data: {payload}")
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def write_json_atomic(path, data, indent=4):
+    """先写入同目录临时文件并 fsync，再 rename 覆盖目标文件，断电时不会留下半截文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class StatePersister:
+    """
+    状态文件写回器（write-behind）
+
+    save() 只登记待写入的状态并立即返回；后台线程在第一次登记后等待 interval 秒，
+    将这段时间内的多次修改合并为每个文件一次原子写入。进程退出前调用 flush() 写出剩余修改。
+    interval 为 0 时 save() 同步写入。
+    """
+
+    def __init__(self, interval=0.5, on_write=None):
+        """
+        Args:
+            interval: 合并写入的时间窗口（秒）
+            on_write: 每次写入完成后的回调 on_write(path, owner)，owner 为 save() 登记时传入的对象
+        """
+        self.interval = interval
+        self.on_write = on_write
+        self.writes = 0
+        self.write_seconds = 0.0
+        self.coalesced = 0
+        self._pending = {}
+        self._in_flight = set()
+        self._first_pending = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 子进程（如多进程服务器的工作进程）不继承后台线程，fork 时锁可能正被该线程持有，需重建
+        self._cond = threading.Condition()
+        self._thread = None
+        self._in_flight = set()
+
+    def save(self, path, state, owner=None):
+        """
+        登记 path 的最新状态；同一文件在写出前的多次登记只写最后一次
+
+        owner 原样传给 on_write 回调（如状态所属的会话），回调无需按路径反查
+        """
+        if not self.interval or self.interval <= 0:
+            self._write(path, state, owner)
+            return
+        with self._cond:
+            if path in self._pending:
+                self.coalesced += 1
+            self._pending[path] = (state, owner)
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            self._ensure_thread()
+            self._cond.notify()
+
+    def is_pending(self, path):
+        """path 是否有尚未写出（或正在写出）的修改（此时磁盘上的文件比内存旧）"""
+        with self._cond:
+            return path in self._pending or path in self._in_flight
+
+    def flush(self):
+        """立即写出所有待写入的状态"""
+        with self._cond:
+            pending = self._pending
+            self._pending = {}
+            self._first_pending = None
+            self._in_flight.update(pending)
+        for path, (state, owner) in pending.items():
+            try:
+                self._write(path, state, owner)
+            finally:
+                with self._cond:
+                    self._in_flight.discard(path)
+
+    def stop(self):
+        """停止后台线程并写出剩余修改"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.interval * 4, 1))
+            self._thread = None
+        self.flush()
+
+    def _write(self, path, state, owner=None):
+        start = time.perf_counter()
+        try:
+            # 浅拷贝快照，避免序列化过程中请求线程修改同一字典
+            write_json_atomic(path, dict(state))
+            self.writes += 1
+            self.write_seconds += time.perf_counter() - start
+        except Exception as e:
+            print(f"保存状态文件失败: {e}")
+            return
+        if self.on_write is not None:
+            self.on_write(path, owner)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='state-persister', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                remaining = self._first_pending + self.interval - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            self.flush()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'interval': self.interval,
+                'writes': self.writes,
+                'coalesced': self.coalesced,
+                'pending': len(self._pending)
+            }
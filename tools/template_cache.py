@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+from state_persister import write_json_atomic
+
+COMPILE_TIMES_FILE = 'compile_times.json'
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    Jinja 模板字节码的磁盘缓存，重启后直接加载编译结果
+
+    模板源码变化（校验和不同）或 Python 版本变化时 Jinja 自动重新编译并覆盖缓存。
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(directory, pattern='__pis_jinja_%s.cache')
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+def precompile_templates(env, bytecode_cache=None, names=None):
+    """
+    预先加载（编译）模板，返回 [(模板名, 加载耗时秒, 是否命中字节码缓存, 从源码编译的耗时秒或 None)]
+
+    未命中缓存时的加载耗时即编译耗时，记录在缓存目录中，供之后命中时估算节省的时间。
+    """
+    if names is None:
+        names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    times_path = os.path.join(bytecode_cache.directory, COMPILE_TIMES_FILE) if bytecode_cache is not None else None
+    compile_times = {}
+    if times_path and os.path.exists(times_path):
+        try:
+            with open(times_path, 'r', encoding='utf-8') as f:
+                compile_times = json.load(f)
+        except Exception:
+            compile_times = {}
+
+    report = []
+    changed = False
+    for name in names:
+        hits = bytecode_cache.hits if bytecode_cache is not None else 0
+        start = time.perf_counter()
+        try:
+            env.get_template(name)
+        except Exception as e:
+            print(f"预编译模板失败 {name}: {e}")
+            continue
+        elapsed = time.perf_counter() - start
+        hit = bytecode_cache is not None and bytecode_cache.hits > hits
+        if not hit:
+            compile_times[name] = elapsed
+            changed = True
+        report.append((name, elapsed, hit, compile_times.get(name)))
+
+    if times_path and changed:
+        try:
+            write_json_atomic(times_path, compile_times, indent=2)
+        except Exception as e:
+            print(f"保存模板编译耗时失败: {e}")
+    return report
+
+
+def format_precompile_report(report):
+    """启动报告：总耗时、缓存命中数与估算节省的编译时间"""
+    total = sum(r[1] for r in report)
+    hits = [r for r in report if r[2]]
+    saved = sum(max(r[3] - r[1], 0) for r in hits if r[3] is not None)
+    lines = [f"模板预编译: {len(report)} 个，用时 {total * 1000:.1f}ms，字节码缓存命中 {len(hits)}/{len(report)}"
+             + (f"，节省约 {saved * 1000:.1f}ms 编译时间" if hits else '')]
+    for name, elapsed, hit, compiled in sorted(report, key=lambda r: -(r[3] or r[1])):
+        if hit and compiled is not None:
+            lines.append(f"  {name:<20} {elapsed * 1000:7.1f}ms（缓存，编译约 {compiled * 1000:.1f}ms）")
+        else:
+            lines.append(f"  {name:<20} {elapsed * 1000:7.1f}ms（{'缓存' if hit else '编译'}）")
+    return '\n'.join(lines)